@@ -39,9 +39,78 @@ LINT_TIMEOUT: int = int(os.getenv("LINT_TIMEOUT", "60"))
 INSTALL_TIMEOUT: int = int(os.getenv("INSTALL_TIMEOUT", "180"))
 CLONE_TIMEOUT: int = int(os.getenv("CLONE_TIMEOUT", "60"))
 
+# Wall-clock budget for a whole run — every step's timeout is clamped to
+# what is left of it (agent/nodes/deadline.py)
+RUN_TIMEOUT: int = int(os.getenv("RUN_TIMEOUT", "900"))
+
+# Combined deadline for test_runner's concurrent lint + test step
+STEP_DEADLINE: int = int(os.getenv("STEP_DEADLINE", "150"))
+
+# Test impact analysis — after a fix, ci_monitor runs the tests affected by it
+# (via the import graph) before the full suite, and a failure there decides the
+# iteration; every Nth iteration runs the full suite regardless
+TEST_IMPACT_ENABLED: bool = os.getenv("TEST_IMPACT_ENABLED", "true").lower() == "true"
+TEST_IMPACT_FULL_EVERY: int = int(os.getenv("TEST_IMPACT_FULL_EVERY", "3"))
+
+# Test runs collect every failure by default so one iteration can fix them all.
+# TEST_FAIL_FAST=true restores stop-at-first-failure (-x / --bail). A run that
+# overruns TEST_TIMEOUT is interrupted and gets TEST_INTERRUPT_GRACE seconds
+# to report the failures found so far.
+TEST_FAIL_FAST: bool = os.getenv("TEST_FAIL_FAST", "false").lower() == "true"
+TEST_INTERRUPT_GRACE: int = int(os.getenv("TEST_INTERRUPT_GRACE", "10"))
+
+# Bytes of each command's stdout/stderr kept in memory (the tail is kept)
+OUTPUT_TAIL_BYTES: int = int(os.getenv("OUTPUT_TAIL_BYTES", str(4 * 1024 * 1024)))
+
+# Per-command resource limits for every tool the agent spawns (0 = inherit).
+# CPU seconds per process, address space in MB, open file descriptors.
+# JVMs and node reserve far more address space than they use — size
+# CMD_MEMORY_LIMIT_MB generously for Maven / npm repos.
+CMD_CPU_LIMIT: int = int(os.getenv("CMD_CPU_LIMIT", "0"))
+CMD_MEMORY_LIMIT_MB: int = int(os.getenv("CMD_MEMORY_LIMIT_MB", "0"))
+CMD_MAX_OPEN_FILES: int = int(os.getenv("CMD_MAX_OPEN_FILES", "0"))
+
+# Parallel test sharding for pytest (no pytest-xdist required in the target repo)
+# 0 = one shard per CPU core (max 4), 1 = disabled. Overridable per run.
+TEST_SHARDS: int = int(os.getenv("TEST_SHARDS", "0"))
+
+# Warm pytest worker (POSIX): imports pytest, its plugins and the repo's
+# third-party dependencies once per workspace, then forks per test run
+WARM_RUNNER: bool = os.getenv("WARM_RUNNER", "false").lower() == "true"
+WARM_RUNNER_START_TIMEOUT: int = int(os.getenv("WARM_RUNNER_START_TIMEOUT", "60"))
+
+# Early stop: a fix iteration whose code and failures repeat an earlier one
+# ends the run, as does a failure count that has not improved for
+# CONVERGENCE_PATIENCE iterations (0 = always use every iteration)
+CONVERGENCE_PATIENCE: int = int(os.getenv("CONVERGENCE_PATIENCE", "2"))
+
 # Speed bonus threshold (seconds) — PS: +10 if < 5 minutes
 SPEED_BONUS_THRESHOLD: int = 300
 
+# Optional work (full re-lint, full-suite safety runs) is skipped in the last
+# SPEED_WINDOW_MARGIN seconds of the speed bonus window
+SPEED_WINDOW_MARGIN: int = int(os.getenv("SPEED_WINDOW_MARGIN", "45"))
+
+
+# ---------------------------------------------------------------------------
+# Dependency caches (per-run virtualenvs built from a shared cache)
+# ---------------------------------------------------------------------------
+DEP_CACHE_DIR: str = os.getenv(
+    "DEP_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "ai-devops-agent"),
+)
+ENV_CACHE_MAX_MB: int = int(os.getenv("ENV_CACHE_MAX_MB", "4096"))
+WHEELHOUSE_MAX_MB: int = int(os.getenv("WHEELHOUSE_MAX_MB", "2048"))
+# Unpinned requirements are installed offline from the wheelhouse only within
+# this many seconds of the same set being resolved against the index
+WHEELHOUSE_RESOLUTION_TTL: int = int(os.getenv("WHEELHOUSE_RESOLUTION_TTL", "86400"))
+NODE_CACHE_MAX_MB: int = int(os.getenv("NODE_CACHE_MAX_MB", "4096"))
+
+# Fixes that worked before, replayed when the same failure appears in the
+# same surrounding code (DEP_CACHE_DIR/fix_knowledge.sqlite3)
+FIX_KNOWLEDGE: bool = os.getenv("FIX_KNOWLEDGE", "true").lower() == "true"
+FIX_KNOWLEDGE_MAX_ENTRIES: int = int(os.getenv("FIX_KNOWLEDGE_MAX_ENTRIES", "20000"))
+
 
 # ---------------------------------------------------------------------------
 # Sandboxing (Docker)
@@ -50,6 +119,19 @@ DOCKER_ENABLED: bool = os.getenv("DOCKER_ENABLED", "false").lower() == "true"
 DOCKER_IMAGE: str = os.getenv("DOCKER_IMAGE", "python:3.11-slim")
 DOCKER_MEMORY_LIMIT: str = os.getenv("DOCKER_MEMORY_LIMIT", "512m")
 DOCKER_CPU_LIMIT: str = os.getenv("DOCKER_CPU_LIMIT", "1")
+# Network for the run's lint/test commands. With "none" the container starts
+# on DOCKER_INSTALL_NETWORK for dependency installs and is disconnected after.
+DOCKER_NETWORK: str = os.getenv("DOCKER_NETWORK", "none")
+DOCKER_INSTALL_NETWORK: str = os.getenv("DOCKER_INSTALL_NETWORK", "bridge")
+
+# One sandbox session per run: "docker" (long-lived container + exec),
+# "local" (host processes under rlimits) or "none". Docker falls back to local.
+SANDBOX_BACKEND: str = os.getenv("SANDBOX_BACKEND", "docker" if DOCKER_ENABLED else "none").lower()
+# Containers kept started and waiting for the next run
+SANDBOX_POOL_SIZE: int = int(os.getenv("SANDBOX_POOL_SIZE", "1"))
+# Data segment (heap) limit in MB for the local backend's commands (0 = none).
+# A heap cap rather than an address-space cap, which node/JVM/numpy outgrow.
+LOCAL_SANDBOX_MEMORY_MB: int = int(os.getenv("LOCAL_SANDBOX_MEMORY_MB", "0"))
 
 
 # ---------------------------------------------------------------------------
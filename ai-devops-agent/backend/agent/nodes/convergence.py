@@ -0,0 +1,161 @@
+import ast
+import hashlib
+import os
+import re
+from agent.config import CONVERGENCE_PATIENCE
+from agent.state import AgentState, AssertMismatch, Failure, IterationProgress
+from agent.nodes.output_parser import parsed_output
+
+
+# Varying parts of a message that do not change what the failure is
+_NUMBER_RE = re.compile(r"\d+")
+_SPACE_RE = re.compile(r"\s+")
+_CODE_RE = re.compile(r"^([A-Z]+\d+|[A-Z_]+|[\w@/-]+)\s+")
+
+
+def record_progress(state: AgentState) -> IterationProgress:
+    """
+    Fingerprints the freshly classified failures (and the run's assert
+    mismatches) and appends this iteration's entry to state.progress:
+    how many failures, which are new, which were resolved.
+    """
+    fingerprints = fingerprint_failures(state)
+    previous = set(state.progress[-1].fingerprints) if state.progress else set()
+    current = set(fingerprints)
+    tree = state.test_memo.tree if state.test_memo else ""
+    entry = IterationProgress(
+        iteration=state.iteration,
+        state_key=hashlib.sha256((tree + "\0" + "\0".join(sorted(current))).encode()).hexdigest()[:16],
+        fingerprints=sorted(current),
+        failures=len(current),
+        new=len(current - previous) if state.progress else len(current),
+        resolved=len(previous - current),
+    )
+    state.progress.append(entry)
+    print(f"[AI-AGENT] Progress: {entry.failures} failure(s), {entry.new} new, {entry.resolved} resolved")
+    return entry
+
+
+def stop_reason(state: AgentState) -> str | None:
+    """
+    Why another fix iteration is pointless, or None to keep going:
+    - the workspace and its failures match an earlier iteration (the fixes
+      changed nothing, or undid each other), or
+    - the failure count has not beaten its best for CONVERGENCE_PATIENCE
+      iterations in a row.
+    """
+    if CONVERGENCE_PATIENCE <= 0 or len(state.progress) < 2:
+        return None
+    latest = state.progress[-1]
+    for earlier in state.progress[:-1]:
+        if earlier.state_key == latest.state_key:
+            if earlier is state.progress[-2]:
+                return f"no progress: iteration {latest.iteration} has the same code and failures as the last"
+            return f"oscillating: iteration {latest.iteration} returned to the state of iteration {earlier.iteration}"
+
+    best_at = min(range(len(state.progress)), key=lambda i: (state.progress[i].failures, i))
+    stalled = len(state.progress) - 1 - best_at
+    if stalled >= CONVERGENCE_PATIENCE:
+        return (f"stalled: failures have not dropped below {state.progress[best_at].failures} "
+                f"for {stalled} iteration(s)")
+    return None
+
+
+def fingerprint_failures(state: AgentState) -> list[str]:
+    """
+    Stable identity per failure — tool, code, normalized message and a
+    location relative to the enclosing function/class, so a failure keeps
+    its fingerprint when edits elsewhere shift its line. Sets
+    Failure.fingerprint; assert mismatches are fingerprinted by the call.
+    """
+    trees: dict[str, ast.AST | None] = {}
+    sources: dict[str, list[str]] = {}
+    fingerprints = []
+    for failure in state.failures:
+        if failure.file not in trees:
+            trees[failure.file], sources[failure.file] = _parse(state.repo_path, failure.file)
+        location = _location(failure, trees[failure.file], sources[failure.file])
+        failure.fingerprint = _digest(_tool(failure), *_code_and_message(failure.description), location)
+        fingerprints.append(failure.fingerprint)
+
+    for mismatch in parsed_output(state).assert_mismatches:
+        fingerprints.append(mismatch_fingerprint(mismatch))
+    return fingerprints
+
+
+def mismatch_fingerprint(mismatch: AssertMismatch) -> str:
+    return _digest("pytest", "ASSERT", _normalize(f"{mismatch.args} == {mismatch.expected}"), mismatch.function)
+
+
+def failure_signature(failure: Failure) -> str:
+    """Like the fingerprint but without the location — the same kind of failure in any file or repo."""
+    return _digest(_tool(failure), failure.bug_type, *_code_and_message(failure.description))
+
+
+# ---------------------------------------------------------------------------
+# Internal helpers
+# ---------------------------------------------------------------------------
+
+def _tool(failure: Failure) -> str:
+    if failure.bug_type == "LOGIC":
+        return "pytest"
+    if failure.bug_type == "TYPE_ERROR":
+        return "mypy"
+    return "lint"
+
+
+def _code_and_message(description: str) -> tuple[str, str]:
+    m = _CODE_RE.match(description.strip())
+    if not m:
+        return "", _normalize(description)
+    return m.group(1), _normalize(description.strip()[m.end():])
+
+
+def _normalize(message: str) -> str:
+    return _SPACE_RE.sub(" ", _NUMBER_RE.sub("#", message)).strip()
+
+
+def _location(failure: Failure, tree: ast.AST | None, lines: list[str]) -> str:
+    """`file::Qual.name+offset` inside a def/class, else `file::` + the line's text."""
+    symbol = _enclosing_symbol(tree, failure.line) if tree is not None else None
+    if symbol:
+        name, start = symbol
+        return f"{failure.file}::{name}+{failure.line - start}"
+    text = lines[failure.line - 1].strip() if 0 < failure.line <= len(lines) else ""
+    return f"{failure.file}::{text}"
+
+
+def _enclosing_symbol(tree: ast.AST, line: int) -> tuple[str, int] | None:
+    """Qualified name and first line of the innermost def/class spanning line."""
+    found = None
+    scope: list[str] = []
+    nodes = list(ast.iter_child_nodes(tree))
+    while nodes:
+        node = nodes.pop()
+        if not isinstance(node, ast.stmt) or not node.lineno <= line <= (node.end_lineno or node.lineno):
+            continue
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            scope.append(node.name)
+            found = (".".join(scope), node.lineno)
+        # Defs nest inside if/try/with blocks too
+        nodes = list(ast.iter_child_nodes(node))
+    return found
+
+
+def _parse(repo_path: str | None, rel: str) -> tuple[ast.AST | None, list[str]]:
+    try:
+        with open(os.path.join(repo_path or "", rel), "r", errors="replace") as f:
+            source = f.read()
+    except OSError:
+        return None, []
+    lines = source.splitlines()
+    if not rel.endswith(".py"):
+        return None, lines
+    try:
+        return ast.parse(source, filename=rel), lines
+    except (SyntaxError, ValueError):
+        return None, lines
+
+
+def _digest(*parts: str) -> str:
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()[:16]
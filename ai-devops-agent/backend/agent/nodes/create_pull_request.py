@@ -4,6 +4,7 @@ import requests
 import re
 import os
 from agent.state import AgentState
+from agent.nodes.deadline import clamp_timeout
 
 
 def create_pull_request(state: AgentState) -> AgentState:
@@ -28,7 +29,7 @@ def create_pull_request(state: AgentState) -> AgentState:
         # Auto-detect default branch — never hardcode "main"
         repo_info = requests.get(
             f"https://api.github.com/repos/{owner}/{repo}",
-            headers=headers, timeout=10,
+            headers=headers, timeout=clamp_timeout(10),
         )
         default_branch = "main"  # fallback
         if repo_info.ok:
@@ -40,7 +41,7 @@ def create_pull_request(state: AgentState) -> AgentState:
             f"https://api.github.com/repos/{owner}/{repo}/pulls",
             headers=headers,
             params={"head": f"{owner}:{state.branch_name}", "state": "open"},
-            timeout=10,
+            timeout=clamp_timeout(10),
         )
         if existing.ok and existing.json():
             pr_url = existing.json()[0]["html_url"]
@@ -73,7 +74,7 @@ def create_pull_request(state: AgentState) -> AgentState:
                 "head": state.branch_name,
                 "base": default_branch,   # ← auto-detected, not hardcoded
             },
-            timeout=15,
+            timeout=clamp_timeout(15),
         )
 
         if response.status_code == 201:
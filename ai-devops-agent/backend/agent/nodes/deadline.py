@@ -0,0 +1,100 @@
+import time
+from contextvars import ContextVar, Token
+from datetime import datetime, timezone
+from typing import Callable
+from agent.config import SPEED_BONUS_THRESHOLD, SPEED_WINDOW_MARGIN
+from agent.state import AgentState
+
+
+# Shortest timeout handed to a command while any budget remains
+_MIN_STEP_SECONDS = 1
+
+# Optional steps that may be skipped to keep the run inside the speed bonus window
+SPEED_SENSITIVE_STEPS = {"full_relint", "full_suite_safety_run"}
+
+# Optional steps are skipped when less than this much of the run budget remains
+_OPTIONAL_STEP_RESERVE = 30
+
+
+class Deadline:
+    """
+    Wall-clock budget for one run. Every subprocess and HTTP call takes
+    min(its own limit, time remaining) via clamp().
+    expires_at is epoch seconds (AgentState.deadline_at); None = unbounded.
+    """
+
+    def __init__(self, expires_at: float | None = None):
+        self.expires_at = expires_at
+
+    def remaining(self) -> float:
+        if self.expires_at is None:
+            return float("inf")
+        return max(0.0, self.expires_at - time.time())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def clamp(self, limit: float) -> int:
+        return int(max(_MIN_STEP_SECONDS, min(limit, self.remaining())))
+
+
+# The deadline of the node currently executing — set by the orchestrator
+_CURRENT: ContextVar[Deadline] = ContextVar("run_deadline", default=Deadline())
+
+
+def current_deadline() -> Deadline:
+    return _CURRENT.get()
+
+
+def set_deadline(deadline: Deadline) -> Token:
+    return _CURRENT.set(deadline)
+
+
+def reset_deadline(token: Token) -> None:
+    _CURRENT.reset(token)
+
+
+def clamp_timeout(limit: float) -> int:
+    """A step's own limit, cut down to what is left of the run budget."""
+    return current_deadline().clamp(limit)
+
+
+# ---------------------------------------------------------------------------
+# Step policy hook — decides whether optional work still fits
+# ---------------------------------------------------------------------------
+
+StepPolicy = Callable[[AgentState, str], bool]
+
+_STEP_POLICIES: list[StepPolicy] = []
+
+
+def register_step_policy(policy: StepPolicy) -> None:
+    """Adds a policy; a step runs only if every policy allows it."""
+    _STEP_POLICIES.append(policy)
+
+
+def allow_step(state: AgentState, step: str) -> bool:
+    for policy in _STEP_POLICIES:
+        if not policy(state, step):
+            print(f"[AI-AGENT] Policy: skipping {step}")
+            return False
+    return True
+
+
+def _speed_window_policy(state: AgentState, step: str) -> bool:
+    """Skip speed-sensitive work in the last seconds of the speed bonus window."""
+    if step not in SPEED_SENSITIVE_STEPS or not state.start_time:
+        return True
+    start = datetime.fromisoformat(state.start_time.replace("Z", "+00:00"))
+    left = SPEED_BONUS_THRESHOLD - (datetime.now(timezone.utc) - start).total_seconds()
+    # Once the window has closed the bonus is gone — nothing left to protect
+    return not (0 < left < SPEED_WINDOW_MARGIN)
+
+
+def _run_budget_policy(state: AgentState, step: str) -> bool:
+    """Skip any optional step once the run budget is nearly spent."""
+    return current_deadline().remaining() >= _OPTIONAL_STEP_RESERVE
+
+
+register_step_policy(_speed_window_policy)
+register_step_policy(_run_budget_policy)
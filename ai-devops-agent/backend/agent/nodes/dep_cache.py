@@ -0,0 +1,434 @@
+import atexit
+import hashlib
+import importlib.metadata
+import os
+import shlex
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from agent.config import DEP_CACHE_DIR, ENV_CACHE_MAX_MB, NODE_CACHE_MAX_MB, INSTALL_TIMEOUT, RUN_TIMEOUT
+from agent.nodes.utils import run
+from agent.nodes.wheelhouse import pip_install
+
+try:
+    import fcntl
+except ImportError:   # Windows — concurrent builds of one key are not serialised
+    fcntl = None
+
+
+# Files whose content decides which packages end up in the environment
+PYTHON_DEP_FILES = (
+    "requirements.txt", "pyproject.toml", "setup.py", "setup.cfg",
+    "poetry.lock", "Pipfile.lock", "uv.lock",
+)
+
+# Tools the agent itself needs inside every Python environment
+PYTHON_AGENT_TOOLS = ("flake8", "pytest")
+
+NPM_FLAGS = "--silent --no-audit --no-fund"
+
+# Marker written last — an env directory without it is an aborted build
+_COMPLETE_MARKER = ".agent_env_complete"
+
+# Per-run envs live in DEP_CACHE_DIR/<_RUN_DIR>, on the cache's filesystem
+_RUN_DIR = "run"
+
+# In a per-run env's site-packages: puts the cached env's site-packages
+# (and its own .pth files) on sys.path, after the run's own packages
+_LAYER_PTH = "_agent_cached_env.pth"
+
+# Where a per-run env keeps a failed build it was layered over
+_ADOPTED_BASE = ".base"
+
+# Console-script launcher, as pip writes it
+_SCRIPT = """#!{python}
+import re
+import sys
+from {module} import {head}
+if __name__ == "__main__":
+    sys.argv[0] = re.sub(r"(-script\\.pyw|\\.exe)?$", "", sys.argv[0])
+    sys.exit({attr}())
+"""
+
+
+# ---------------------------------------------------------------------------
+# Python virtualenv cache
+# ---------------------------------------------------------------------------
+
+def prepare_python_env(repo_path: str) -> str | None:
+    """
+    Returns the path of an isolated, per-run virtualenv with the repo's
+    dependencies and the agent's tools installed.
+
+    Environments are cached under DEP_CACHE_DIR/venvs, keyed by a hash of the
+    repo's dependency files and the interpreter version, and built in place
+    so their scripts stay valid. Each run gets a fresh venv layered over the
+    cached site-packages: whatever the run installs lands in its own env and
+    the cache is never written to. Returns None if no environment could be
+    created, in which case callers fall back to the server's own interpreter.
+    """
+    key = python_env_key(repo_path)
+    cache_root = os.path.join(DEP_CACHE_DIR, "venvs")
+    cached_env = os.path.join(cache_root, key)
+
+    try:
+        os.makedirs(cache_root, exist_ok=True)
+    except OSError as e:
+        print(f"[AI-AGENT] WARNING: Cannot create env cache dir {cache_root}: {e}")
+        return None
+
+    with _key_lock(cache_root, key):
+        if _is_complete(cached_env):
+            print(f"[AI-AGENT] Python env cache HIT ({key[:12]})")
+        else:
+            print(f"[AI-AGENT] Python env cache MISS ({key[:12]}) — building")
+            built = _build_python_env(repo_path, cached_env)
+            if built is None:
+                return None
+            if not built:
+                # Install failed — usable for this run, but must not be cached
+                return _layered_env(cached_env, adopt=True)
+            _prune_lru(cache_root, ENV_CACHE_MAX_MB * 1024 * 1024)
+        _touch(cached_env)
+
+    run_env = _layered_env(cached_env)
+    if run_env is None:
+        return None
+
+    # Editable installs point at this run's clone — never served from cache
+    if not os.path.exists(os.path.join(repo_path, "requirements.txt")) and \
+            os.path.exists(os.path.join(repo_path, "pyproject.toml")):
+        run(
+            f"{shlex.quote(env_python(run_env))} -m pip install -q --no-deps -e .",
+            cwd=repo_path, timeout=INSTALL_TIMEOUT, safe=False,
+        )
+
+    return run_env
+
+
+def python_env_key(repo_path: str) -> str:
+    """Content hash of the repo's dependency files + interpreter identity."""
+    h = hashlib.sha256()
+    h.update(sys.version.encode())
+    h.update(sys.platform.encode())
+    h.update(",".join(PYTHON_AGENT_TOOLS).encode())
+    for name in PYTHON_DEP_FILES:
+        path = os.path.join(repo_path, name)
+        if not os.path.isfile(path):
+            continue
+        h.update(b"\0" + name.encode() + b"\0")
+        with open(path, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def env_python(env_dir: str) -> str:
+    """Path of the interpreter inside a virtualenv."""
+    if os.name == "nt":
+        return os.path.join(env_dir, "Scripts", "python.exe")
+    return os.path.join(env_dir, "bin", "python")
+
+
+def python_env_vars(env_dir: str | None) -> dict | None:
+    """
+    Environment overrides that activate env_dir for a subprocess, so plain
+    `python -m pytest` resolves to the per-run interpreter. None → no override.
+    """
+    if not env_dir:
+        return None
+    bin_dir = os.path.dirname(env_python(env_dir))
+    return {
+        "VIRTUAL_ENV": env_dir,
+        "PATH": bin_dir + os.pathsep + os.environ.get("PATH", ""),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Build
+# ---------------------------------------------------------------------------
+
+def _build_python_env(repo_path: str, env_dir: str) -> bool | None:
+    """
+    Builds the virtualenv at its cache path (caller holds the key's lock).
+    True once it is complete and published, False if the dependency install
+    failed (left in place, unpublished), None if venv creation failed.
+    """
+    _remove_tree(env_dir)   # What an aborted build left behind
+    code, _, err = run(
+        f"{shlex.quote(sys.executable)} -m venv {shlex.quote(env_dir)}",
+        timeout=INSTALL_TIMEOUT, safe=False,
+    )
+    if code != 0:
+        print(f"[AI-AGENT] WARNING: venv creation failed — {err.strip()[:300]}")
+        _remove_tree(env_dir)
+        return None
+
+    python = env_python(env_dir)
+    requirements_txt = os.path.join(repo_path, "requirements.txt")
+    pyproject = os.path.join(repo_path, "pyproject.toml")
+
+    # All installs resolve through the shared wheelhouse (offline when possible)
+    ok = True
+    if os.path.exists(requirements_txt):
+        print("[AI-AGENT] Installing Python dependencies from requirements.txt...")
+        ok = pip_install(python, "-r requirements.txt", cwd=repo_path) and ok
+    elif os.path.exists(pyproject):
+        print("[AI-AGENT] Installing Python dependencies from pyproject.toml...")
+        ok = pip_install(python, "-e .", cwd=repo_path) and ok
+
+    ok = pip_install(python, " ".join(PYTHON_AGENT_TOOLS), cwd=repo_path) and ok
+    if ok:
+        _write_marker(env_dir)
+    return ok
+
+
+def _layered_env(base_env: str, adopt: bool = False) -> str | None:
+    """
+    A fresh per-run venv whose site-packages layers base_env's under its
+    own, with launchers for base_env's console scripts. With adopt, base_env
+    (an unpublished build) is moved inside the per-run env and goes with it.
+    Removed at finalize (or process exit).
+    """
+    try:
+        run_env = _run_dir("cicd_env_")
+    except OSError as e:
+        print(f"[AI-AGENT] WARNING: Could not create a run dir for {base_env}: {e}")
+        if adopt:
+            _remove_tree(base_env)
+        return None
+    started = time.monotonic()
+    try:
+        if adopt:
+            adopted = os.path.join(run_env, _ADOPTED_BASE)
+            os.replace(base_env, adopted)
+            base_env = adopted
+        code, _, err = run(
+            f"{shlex.quote(sys.executable)} -m venv --without-pip {shlex.quote(run_env)}",
+            timeout=INSTALL_TIMEOUT, safe=False,
+        )
+        if code != 0:
+            raise OSError(f"venv creation failed — {err.strip()[:300]}")
+        base_site = _site_packages(base_env)
+        with open(os.path.join(_site_packages(run_env), _LAYER_PTH), "w") as f:
+            f.write(f"import site; site.addsitedir({base_site!r})\n")
+        _write_console_scripts(run_env, base_site)
+    except OSError as e:
+        print(f"[AI-AGENT] WARNING: Could not create a per-run env over {base_env}: {e}")
+        _remove_tree(run_env)
+        if adopt and os.path.exists(base_env):
+            _remove_tree(base_env)
+        return None
+    atexit.register(_remove_tree, run_env)
+    print(f"[AI-AGENT] Per-run env ready in {time.monotonic() - started:.2f}s → {run_env}")
+    return run_env
+
+
+def _write_console_scripts(env_dir: str, site_packages: str) -> None:
+    """
+    Launchers in env_dir for every console script installed in site_packages,
+    pointing at env_dir's interpreter. Not on Windows, where pip's launchers
+    are executables — `python -m <tool>` works there regardless.
+    """
+    if os.name == "nt":
+        return
+    python = env_python(env_dir)
+    bin_dir = os.path.dirname(python)
+    for dist in importlib.metadata.distributions(path=[site_packages]):
+        for entry in dist.entry_points.select(group="console_scripts"):
+            script = os.path.join(bin_dir, entry.name)
+            if os.path.exists(script) or not entry.attr:
+                continue
+            with open(script, "w") as f:
+                f.write(_SCRIPT.format(
+                    python=python, module=entry.module, head=entry.attr.split(".")[0], attr=entry.attr,
+                ))
+            os.chmod(script, 0o755)
+
+
+def _site_packages(env_dir: str) -> str:
+    if os.name == "nt":
+        return os.path.join(env_dir, "Lib", "site-packages")
+    return os.path.join(env_dir, "lib", f"python{sys.version_info[0]}.{sys.version_info[1]}", "site-packages")
+
+
+@contextmanager
+def _key_lock(cache_root: str, key: str):
+    """Serialises building a cache key across threads and processes."""
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(cache_root, f".{key}.lock"), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# ---------------------------------------------------------------------------
+# node_modules cache
+# ---------------------------------------------------------------------------
+
+def prepare_node_modules(repo_path: str) -> bool:
+    """
+    Populates repo_path/node_modules, reusing a cached tree when possible.
+
+    Trees are cached under DEP_CACHE_DIR/node_modules keyed by a hash of
+    package-lock.json and the Node version; a hit is copied into the
+    workspace (reflinked where the filesystem can) and `npm ci` is skipped
+    entirely. Workspace and cache never share files, so nothing a run writes
+    under node_modules reaches other runs. Misses (and repos without a
+    lockfile) install with a shared npm download cache.
+    Returns True if node_modules is in place.
+    """
+    npm_cache = shlex.quote(os.path.join(DEP_CACHE_DIR, "npm"))
+    package_lock = os.path.join(repo_path, "package-lock.json")
+
+    if not os.path.exists(package_lock):
+        code, _, _ = run(f"npm install {NPM_FLAGS} --cache {npm_cache}",
+                         cwd=repo_path, timeout=INSTALL_TIMEOUT)
+        return code == 0
+
+    key = node_modules_key(repo_path)
+    cache_root = os.path.join(DEP_CACHE_DIR, "node_modules")
+    cached = os.path.join(cache_root, key)
+    target = os.path.join(repo_path, "node_modules")
+
+    if _is_complete(cached) and not os.path.exists(target):
+        started = time.monotonic()
+        try:
+            copy_tree(os.path.join(cached, "node_modules"), target)
+            _touch(cached)
+            print(f"[AI-AGENT] node_modules cache HIT ({key[:12]}) — "
+                  f"copied in {time.monotonic() - started:.2f}s, skipping npm ci")
+            return True
+        except Exception as e:
+            print(f"[AI-AGENT] WARNING: node_modules cache copy failed — {e}")
+            _remove_tree(target)
+
+    print(f"[AI-AGENT] node_modules cache MISS ({key[:12]}) — running npm ci")
+    code, _, _ = run(f"npm ci {NPM_FLAGS} --cache {npm_cache}",
+                     cwd=repo_path, timeout=INSTALL_TIMEOUT)
+    if code != 0 or not os.path.isdir(target):
+        return False
+
+    try:
+        os.makedirs(cache_root, exist_ok=True)
+        build_dir = tempfile.mkdtemp(prefix=".build-", dir=cache_root)
+        copy_tree(target, os.path.join(build_dir, "node_modules"))
+        _write_marker(build_dir)
+        try:
+            os.replace(build_dir, cached)
+        except OSError:
+            _remove_tree(build_dir)    # Published concurrently by another run
+        _prune_lru(cache_root, NODE_CACHE_MAX_MB * 1024 * 1024)
+    except Exception as e:
+        print(f"[AI-AGENT] WARNING: Could not cache node_modules — {e}")
+    return True
+
+
+def node_modules_key(repo_path: str) -> str:
+    """Content hash of package-lock.json + the Node version in use."""
+    _, node_version, _ = run("node --version", timeout=10)
+    h = hashlib.sha256()
+    h.update(node_version.strip().encode())
+    h.update(sys.platform.encode())
+    h.update(NPM_FLAGS.encode())
+    with open(os.path.join(repo_path, "package-lock.json"), "rb") as f:
+        h.update(f.read())
+    return h.hexdigest()
+
+
+# ---------------------------------------------------------------------------
+# Materialize / LRU
+# ---------------------------------------------------------------------------
+
+def release_python_env(env_dir: str | None) -> None:
+    """Removes a per-run env once its run is over (finalize). Cached envs are never touched."""
+    if env_dir and os.path.dirname(env_dir) == os.path.join(DEP_CACHE_DIR, _RUN_DIR):
+        _remove_tree(env_dir)
+
+
+def _run_dir(prefix: str) -> str:
+    """
+    Fresh per-run directory under DEP_CACHE_DIR/run — on the cache's own
+    filesystem, so an unpublished build can be renamed into it.
+    """
+    root = os.path.join(DEP_CACHE_DIR, _RUN_DIR)
+    os.makedirs(root, exist_ok=True)
+    return tempfile.mkdtemp(prefix=prefix, dir=root)
+
+
+def copy_tree(src: str, dst: str) -> None:
+    """
+    Copies src to a new dst, symlinks kept as symlinks. On Linux `cp
+    --reflink=auto` clones file extents where the filesystem supports it
+    (btrfs, XFS) — as fast as linking, but writes to either side stay there.
+    """
+    if sys.platform.startswith("linux"):
+        code, _, _ = run(f"cp -a --reflink=auto {shlex.quote(src)} {shlex.quote(dst)}",
+                         timeout=INSTALL_TIMEOUT, safe=False)
+        if code == 0:
+            return
+        _remove_tree(dst)
+    shutil.copytree(src, dst, symlinks=True)
+
+
+def _prune_lru(cache_root: str, max_bytes: int) -> None:
+    """
+    Evicts least-recently-used entries until the cache fits in max_bytes.
+    Entries used within RUN_TIMEOUT are kept — a run may still be using them.
+    """
+    entries = []
+    in_use_since = time.time() - RUN_TIMEOUT
+    for name in os.listdir(cache_root):
+        path = os.path.join(cache_root, name)
+        if name.startswith(".") or not _is_complete(path):
+            continue
+        entries.append((os.path.getmtime(os.path.join(path, _COMPLETE_MARKER)), _entry_size(path), path))
+
+    total = sum(size for _, size, _ in entries)
+    for used, size, path in sorted(entries):
+        if total <= max_bytes or used >= in_use_since:
+            break
+        print(f"[AI-AGENT] Evicting cached env {os.path.basename(path)[:12]} ({size // (1024 * 1024)} MB)")
+        _remove_tree(path)
+        total -= size
+
+
+def _write_marker(env_dir: str) -> None:
+    size = 0
+    for root, _, files in os.walk(env_dir):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    with open(os.path.join(env_dir, _COMPLETE_MARKER), "w") as f:
+        f.write(str(size))
+
+
+def _entry_size(env_dir: str) -> int:
+    try:
+        with open(os.path.join(env_dir, _COMPLETE_MARKER)) as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def _is_complete(env_dir: str) -> bool:
+    return os.path.isfile(os.path.join(env_dir, _COMPLETE_MARKER))
+
+
+def _touch(env_dir: str) -> None:
+    """Marks an entry as recently used (marker mtime is the LRU clock)."""
+    try:
+        os.utime(os.path.join(env_dir, _COMPLETE_MARKER))
+    except OSError:
+        pass
+
+
+def _remove_tree(path: str) -> None:
+    shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,147 @@
+import difflib
+import os
+import re
+import shutil
+import tempfile
+
+
+# Unified diff hunk header:  @@ -12,7 +12,9 @@
+_HUNK_RE = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@")
+
+
+class FileBuffer:
+    """
+    One file's lines, read once and edited in memory by every fix for it.
+
+    Each edit is logged as (start, old_end, new_end) — lines [start, old_end)
+    of the buffer at that point became [start, new_end) — so a line number
+    from the original file, or an edited region, can be mapped to where it
+    is now. write() replaces the file atomically; diff() diffs it once.
+    """
+
+    def __init__(self, path: str, rel: str):
+        self.path = path
+        self.rel = rel
+        with open(path, "r") as f:
+            self.original = f.readlines()
+        self.lines = list(self.original)
+        self.edits: list[tuple[int, int, int]] = []
+        self.syntax_ok: bool | None = None   # Whether the current lines load; None = not checked yet
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.edits)
+
+    def locate(self, line_idx: int) -> int | None:
+        """Current index of an original line, or None if an edit deleted it."""
+        for start, old_end, new_end in self.edits:
+            if line_idx >= old_end:
+                line_idx += new_end - old_end
+            elif line_idx >= start:
+                if new_end == start:
+                    return None
+                line_idx = min(line_idx, new_end - 1)
+        return line_idx
+
+    def apply(self, new_lines: list[str], syntax_ok: bool | None = None) -> int | None:
+        """
+        Makes new_lines the buffer content; returns the edit's number, or
+        None if nothing changed. syntax_ok is the new content's checked state.
+        """
+        span = changed_span(self.lines, new_lines)
+        if span is None:
+            return None
+        self.lines = new_lines
+        self.edits.append(span)
+        self.syntax_ok = syntax_ok
+        return len(self.edits) - 1
+
+    def write(self) -> None:
+        """Replaces the file in one step — readers never see a half-written file."""
+        directory = os.path.dirname(self.path)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".agent_fix_", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.writelines(self.lines)
+            shutil.copymode(self.path, tmp)
+            os.replace(tmp, self.path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+    def diff(self, context: int = 0) -> str:
+        """Original → current. No context lines by default, so each fix's hunks stay separate."""
+        return "".join(difflib.unified_diff(
+            self.original, self.lines,
+            fromfile=f"a/{self.rel}",
+            tofile=f"b/{self.rel}",
+            n=context,
+        ))
+
+    def hunks_by_edit(self, diff: str) -> dict[int, str]:
+        """
+        Splits a diff() of this buffer into per-edit patches: each edit gets
+        the file header and every hunk its final lines fall in. Edits whose
+        hunks touch share them, so both fixes carry the change.
+        """
+        lines = diff.splitlines(keepends=True)
+        header = "".join(lines[:2])
+        hunks: list[tuple[int, int, str]] = []
+        for line in lines[2:]:
+            m = _HUNK_RE.match(line)
+            if m:
+                start = int(m.group(1)) - 1 if m.group(2) != "0" else int(m.group(1))
+                hunks.append((start, start + int(m.group(2) or 1), line))
+            elif hunks:
+                start, end, text = hunks[-1]
+                hunks[-1] = (start, end, text + line)
+
+        patches = {}
+        for n in range(len(self.edits)):
+            start, end = self._final_range(n)
+            own = [text for h_start, h_end, text in hunks if _overlaps(start, end, h_start, h_end)]
+            if own:
+                patches[n] = header + "".join(own)
+        return patches
+
+    def _final_range(self, n: int) -> tuple[int, int]:
+        """Where edit n's new lines ended up after the edits that followed it."""
+        start, _, end = self.edits[n]
+        for e_start, e_old_end, e_new_end in self.edits[n + 1:]:
+            if end <= e_start:
+                continue
+            if start >= e_old_end:
+                start += e_new_end - e_old_end
+                end += e_new_end - e_old_end
+            else:
+                start = min(start, e_start)
+                end = end + e_new_end - e_old_end if end > e_old_end else e_new_end
+        return start, end
+
+
+def _overlaps(start: int, end: int, h_start: int, h_end: int) -> bool:
+    """Line ranges share a line — or, for an empty range (a deletion), sit at the same place."""
+    if start == end or h_start == h_end:
+        return h_start <= end and start <= h_end
+    return h_start < end and start < h_end
+
+
+def changed_span(before: list[str], after: list[str]) -> tuple[int, int, int] | None:
+    """
+    The smallest (start, old_end, new_end) with before[start:old_end]
+    replaced by after[start:new_end] turning before into after — found by
+    trimming the common prefix and suffix. None if the lists are equal.
+    """
+    limit = min(len(before), len(after))
+    start = 0
+    while start < limit and (before[start] is after[start] or before[start] == after[start]):
+        start += 1
+    if start == len(before) == len(after):
+        return None
+    tail = 0
+    while tail < limit - start and (before[-1 - tail] is after[-1 - tail] or before[-1 - tail] == after[-1 - tail]):
+        tail += 1
+    return start, len(before) - tail, len(after) - tail
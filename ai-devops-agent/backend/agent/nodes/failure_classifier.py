@@ -1,5 +1,9 @@
 import re
 from agent.state import AgentState, Failure
+from agent.nodes.reports import read_lint_report, read_pytest_reports
+from agent.nodes.output_parser import parsed_output
+from agent.nodes.convergence import record_progress, stop_reason
+from agent.nodes.fix_knowledge import record_outcomes
 from typing import Literal
 
 BugType = Literal["LINTING", "SYNTAX", "LOGIC", "TYPE_ERROR", "IMPORT", "INDENTATION"]
@@ -69,82 +73,6 @@ def _human_readable(code: str, msg: str, bug_type: str) -> str:
     return "fix the linting issue"
 
 
-def _parse_flake8_output(output: str) -> list:
-    """Returns list of (file, lineno, code, full_description)."""
-    results = []
-    pattern = re.compile(r"([\w./\\-]+\.py):(\d+):\d+:\s*([A-Z]\d+)\s+(.+)")
-    for line in output.splitlines():
-        match = pattern.search(line)
-        if match:
-            file, lineno, code, msg = match.groups()
-            file = file.replace("\\", "/").lstrip("./").lstrip("/").strip()
-            full_description = f"{code} {msg.strip()}"   # e.g. "E302 expected 2 blank lines, found 1"
-            results.append((file, int(lineno), code, full_description))
-    return results
-
-
-def _parse_pytest_output(output: str) -> list:
-    """
-    Parses pytest --tb=short output for source-file logic bugs.
-    Returns list of (file, lineno, code, description).
-    """
-    results = []
-    lines = output.splitlines()
-    print(f"[DEBUG] pytest_parser: scanning {len(lines)} lines")
-
-    # Find start of FAILURES section
-    failure_section_start = -1
-    for i, line in enumerate(lines):
-        if "=== FAILURES ===" in line or line.strip().startswith("FAILED "):
-            failure_section_start = i
-            break
-
-    if failure_section_start == -1:
-        print(f"[DEBUG] pytest_parser: no FAILURES section found, returning 0 issues")
-        return results
-
-    tb_pattern = re.compile(r'^\s*([\w./\\-]+\.py):(\d+):\s+in\s+(\w+)')
-
-    for i in range(failure_section_start, len(lines)):
-        line = lines[i]
-        m = tb_pattern.match(line)
-        if not m:
-            continue
-
-        file, lineno, func = m.groups()
-        file = file.replace("\\", "/").lstrip("./").lstrip("/").strip()
-
-        # Only source files — skip test files
-        if "test_" in file or file.startswith("tests/"):
-            continue
-
-        error_msg = f"LOGIC assert error in {func}"
-        for j in range(i + 1, min(i + 8, len(lines))):
-            em = re.match(r'^E\s+(.+)', lines[j])
-            if em:
-                error_msg = f"LOGIC {em.group(1).strip()}"
-                break
-
-        print(f"[DEBUG] pytest_parser: found source bug → {file}:{lineno} in {func}()")
-        results.append((file, int(lineno), "LOGIC", error_msg))
-
-    print(f"[DEBUG] pytest_parser: returning {len(results)} issues")
-    return results
-
-
-def _parse_mypy_output(output: str) -> list:
-    """Parses mypy output. Returns list of (file, lineno, code, description)."""
-    results = []
-    pattern = re.compile(r"([\w/\\.\-]+\.py):(\d+):\s*error:\s*(.+)")
-    for line in output.splitlines():
-        match = pattern.search(line)
-        if match:
-            file, lineno, msg = match.groups()
-            file = file.replace("\\", "/").lstrip("./").lstrip("/").strip()
-            results.append((file, int(lineno), "TYPE_ERROR", f"TYPE_ERROR {msg.strip()}"))
-    return results
-
-
 # ---------------------------------------------------------------------------
 # Main node
 # ---------------------------------------------------------------------------
@@ -157,10 +85,17 @@ def failure_classifier(state: AgentState) -> AgentState:
         print(f"[DEBUG] SKIP classify: test_passed={state.test_passed}")
         return state
 
-    # Parse all tool outputs — call each parser ONCE
-    flake8_raw  = _parse_flake8_output(raw_output)
-    pytest_raw  = _parse_pytest_output(raw_output)
-    mypy_raw    = _parse_mypy_output(raw_output)
+    # Structured reports written by the tools win; console scraping is the
+    # fallback for runs that produced none. The console log is walked ONCE
+    # for every tool (output_parser) and the result shared with fix_generator.
+    lint_report   = read_lint_report(state.artifacts_dir, state.repo_path)
+    pytest_report = read_pytest_reports(state.artifacts_dir)
+    console = parsed_output(state)
+
+    flake8_raw  = lint_report if lint_report is not None else console.lint_issues
+    pytest_raw  = pytest_report if pytest_report is not None else console.traceback_issues
+    mypy_raw    = console.mypy_issues
+    print(f"[DEBUG] reports used: lint={lint_report is not None} pytest={pytest_report is not None}")
 
     print(f"[DEBUG] flake8 parsed: {len(flake8_raw)} issues")
     print(f"[DEBUG] pytest parsed: {len(pytest_raw)} issues")
@@ -189,4 +124,15 @@ def failure_classifier(state: AgentState) -> AgentState:
         ))
 
     state.failures = new_failures
+
+    # Same code and failures as before, or no improvement for a while —
+    # another fix/commit/push round would not change the outcome
+    progress = record_progress(state)
+    # Fixes applied last iteration worked if their failure is gone
+    record_outcomes(state, set(progress.fingerprints))
+    reason = stop_reason(state)
+    if reason:
+        state.stop_reason = reason
+        state.final_status = "FAILED"
+        print(f"[AI-AGENT] Stopping early — {reason}")
     return state
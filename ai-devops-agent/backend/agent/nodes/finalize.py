@@ -2,6 +2,12 @@ import json
 import os
 from datetime import datetime
 from agent.state import AgentState
+from agent.nodes.warm_runner import stop_warm_runner
+from agent.nodes.sandbox import release_sandbox
+from agent.nodes.dep_cache import release_python_env
+from agent.nodes.repo_index import drop_repo_index
+from agent.nodes.fix_knowledge import knowledge_stats
+from agent.nodes.wheelhouse import wheelhouse_stats
 
 
 # Output file location — written next to repo or in a configured results dir
@@ -19,6 +25,10 @@ def finalize(state: AgentState) -> AgentState:
 
     # 1. Record end time and compute duration
     state.record_end()
+    stop_warm_runner(state.repo_path)
+    drop_repo_index(state.repo_path)
+    release_python_env(state.python_env)
+    release_sandbox(state.repo_path)
 
     # 2. Compute score now that timing and commit count are known
     state.finalize_score()
@@ -66,8 +76,15 @@ def _build_results(state: AgentState) -> dict:
             "start_time": state.start_time,
             "end_time": state.end_time,
             "total_time_seconds": state.total_time_seconds,
+            "stop_reason": state.stop_reason,
         },
 
+        # --- Fix knowledge store (cumulative for the current strategy version) ---
+        "fix_knowledge": knowledge_stats(),
+
+        # --- Shared wheelhouse (cumulative across runs) ---
+        "wheelhouse": wheelhouse_stats(),
+
         # --- Score Breakdown Panel ---
         "score_breakdown": {
             "base_score": state.score.base_score,
@@ -1,26 +1,36 @@
 import os
 import re
-import difflib
 from agent.state import AgentState, Fix
+from agent.nodes.edit_buffer import FileBuffer
+from agent.nodes.convergence import failure_signature, mismatch_fingerprint
+from agent.nodes.fix_knowledge import recall_fix, record_fix, reject_fix
 from agent.nodes.fix_strategies import apply_fix_for_bug_type
+from agent.nodes.repo_index import get_repo_index, update_repo_index
+from agent.nodes.output_parser import parsed_output
+from agent.nodes.syntax_check import needs_check, syntax_error
 
 
 def fix_generator(state: AgentState) -> AgentState:
     new_fixes: list[Fix] = []
 
+    # Every file is read once into a buffer that all of its fixes edit;
+    # applied holds (fix, buffer, edit number, fingerprint, knowledge id)
+    buffers: dict[str, FileBuffer] = {}
+    applied: list[tuple] = []
+
     # ALWAYS check for pytest logic bugs first — independent of state.failures
-    pytest_fixes = _detect_pytest_logic_bugs(state)
+    pytest_fixes = _detect_pytest_logic_bugs(state, buffers, applied)
     new_fixes.extend(pytest_fixes)
 
-    # Then process flake8/linting failures
-    # Sort by file and descending line number so edits do not shift upcoming target lines.
+    # Then process flake8/linting failures, file by file, top to bottom.
+    # Earlier edits shift later lines; the buffer maps each reported line to where it is now.
     ordered_failures = sorted(
         state.failures,
-        key=lambda failure: (failure.file.replace("\\", "/"), -failure.line),
+        key=lambda failure: (_clean_path(failure.file), failure.line),
     )
 
     for failure in ordered_failures:
-        clean_file = failure.file.replace("\\", "/").lstrip("./").lstrip("/")
+        clean_file = _clean_path(failure.file)
         file_path = os.path.join(state.repo_path, clean_file)
 
         if not os.path.exists(file_path):
@@ -28,99 +38,121 @@ def fix_generator(state: AgentState) -> AgentState:
             continue
 
         try:
-            with open(file_path, "r") as f:
-                original_lines = f.readlines()
+            buffer = _buffer(state.repo_path, clean_file, buffers)
         except Exception as e:
             new_fixes.append(_failed_fix(failure, clean_file, f"Read error: {e}"))
             continue
 
-        original_content = "".join(original_lines)
-
-        try:
-            fixed_lines = apply_fix_for_bug_type(
-                lines=list(original_lines),
-                line_idx=failure.line - 1,
-                bug_type=failure.bug_type,
-                description=failure.description,
-            )
-        except Exception as e:
-            new_fixes.append(_failed_fix(failure, clean_file, f"Strategy error: {e}"))
+        line_idx = buffer.locate(failure.line - 1)
+        if line_idx is None:
+            new_fixes.append(_failed_fix(failure, clean_file, "Line was removed by an earlier fix in this file"))
             continue
 
-        fixed_content = "".join(fixed_lines)
+        # A fix recorded for the same failure in the same code is replayed as is;
+        # if it no longer leaves the file loadable, the strategies get their turn
+        signature = failure_signature(failure)
+        check = needs_check(failure.description)
+        fixed_lines, knowledge_id, error = None, None, None
+        recalled = recall_fix(signature, buffer.lines, line_idx)
+        if recalled:
+            fixed_lines, knowledge_id = recalled
+            error = _syntax_error(buffer, fixed_lines, check)
+            if error:
+                print(f"[DEBUG] fix_generator: {clean_file} line {failure.line} — known fix breaks the file ({error})")
+                reject_fix(knowledge_id)
+            else:
+                print(f"[DEBUG] fix_generator: {clean_file} line {failure.line} — replaying known fix")
+
+        if fixed_lines is None or error:
+            try:
+                fixed_lines = apply_fix_for_bug_type(
+                    lines=list(buffer.lines),
+                    line_idx=line_idx,
+                    bug_type=failure.bug_type,
+                    description=failure.description,
+                )
+            except Exception as e:
+                new_fixes.append(_failed_fix(failure, clean_file, f"Strategy error: {e}"))
+                continue
+            knowledge_id = None
+            error = _syntax_error(buffer, fixed_lines, check)
 
-        if fixed_content == original_content:
-            print(f"[DEBUG] fix_generator: {clean_file} line {failure.line} ({failure.bug_type}) — NO CHANGE PRODUCED")
-            new_fixes.append(_failed_fix(failure, clean_file, "Fix strategy produced no changes"))
+        # Rejected before anything is written — not an iteration later as E999
+        if error:
+            print(f"[DEBUG] fix_generator: {clean_file} line {failure.line} ({failure.bug_type}) — REJECTED: {error}")
+            new_fixes.append(_failed_fix(failure, clean_file, f"Fix rejected, file would not load: {error}"))
             continue
 
-        try:
-            with open(file_path, "w") as f:
-                f.write(fixed_content)
-            print(f"[DEBUG] fix_generator: WROTE {clean_file} ({failure.bug_type} line {failure.line})")
-        except Exception as e:
-            new_fixes.append(_failed_fix(failure, clean_file, f"Write error: {e}"))
+        # A file that loaded still loads: the fix was checked or only touched whitespace
+        before = buffer.lines
+        edit = buffer.apply(fixed_lines, syntax_ok=_syntax_after_fix(buffer))
+        if edit is None:
+            print(f"[DEBUG] fix_generator: {clean_file} line {failure.line} ({failure.bug_type}) — NO CHANGE PRODUCED")
+            new_fixes.append(_failed_fix(failure, clean_file, "Fix strategy produced no changes"))
             continue
 
-        diff = "".join(difflib.unified_diff(
-            original_lines, fixed_lines,
-            fromfile=f"a/{clean_file}",
-            tofile=f"b/{clean_file}",
-            lineterm="",
-        ))
+        if knowledge_id is None:
+            knowledge_id = record_fix(signature, before, fixed_lines, line_idx)
 
-        new_fixes.append(Fix(
+        fix = Fix(
             file=clean_file,
             line=failure.line,
             bug_type=failure.bug_type,
             commit_message=f"[AI-AGENT] Fix {failure.bug_type} in {clean_file} line {failure.line}",
             status="FIXED",
-            diff=diff,
-        ))
+        )
+        new_fixes.append(fix)
+        applied.append((fix, buffer, edit, failure.fingerprint, knowledge_id))
 
+    _write_buffers(state, buffers, applied)
     state.fixes = new_fixes
+
+    # Keep the import graph current for test impact analysis
+    update_repo_index(state.repo_path, sorted({f.file for f in new_fixes if f.status == "FIXED"}))
     return state
 
 
+def _write_buffers(state: AgentState, buffers: dict[str, FileBuffer], applied: list[tuple]) -> None:
+    """
+    Writes each edited file once, diffs it once and hands every fix the
+    hunks its edit produced. A failed write fails all of that file's fixes.
+    """
+    for clean_file, buffer in buffers.items():
+        if not buffer.changed:
+            continue
+        own = [entry for entry in applied if entry[1] is buffer]
+        try:
+            buffer.write()
+        except Exception as e:
+            for fix, *_ in own:
+                fix.status = "FAILED"
+                fix.diff = f"Write error: {e}"
+            continue
+        print(f"[DEBUG] fix_generator: WROTE {clean_file} ({len(own)} fix(es))")
+
+        patches = buffer.hunks_by_edit(buffer.diff())
+        for fix, _, edit, fingerprint, knowledge_id in own:
+            if fix.diff is None:
+                fix.diff = patches.get(edit, "Superseded by a later fix in this file")
+            if knowledge_id is not None and fingerprint:
+                state.fix_knowledge[fingerprint] = knowledge_id
+
+
 # ---------------------------------------------------------------------------
 # Pytest logic bug detection
 # ---------------------------------------------------------------------------
 
-def _detect_pytest_logic_bugs(state: AgentState) -> list[Fix]:
+def _detect_pytest_logic_bugs(state: AgentState, buffers: dict[str, FileBuffer], applied: list[tuple]) -> list[Fix]:
     """
-    Scans raw_test_output for pytest assert failures,
+    Scans the test output for pytest assert failures,
     finds the source function, and fixes the wrong operator.
     Runs every iteration regardless of state.failures.
     """
     fixes = []
-    raw = state.raw_test_output or ""
-
-    if "assert" not in raw or "FAILED" not in raw:
-        return fixes
-
-    lines = raw.splitlines()
-
-    for i, line in enumerate(lines):
-        # Match test assert lines like: "    assert divide(10, 2) == 5"
-        assert_match = re.match(r'^\s+assert\s+(\w+)\(([^)]*)\)\s*==\s*(.+)', line)
-        if not assert_match:
-            continue
-
-        func_name = assert_match.group(1)
-        func_args  = assert_match.group(2)
-        expected   = assert_match.group(3).strip()
-
-        # Get actual result from the E assert line below
-        actual = None
-        for j in range(i + 1, min(i + 5, len(lines))):
-            e_match = re.match(r'^E\s+assert\s+(\S+)\s+==', lines[j])
-            if e_match:
-                actual = e_match.group(1)
-                break
-
-        if actual is None or actual == expected:
-            continue
 
+    for mismatch in parsed_output(state).assert_mismatches:
+        func_name, func_args = mismatch.function, mismatch.args
+        expected, actual = mismatch.expected, mismatch.actual
         print(f"[DEBUG] pytest_logic: {func_name}({func_args}) returned {actual}, expected {expected}")
 
         # Find source file containing this function
@@ -131,37 +163,55 @@ def _detect_pytest_logic_bugs(state: AgentState) -> list[Fix]:
 
         print(f"[DEBUG] pytest_logic: found {func_name}() in {src_file}:{src_line}")
 
-        file_path = os.path.join(state.repo_path, src_file)
         try:
-            with open(file_path, "r") as f:
-                src_lines = f.readlines()
+            buffer = _buffer(state.repo_path, src_file, buffers)
         except Exception as e:
             print(f"[DEBUG] pytest_logic: read error — {e}")
             continue
 
-        original_content = "".join(src_lines)
-        fixed_lines = fix_logic_in_source(src_lines, src_line - 1, expected, actual, func_name)
+        line_idx = buffer.locate(src_line - 1)
+        if line_idx is None:
+            continue
 
-        if "".join(fixed_lines) == original_content:
-            print(f"[DEBUG] pytest_logic: no change produced for {src_file}")
+        fingerprint = mismatch_fingerprint(mismatch)
+        fixed_lines, knowledge_id, error = None, None, None
+        recalled = recall_fix(fingerprint, buffer.lines, line_idx)
+        if recalled:
+            fixed_lines, knowledge_id = recalled
+            error = _syntax_error(buffer, fixed_lines)
+            if error:
+                print(f"[DEBUG] pytest_logic: known fix for {func_name}() breaks the file ({error})")
+                reject_fix(knowledge_id)
+            else:
+                print(f"[DEBUG] pytest_logic: replaying known fix for {func_name}()")
+        if fixed_lines is None or error:
+            fixed_lines = fix_logic_in_source(buffer.lines, line_idx, expected, actual, func_name)
+            knowledge_id = None
+            error = _syntax_error(buffer, fixed_lines)
+
+        if error:
+            print(f"[DEBUG] pytest_logic: fix for {func_name}() REJECTED: {error}")
             continue
 
-        try:
-            with open(file_path, "w") as f:
-                f.writelines(fixed_lines)
-            print(f"[DEBUG] pytest_logic: WROTE {src_file} (LOGIC line {src_line})")
-        except Exception as e:
-            print(f"[DEBUG] pytest_logic: write error — {e}")
+        before = buffer.lines
+        edit = buffer.apply(fixed_lines, syntax_ok=_syntax_after_fix(buffer))
+        if edit is None:
+            print(f"[DEBUG] pytest_logic: no change produced for {src_file}")
             continue
 
-        fixes.append(Fix(
+        if knowledge_id is None:
+            knowledge_id = record_fix(fingerprint, before, fixed_lines, line_idx)
+
+        fix = Fix(
             file=src_file,
             line=src_line,
             bug_type="LOGIC",
             commit_message=f"[AI-AGENT] Fix LOGIC in {src_file} line {src_line}",
             status="FIXED",
             diff=f"Fixed {func_name}(): returned {actual}, expected {expected}",
-        ))
+        )
+        fixes.append(fix)
+        applied.append((fix, buffer, edit, fingerprint, knowledge_id))
 
     return fixes
 
@@ -198,33 +248,38 @@ def fix_logic_in_source(lines: list[str], idx: int, expected: str, actual: str,
 
 
 def _find_function_in_repo(repo_path: str, func_name: str) -> tuple[str, int]:
-    """Scans src/ and root for a function definition, returns (rel_path, line_number)."""
-    src_dir = os.path.join(repo_path, "src")
-    search_dirs = [src_dir, repo_path]
+    """Looks the function up in the repo's symbol index, returns (rel_path, line_number)."""
+    return get_repo_index(repo_path).find_function(func_name) or ("", 0)
+
+
+def _syntax_error(buffer: FileBuffer, fixed_lines: list[str], check: bool = True) -> str | None:
+    """
+    Why fixed_lines would no longer load, or None. Only files that loaded
+    before the fix are checked — on a broken one the fix may be the repair.
+    """
+    if not check:
+        return None
+    if buffer.syntax_ok is None:
+        buffer.syntax_ok = syntax_error(buffer.rel, buffer.lines) is None
+    return syntax_error(buffer.rel, fixed_lines) if buffer.syntax_ok else None
+
+
+def _syntax_after_fix(buffer: FileBuffer) -> bool | None:
+    """
+    The buffer's syntax_ok once a fix that passed _syntax_error is applied:
+    True if the file loaded before, since it still does; otherwise unknown.
+    """
+    return True if buffer.syntax_ok else None
+
+
+def _buffer(repo_path: str, clean_file: str, buffers: dict[str, FileBuffer]) -> FileBuffer:
+    if clean_file not in buffers:
+        buffers[clean_file] = FileBuffer(os.path.join(repo_path, clean_file), clean_file)
+    return buffers[clean_file]
 
-    for search_dir in search_dirs:
-        if not os.path.exists(search_dir):
-            continue
-        try:
-            entries = sorted(os.listdir(search_dir))
-        except Exception:
-            continue
-        for fname in entries:
-            if not fname.endswith(".py") or fname.startswith("test_"):
-                continue
-            fpath = os.path.join(search_dir, fname)
-            try:
-                with open(fpath, "r") as f:
-                    file_lines = f.readlines()
-                for i, line in enumerate(file_lines):
-                    if re.match(rf'^\s*def\s+{func_name}\s*\(', line):
-                        rel = os.path.relpath(fpath, repo_path)
-                        rel = rel.replace("\\", "/")
-                        return rel, i + 1
-            except Exception:
-                continue
 
-    return "", 0
+def _clean_path(file: str) -> str:
+    return file.replace("\\", "/").lstrip("./").lstrip("/")
 
 
 def _failed_fix(failure, clean_file: str, reason: str) -> Fix:
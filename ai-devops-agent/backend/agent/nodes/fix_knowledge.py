@@ -0,0 +1,265 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from agent.config import DEP_CACHE_DIR, FIX_KNOWLEDGE, FIX_KNOWLEDGE_MAX_ENTRIES
+from agent.state import AgentState
+from agent.nodes.edit_buffer import changed_span
+
+
+# Lines of unchanged context kept on each side of a recorded edit — the
+# edit is only replayed where this window matches exactly
+CONTEXT_LINES = 2
+
+# Code whose behaviour the recorded fixes come from. Any change to it is a
+# new strategy version, and fixes recorded by other versions are dropped.
+_STRATEGY_MODULES = ("fix_strategies.py", "fix_generator.py")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fixes (
+    id          INTEGER PRIMARY KEY,
+    version     TEXT NOT NULL,
+    signature   TEXT NOT NULL,      -- Failure kind, location-free (convergence.failure_signature)
+    context     TEXT NOT NULL,      -- Hash of the lines the edit replaces, plus CONTEXT_LINES around them
+    start       INTEGER NOT NULL,   -- Window start relative to the failure line
+    length      INTEGER NOT NULL,   -- Lines in the window
+    replacement TEXT NOT NULL,      -- The window after the fix
+    hits        INTEGER NOT NULL DEFAULT 0,
+    passed      INTEGER NOT NULL DEFAULT 0,   -- Verdicts after the fix was applied
+    failed      INTEGER NOT NULL DEFAULT 0,
+    last_used   REAL NOT NULL,
+    UNIQUE (version, signature, context, start)
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    version  TEXT PRIMARY KEY,
+    lookups  INTEGER NOT NULL DEFAULT 0,
+    hits     INTEGER NOT NULL DEFAULT 0,
+    recorded INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+_lock = threading.Lock()
+_conn: sqlite3.Connection | None = None
+_disabled = not FIX_KNOWLEDGE
+_version: str | None = None
+
+
+def recall_fix(signature: str, lines: list[str], line_idx: int) -> tuple[list[str], int] | None:
+    """
+    A previously recorded fix for this kind of failure whose context matches
+    the file around line_idx: (fixed lines, entry id), or None. Fixes that
+    failed CI more often than they passed are not replayed.
+    """
+    conn = _connect()
+    if conn is None:
+        return None
+    try:
+        with _lock, conn:
+            rows = conn.execute(
+                "SELECT id, context, start, length, replacement FROM fixes "
+                "WHERE version = ? AND signature = ? AND failed <= passed "
+                "ORDER BY passed - failed DESC, hits DESC",
+                (_version, signature),
+            ).fetchall()
+            found = None
+            for entry_id, context, start, length, replacement in rows:
+                begin = line_idx + start
+                if begin >= 0 and _context_hash(lines, begin, begin + length) == context:
+                    found = (entry_id, begin, length, replacement)
+                    break
+            _bump_metrics(conn, lookups=1, hits=1 if found else 0)
+            if found is None:
+                return None
+            entry_id, begin, length, replacement = found
+            conn.execute("UPDATE fixes SET hits = hits + 1, last_used = ? WHERE id = ?", (time.time(), entry_id))
+    except sqlite3.Error as e:
+        _disable(e)
+        return None
+
+    fixed = list(lines)
+    fixed[begin:begin + length] = replacement.splitlines(keepends=True)
+    return fixed, entry_id
+
+
+def record_fix(signature: str, original: list[str], fixed: list[str], line_idx: int) -> int | None:
+    """
+    Stores the edit a strategy made for a failure at line_idx: the changed
+    lines plus CONTEXT_LINES of context on each side, and what they became.
+    Returns the entry id, or None if nothing was stored.
+    """
+    conn = _connect()
+    if conn is None:
+        return None
+    span = changed_span(original, fixed)
+    if span is None:
+        return None
+    begin = max(0, span[0] - CONTEXT_LINES)
+    end = min(len(original), span[1] + CONTEXT_LINES)
+    replacement = "".join(fixed[begin:len(fixed) - (len(original) - end)])
+
+    try:
+        with _lock, conn:
+            conn.execute(
+                "INSERT INTO fixes (version, signature, context, start, length, replacement, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (version, signature, context, start) DO UPDATE SET "
+                "replacement = excluded.replacement, last_used = excluded.last_used",
+                (_version, signature, _context_hash(original, begin, end), begin - line_idx,
+                 end - begin, replacement, time.time()),
+            )
+            entry_id = conn.execute(
+                "SELECT id FROM fixes WHERE version = ? AND signature = ? AND context = ? AND start = ?",
+                (_version, signature, _context_hash(original, begin, end), begin - line_idx),
+            ).fetchone()[0]
+            _bump_metrics(conn, recorded=1)
+            return entry_id
+    except sqlite3.Error as e:
+        _disable(e)
+        return None
+
+
+def record_outcomes(state: AgentState, remaining: set[str] | None = None) -> None:
+    """
+    Settles the fixes applied since the last verdict (state.fix_knowledge):
+    an entry passes if CI passed (remaining=None) or its failure's
+    fingerprint is not among the remaining ones, and fails otherwise.
+    """
+    pending, state.fix_knowledge = state.fix_knowledge, {}
+    conn = _connect()
+    if conn is None or not pending:
+        return
+    verdicts = [(remaining is None or fp not in remaining, entry_id) for fp, entry_id in pending.items()]
+    try:
+        with _lock, conn:
+            conn.executemany(
+                "UPDATE fixes SET passed = passed + ?, failed = failed + ? WHERE id = ?",
+                [(int(ok), int(not ok), entry_id) for ok, entry_id in verdicts],
+            )
+    except sqlite3.Error as e:
+        _disable(e)
+
+
+def reject_fix(entry_id: int) -> None:
+    """
+    A replayed fix that broke the file it was applied to. Its failures are
+    raised above its passes, so it is never replayed again.
+    """
+    conn = _connect()
+    if conn is None:
+        return
+    try:
+        with _lock, conn:
+            conn.execute("UPDATE fixes SET failed = failed + 1 + passed WHERE id = ?", (entry_id,))
+    except sqlite3.Error as e:
+        _disable(e)
+
+
+def knowledge_stats() -> dict:
+    """Lookups, hits, hit rate and stored entries for the current strategy version."""
+    conn = _connect()
+    if conn is None:
+        return {}
+    try:
+        with _lock:
+            row = conn.execute(
+                "SELECT lookups, hits, recorded FROM metrics WHERE version = ?", (_version,),
+            ).fetchone() or (0, 0, 0)
+            entries = conn.execute("SELECT COUNT(*) FROM fixes WHERE version = ?", (_version,)).fetchone()[0]
+    except sqlite3.Error as e:
+        _disable(e)
+        return {}
+    lookups, hits, recorded = row
+    return {
+        "strategy_version": _version,
+        "lookups": lookups,
+        "hits": hits,
+        "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+        "recorded": recorded,
+        "entries": entries,
+    }
+
+
+def strategy_version() -> str:
+    """Hash of the fix strategy source — recorded fixes are only valid for the code that made them."""
+    digest = hashlib.sha256()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in _STRATEGY_MODULES:
+        try:
+            with open(os.path.join(here, name), "rb") as f:
+                digest.update(f.read())
+        except OSError:
+            digest.update(name.encode())
+    return digest.hexdigest()[:16]
+
+
+# ---------------------------------------------------------------------------
+# Internal helpers
+# ---------------------------------------------------------------------------
+
+def _connect() -> sqlite3.Connection | None:
+    """
+    Opens the store on first use. Entries from other strategy versions are
+    deleted and the least recently used beyond FIX_KNOWLEDGE_MAX_ENTRIES
+    evicted. Any database error disables the store for the process.
+    """
+    global _conn, _version
+    if _disabled:
+        return None
+    if _conn is not None:
+        return _conn
+    with _lock:
+        if _conn is not None:
+            return _conn
+        path = os.path.join(DEP_CACHE_DIR, "fix_knowledge.sqlite3")
+        try:
+            os.makedirs(DEP_CACHE_DIR, exist_ok=True)
+            conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                conn.executescript(_SCHEMA)
+                _version = strategy_version()
+                dropped = conn.execute("DELETE FROM fixes WHERE version != ?", (_version,)).rowcount
+                conn.execute("DELETE FROM metrics WHERE version != ?", (_version,))
+                conn.execute(
+                    "DELETE FROM fixes WHERE id NOT IN "
+                    "(SELECT id FROM fixes ORDER BY last_used DESC LIMIT ?)",
+                    (FIX_KNOWLEDGE_MAX_ENTRIES,),
+                )
+        except (OSError, sqlite3.Error) as e:
+            _disable_locked(e)
+            return None
+        if dropped:
+            print(f"[AI-AGENT] Fix knowledge: strategies changed — dropped {dropped} stale fix(es)")
+        _conn = conn
+        return _conn
+
+
+def _context_hash(lines: list[str], begin: int, end: int) -> str:
+    """Window content, anchored to the start/end of the file when it touches them."""
+    if end > len(lines):
+        return ""
+    head = "^" if begin == 0 else ""
+    tail = "$" if end == len(lines) else ""
+    return hashlib.sha256((head + "".join(lines[begin:end]) + tail).encode()).hexdigest()[:24]
+
+
+def _bump_metrics(conn: sqlite3.Connection, lookups: int = 0, hits: int = 0, recorded: int = 0) -> None:
+    conn.execute(
+        "INSERT INTO metrics (version, lookups, hits, recorded) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (version) DO UPDATE SET lookups = lookups + excluded.lookups, "
+        "hits = hits + excluded.hits, recorded = recorded + excluded.recorded",
+        (_version, lookups, hits, recorded),
+    )
+
+
+def _disable(error: Exception) -> None:
+    with _lock:
+        _disable_locked(error)
+
+
+def _disable_locked(error: Exception) -> None:
+    global _disabled
+    if not _disabled:
+        print(f"[AI-AGENT] WARNING: Fix knowledge store disabled — {error}")
+    _disabled = True
@@ -3,6 +3,7 @@ import re
 import subprocess
 from git import Repo, GitCommandError, InvalidGitRepositoryError
 from agent.state import AgentState, Fix
+from agent.nodes.deadline import clamp_timeout
 
 
 def git_commit(state: AgentState) -> AgentState:
@@ -100,7 +101,7 @@ def _push_to_remote(repo, branch_name: str, github_token: str = None) -> bool:
             cwd=repo_path,
             capture_output=True,
             text=True,
-            timeout=60,
+            timeout=clamp_timeout(60),
             env={**os.environ, "GIT_TERMINAL_PROMPT": "0"},
         )
 
@@ -1,12 +1,7 @@
 import os
+from agent.config import TEST_FAIL_FAST
 from agent.state import AgentState
-
-# Directories to skip during walking
-EXCLUDED_DIRS = {
-    ".git", "__pycache__", "node_modules", ".venv", "venv",
-    "env", ".env", "dist", "build", ".tox", ".mypy_cache",
-    ".pytest_cache", "target",  # Java/Maven build dir
-}
+from agent.nodes.utils import list_repo_files
 
 # Extension → language mapping
 LANGUAGE_MAP = {
@@ -16,8 +11,16 @@ LANGUAGE_MAP = {
     ".java": "java",
 }
 
-# Language → test command mapping
+# Language → test command mapping (collect every failure in one run)
 TEST_COMMANDS = {
+    "python": "python -m pytest --tb=short -q",
+    "javascript": "npm test -- --runInBand --watch=false",
+    "typescript": "npm test -- --runInBand --watch=false",
+    "java": "mvn test -q --fail-at-end",
+}
+
+# Stop-at-first-failure variants (fail_fast runs)
+FAIL_FAST_TEST_COMMANDS = {
     "python": "python -m pytest --tb=short -q -x --maxfail=1",
     "javascript": "npm test -- --runInBand --watch=false --bail=1",
     "typescript": "npm test -- --runInBand --watch=false --bail=1",
@@ -36,22 +39,19 @@ LINT_COMMANDS = {
 def language_detector(state: AgentState) -> AgentState:
     """
     Language Detector Node:
-    - Walks repo excluding vendor/cache dirs
+    - Enumerates repo files via git's index (skips anything .gitignore'd)
     - Counts files per language for confidence scoring
     - Stores language and test_cmd in correct state fields
+    - test_cmd reports every failure unless the run asked for fail_fast
     - Handles multi-language repos by picking dominant language
     """
     file_counts: dict[str, int] = {}
 
-    for root, dirs, files in os.walk(state.repo_path):
-        # Prune excluded directories in-place (prevents os.walk from descending)
-        dirs[:] = [d for d in dirs if d not in EXCLUDED_DIRS]
-
-        for filename in files:
-            ext = os.path.splitext(filename)[1].lower()
-            if ext in LANGUAGE_MAP:
-                lang = LANGUAGE_MAP[ext]
-                file_counts[lang] = file_counts.get(lang, 0) + 1
+    for rel_path in list_repo_files(state.repo_path):
+        ext = os.path.splitext(rel_path)[1].lower()
+        if ext in LANGUAGE_MAP:
+            lang = LANGUAGE_MAP[ext]
+            file_counts[lang] = file_counts.get(lang, 0) + 1
 
     if not file_counts:
         state.language = "unknown"
@@ -68,7 +68,8 @@ def language_detector(state: AgentState) -> AgentState:
     )
 
     state.language = dominant
-    state.test_cmd = TEST_COMMANDS.get(dominant)
+    fail_fast = state.fail_fast if state.fail_fast is not None else TEST_FAIL_FAST
+    state.test_cmd = (FAIL_FAST_TEST_COMMANDS if fail_fast else TEST_COMMANDS).get(dominant)
     state.lint_cmd = LINT_COMMANDS.get(dominant)
 
     # Log detection result
@@ -0,0 +1,164 @@
+import hashlib
+import os
+import re
+import shlex
+from typing import Iterable
+from agent.state import AgentState
+from agent.config import LINT_TIMEOUT
+from agent.nodes.deadline import allow_step
+from agent.nodes.utils import run
+from agent.nodes import lint_engine
+
+
+# Files whose content changes lint results for the whole repo — any change
+# here invalidates every cached per-file result
+LINT_CONFIG_FILES = (
+    ".flake8", "setup.cfg", "tox.ini", "pyproject.toml",
+    ".eslintrc", ".eslintrc.js", ".eslintrc.cjs", ".eslintrc.json",
+    ".eslintrc.yml", ".eslintrc.yaml", ".eslintignore",
+    "eslint.config.js", "eslint.config.mjs", "eslint.config.cjs",
+)
+
+# Extensions each linter actually checks
+LINT_EXTENSIONS = {
+    "python": (".py",),
+    "javascript": (".js", ".jsx", ".mjs", ".cjs"),
+    "typescript": (".ts", ".tsx", ".js", ".jsx"),
+}
+
+# flake8 default:  path.py:12:5: E302 ...
+# eslint compact:  /abs/path/file.js: line 3, col 5, Error - ...
+_LINT_PATH_RE = re.compile(r"^(.+?\.[A-Za-z]+):\s*(?:\d+|line \d+)")
+
+
+def seed_lint_cache(state: AgentState, lint_output: str | Iterable[str]) -> None:
+    """
+    Records a full-repo lint run as the baseline: per-file result lines plus
+    the config hash they were produced under.
+    """
+    state.lint_results = group_by_file(lint_output, state.repo_path)
+    state.lint_config_hash = lint_config_hash(state.repo_path, state.lint_cmd)
+
+
+def relint_changed(
+    state: AgentState,
+    changed_files: list[str],
+    env: dict = None,
+    timeout: int = LINT_TIMEOUT,
+) -> tuple[bool, str]:
+    """
+    Re-lints only changed_files and merges the result with cached results for
+    every other file. Falls back to a full lint (and re-seeds the cache) if
+    there is no baseline yet or the lint configuration changed — unless the
+    step policy skips it, in which case only changed_files are checked.
+
+    Returns (passed, merged_output).
+    """
+    if not state.repo_path or not state.lint_cmd:
+        return True, ""
+
+    config_hash = lint_config_hash(state.repo_path, state.lint_cmd)
+    if state.lint_results is None or config_hash != state.lint_config_hash:
+        if not allow_step(state, "full_relint"):
+            # Hash left stale so the next iteration retries the full lint
+            state.lint_results = state.lint_results or {}
+            return _relint_subset(state, changed_files, env, timeout)
+        print("[AI-AGENT] Lint cache invalid — running full lint")
+        seed_lint_cache(state, _lint(state, None, env, timeout))
+        return _cached_verdict(state)
+
+    return _relint_subset(state, changed_files, env, timeout)
+
+
+def _relint_subset(state: AgentState, changed_files: list[str], env: dict, timeout: int) -> tuple[bool, str]:
+    extensions = LINT_EXTENSIONS.get(state.language or "", ())
+    targets = sorted({
+        _normalize(f, state.repo_path) for f in changed_files
+        if f.endswith(extensions) and os.path.exists(os.path.join(state.repo_path, f))
+    })
+
+    results = dict(state.lint_results)
+    for f in changed_files:
+        # Drop stale entries for every changed file — re-added below if still failing
+        results.pop(_normalize(f, state.repo_path), None)
+    results.pop("", None)
+
+    if targets:
+        print(f"[AI-AGENT] Incremental lint: {len(targets)} changed file(s)")
+        results.update(group_by_file(_lint(state, targets, env, timeout), state.repo_path))
+
+    state.lint_results = results
+    return _cached_verdict(state)
+
+
+def subset_command(lint_cmd: str, files: list[str]) -> str:
+    """Replaces the `.` target in lint_cmd with an explicit file list."""
+    tokens = shlex.split(lint_cmd)
+    if "." in tokens:
+        i = tokens.index(".")
+        tokens[i:i + 1] = files
+    else:
+        tokens += files
+    return shlex.join(tokens)
+
+
+def group_by_file(output: str | Iterable[str], repo_path: str) -> dict[str, list[str]]:
+    """
+    Groups lint output (text or lines) by repo-relative file. Lines that name
+    no file (tool crashes, config errors) are kept under "" so they still fail lint.
+    """
+    grouped: dict[str, list[str]] = {}
+    lines = (output or "").splitlines() if isinstance(output, str) or output is None else output
+    for line in lines:
+        if not line.strip():
+            continue
+        m = _LINT_PATH_RE.match(line)
+        key = _normalize(m.group(1), repo_path) if m else ""
+        grouped.setdefault(key, []).append(line)
+    return grouped
+
+
+def lint_config_hash(repo_path: str, lint_cmd: str) -> str:
+    h = hashlib.sha256((lint_cmd or "").encode())
+    for name in LINT_CONFIG_FILES:
+        path = os.path.join(repo_path, name)
+        if os.path.isfile(path):
+            h.update(b"\0" + name.encode() + b"\0")
+            with open(path, "rb") as f:
+                h.update(f.read())
+    return h.hexdigest()
+
+
+# ---------------------------------------------------------------------------
+# Internal helpers
+# ---------------------------------------------------------------------------
+
+def _lint(state: AgentState, files: list[str] | None, env: dict, timeout: int) -> str:
+    """Lint output for files (None = the whole repo) — in-process for flake8 where possible."""
+    if lint_engine.handles(state.language, state.lint_cmd):
+        try:
+            issues = lint_engine.lint_repo(state.repo_path, state.lint_cmd, files, timeout=timeout)
+            return "\n".join(lint_engine.format_issues(issues))
+        except Exception as e:
+            print(f"[AI-AGENT] WARNING: In-process lint failed ({e}) — running flake8")
+    cmd = state.lint_cmd if files is None else subset_command(state.lint_cmd, files)
+    _, stdout, stderr = run(cmd, cwd=state.repo_path, timeout=timeout, env=env)
+    return _merge(stdout, stderr)
+
+
+def _cached_verdict(state: AgentState) -> tuple[bool, str]:
+    lines = [line for key in sorted(state.lint_results) for line in state.lint_results[key]]
+    return not lines, "\n".join(lines)
+
+
+def _normalize(path: str, repo_path: str) -> str:
+    path = path.strip().replace("\\", "/")
+    if os.path.isabs(path):
+        path = os.path.relpath(path, repo_path).replace("\\", "/")
+    while path.startswith("./"):
+        path = path[2:]
+    return path
+
+
+def _merge(stdout: str, stderr: str) -> str:
+    return "\n".join(part.strip() for part in (stdout, stderr) if part and part.strip())
@@ -0,0 +1,480 @@
+import ast
+import configparser
+import fnmatch
+import hashlib
+import os
+import re
+import shlex
+import tokenize
+from collections import OrderedDict
+from concurrent.futures import wait
+from concurrent.futures.process import BrokenProcessPool
+from threading import Lock
+from agent.config import LINT_TIMEOUT
+from agent.nodes.deadline import clamp_timeout
+from agent.nodes.repo_index import get_repo_index
+from agent.nodes.worker_pool import POOL_WORKERS, get_pool, shutdown_pool, split_batches
+
+try:
+    import pycodestyle
+    from pyflakes import checker as pyflakes_checker
+except ImportError:   # Callers fall back to the flake8 subprocess
+    pycodestyle = None
+    pyflakes_checker = None
+else:
+    # As under flake8: a bare `# noqa` must not silence pycodestyle checks
+    # wholesale — noqa is matched per code in _check_source instead
+    pycodestyle.noqa = lambda line: None
+
+try:
+    import mccabe
+except ImportError:
+    mccabe = None
+
+
+# flake8's code for each pyflakes message class
+PYFLAKES_CODES = {
+    "UnusedImport": "F401",
+    "ImportShadowedByLoopVar": "F402",
+    "ImportStarUsed": "F403",
+    "LateFutureImport": "F404",
+    "ImportStarUsage": "F405",
+    "ImportStarNotPermitted": "F406",
+    "FutureFeatureNotDefined": "F407",
+    "PercentFormatInvalidFormat": "F501",
+    "PercentFormatExpectedMapping": "F502",
+    "PercentFormatExpectedSequence": "F503",
+    "PercentFormatExtraNamedArguments": "F504",
+    "PercentFormatMissingArgument": "F505",
+    "PercentFormatMixedPositionalAndNamed": "F506",
+    "PercentFormatPositionalCountMismatch": "F507",
+    "PercentFormatStarRequiresSequence": "F508",
+    "PercentFormatUnsupportedFormatCharacter": "F509",
+    "StringDotFormatInvalidFormat": "F521",
+    "StringDotFormatExtraNamedArguments": "F522",
+    "StringDotFormatExtraPositionalArguments": "F523",
+    "StringDotFormatMissingArgument": "F524",
+    "StringDotFormatMixingAutomatic": "F525",
+    "FStringMissingPlaceholders": "F541",
+    "TStringMissingPlaceholders": "F542",
+    "MultiValueRepeatedKeyLiteral": "F601",
+    "MultiValueRepeatedKeyVariable": "F602",
+    "TooManyExpressionsInStarredAssignment": "F621",
+    "TwoStarredExpressions": "F622",
+    "AssertTuple": "F631",
+    "IsLiteral": "F632",
+    "InvalidPrintSyntax": "F633",
+    "IfTuple": "F634",
+    "BreakOutsideLoop": "F701",
+    "ContinueOutsideLoop": "F702",
+    "YieldOutsideFunction": "F704",
+    "ReturnOutsideFunction": "F706",
+    "DefaultExceptNotLast": "F707",
+    "DoctestSyntaxError": "F721",
+    "ForwardAnnotationSyntaxError": "F722",
+    "RedefinedWhileUnused": "F811",
+    "UndefinedName": "F821",
+    "UndefinedExport": "F822",
+    "UndefinedLocal": "F823",
+    "UnusedIndirectAssignment": "F824",
+    "DuplicateArgument": "F831",
+    "UnusedVariable": "F841",
+    "UnusedAnnotation": "F842",
+    "RaiseNotImplemented": "F901",
+}
+
+# flake8 defaults
+DEFAULT_SELECT = ("E", "F", "W", "C90")
+DEFAULT_IGNORE = ("E121", "E123", "E126", "E226", "E24", "E704", "W503", "W504")
+DEFAULT_EXCLUDE = (".svn", "CVS", ".bzr", ".hg", ".git", "__pycache__", ".tox", ".nox", ".eggs", "*.egg")
+
+# Config files flake8 reads from the repo root, in lookup order
+CONFIG_FILES = ("setup.cfg", "tox.ini", ".flake8")
+
+# Below this many files to check, a process pool costs more than it saves
+PARALLEL_MIN_FILES = 32
+
+# Per-file results kept across runs: (options, path, content hash) → issues
+_CACHE_MAX_ENTRIES = 20000
+
+# flake8 options that take a separate value on the command line
+_VALUE_OPTIONS = {
+    "--max-line-length", "--max-doc-length", "--max-complexity", "--select", "--ignore",
+    "--extend-select", "--extend-ignore", "--exclude", "--extend-exclude",
+    "--per-file-ignores", "--indent-size", "--config", "--format",
+}
+
+_NOQA_RE = re.compile(r"#\s*noqa(?::\s*(?P<codes>[A-Z]+[0-9]+(?:[,\s]+[A-Z]+[0-9]+)*))?", re.I)
+_FILE_NOQA_RE = re.compile(r"#\s*flake8[:=]\s*noqa(?P<codes>:\s*[A-Z])?", re.I)
+
+_CACHE: OrderedDict[tuple[str, str, str], list] = OrderedDict()
+_CACHE_LOCK = Lock()
+
+
+def handles(language: str | None, lint_cmd: str | None) -> bool:
+    """
+    True when lint_cmd is a flake8 run this engine can replace: a Python
+    repo, pyflakes/pycodestyle importable and the default output format.
+    """
+    if language != "python" or not lint_cmd or pycodestyle is None:
+        return False
+    tokens = shlex.split(lint_cmd)
+    if not any(os.path.basename(t) == "flake8" for t in tokens):
+        return False
+    fmt = _cli_options(tokens).get("format", "default")
+    return fmt == "default"
+
+
+def lint_repo(repo_path: str, lint_cmd: str, files: list[str] | None = None, timeout: int = LINT_TIMEOUT) -> list:
+    """
+    flake8-equivalent lint without a subprocess. Checks files (repo-relative)
+    or, by default, every indexed Python file under lint_cmd's targets,
+    honouring the repo's [flake8] config and the command-line options.
+    Unchanged files come from the per-file cache; the rest are checked in a
+    process pool when there are enough of them.
+
+    Returns sorted (file, line, column, code, message) tuples.
+    """
+    options = lint_options(repo_path, lint_cmd)
+    fingerprint = hashlib.sha256(repr(sorted(options.items())).encode()).hexdigest()
+
+    if files is None:
+        targets = options.pop("targets")
+        files = [f for f in sorted(get_repo_index(repo_path).files) if _under_targets(f, targets)]
+    else:
+        options.pop("targets")
+        files = [f.replace("\\", "/") for f in files if f.endswith(".py")]
+    files = [f for f in files if not _excluded(f, options["exclude"])]
+
+    issues: list = []
+    pending: list[tuple[str, bytes, str]] = []
+    for rel in files:
+        try:
+            with open(os.path.join(repo_path, rel), "rb") as f:
+                source = f.read()
+        except OSError as e:
+            issues.append((rel, 1, 1, "E902", f"{type(e).__name__}: {e}"))
+            continue
+        digest = hashlib.sha256(source).hexdigest()
+        with _CACHE_LOCK:
+            cached = _CACHE.get((fingerprint, rel, digest))
+        if cached is None:
+            pending.append((rel, source, digest))
+        else:
+            issues.extend((rel, *issue) for issue in cached)
+
+    if pending:
+        for (rel, _, digest), found in zip(pending, _check_all(pending, options, timeout)):
+            if found is None:
+                issues.append((rel, 1, 1, "E902", f"TimeoutError: lint did not finish within {timeout}s"))
+                continue
+            _remember(fingerprint, rel, digest, found)
+            issues.extend((rel, *issue) for issue in found)
+
+    print(f"[AI-AGENT] In-process lint: {len(files)} file(s), {len(pending)} checked, "
+          f"{len(files) - len(pending)} cached, {len(issues)} issue(s)")
+    return sorted(issues)
+
+
+def format_issues(issues: list) -> list[str]:
+    """flake8 default-format lines:  path.py:12:5: E302 message"""
+    return [f"{file}:{line}:{col}: {code} {message}" for file, line, col, code, message in issues]
+
+
+def lint_options(repo_path: str, lint_cmd: str) -> dict:
+    """
+    Effective flake8 options: defaults, then the repo's [flake8] section
+    (setup.cfg / tox.ini / .flake8, first found), then the command line.
+    """
+    tokens = shlex.split(lint_cmd or "")
+    cli = _cli_options(tokens)
+    config: dict[str, str] = {}
+    if "isolated" not in cli:
+        config_path = cli.get("config")
+        candidates = [config_path] if config_path else CONFIG_FILES
+        for name in candidates:
+            section = _read_section(os.path.join(repo_path, name))
+            if section is not None:
+                config = section
+                break
+    merged = {**config, **cli}
+    exclude = _list(merged["exclude"]) if "exclude" in merged else DEFAULT_EXCLUDE
+
+    return {
+        "targets": _cli_targets(tokens) or ["."],
+        "max_line_length": int(merged.get("max_line_length", 79)),
+        "max_doc_length": int(merged["max_doc_length"]) if merged.get("max_doc_length") else None,
+        "max_complexity": int(merged.get("max_complexity", -1)),
+        "indent_size": int(merged.get("indent_size", 4)),
+        "hang_closing": "hang_closing" in merged and merged["hang_closing"].lower() not in ("false", "0"),
+        "select": _codes(merged["select"]) if "select" in merged else DEFAULT_SELECT,
+        "extend_select": _codes(merged.get("extend_select", "")),
+        "ignore": _codes(merged["ignore"]) if "ignore" in merged else DEFAULT_IGNORE,
+        "extend_ignore": _codes(merged.get("extend_ignore", "")),
+        "exclude": exclude + _list(merged.get("extend_exclude", "")),
+        "per_file_ignores": _per_file_ignores(merged.get("per_file_ignores", "")),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Internal helpers — checking (also run inside pool workers)
+# ---------------------------------------------------------------------------
+
+_GUIDES: dict[tuple, "pycodestyle.StyleGuide"] = {}
+
+
+def _check_batch(batch: list[tuple[str, bytes]], options: dict) -> list[list]:
+    return [_check_source(rel, source, options) for rel, source in batch]
+
+
+def _check_source(rel: str, source: bytes, options: dict) -> list:
+    """(line, column, code, message) for one file, after select/ignore and noqa."""
+    text = source.decode("utf-8", errors="replace")
+    file_noqa = _FILE_NOQA_RE.search(text)
+    if file_noqa and not file_noqa.group("codes"):
+        return []
+
+    try:
+        tree = ast.parse(source, filename=rel)
+    except SyntaxError as e:
+        found = [(e.lineno or 1, max(e.offset or 1, 1), "E999", f"{type(e).__name__}: {e.msg}")]
+        return [i for i in found if _selected(i[2], options)]
+    except ValueError as e:   # Null bytes
+        return [(1, 1, "E999", f"{type(e).__name__}: {e}")]
+
+    found = []
+    for message in pyflakes_checker.Checker(tree, filename=rel).messages:
+        code = PYFLAKES_CODES.get(type(message).__name__, "F999")
+        found.append((message.lineno, message.col + 1, code, message.message % message.message_args))
+
+    lines = text.splitlines(True)
+    report = _Collector(_style_guide(options).options)
+    pycodestyle.Checker(rel, lines=lines, options=_style_guide(options).options, report=report).check_all()
+    found.extend(report.issues)
+
+    if mccabe is not None and options["max_complexity"] >= 0:
+        visitor = mccabe.PathGraphingAstVisitor()
+        visitor.preorder(tree, visitor)
+        for graph in visitor.graphs.values():
+            if graph.complexity() > options["max_complexity"]:
+                found.append((graph.lineno, graph.column + 1, "C901",
+                              f"{graph.entity!r} is too complex ({graph.complexity()})"))
+
+    ignored = _file_ignores(rel, options["per_file_ignores"])
+    found = [i for i in found if _selected(i[2], options) and not i[2].startswith(ignored)]
+    if found and "noqa" in text.lower():
+        noqa_lines = _noqa_lines(lines)
+        found = [i for i in found if not (i[0] in noqa_lines and _noqa(noqa_lines[i[0]], i[2]))]
+    return sorted(set(found))
+
+
+def _style_guide(options: dict) -> "pycodestyle.StyleGuide":
+    """pycodestyle reports every check; selection happens once, in _check_source."""
+    key = (options["max_line_length"], options["max_doc_length"], options["hang_closing"], options["indent_size"])
+    guide = _GUIDES.get(key)
+    if guide is None:
+        guide = pycodestyle.StyleGuide(
+            quiet=True, select=("E", "W"), ignore=(),
+            max_line_length=key[0], max_doc_length=key[1], hang_closing=key[2], indent_size=key[3],
+        )
+        _GUIDES[key] = guide
+    return guide
+
+
+if pycodestyle is not None:
+    class _Collector(pycodestyle.BaseReport):
+        def __init__(self, options):
+            super().__init__(options)
+            self.issues: list = []
+
+        def error(self, line_number, offset, text, check):
+            code = super().error(line_number, offset, text, check)
+            if code:
+                self.issues.append((line_number, offset + 1, code, text[5:]))
+            return code
+
+
+def _selected(code: str, options: dict) -> bool:
+    """flake8's decision: the longer matching select/ignore prefix wins."""
+    selects = tuple(options["select"]) + tuple(options["extend_select"])
+    if code.startswith("C90") and options["max_complexity"] < 0:
+        return False
+    select = max((len(s) for s in selects if code.startswith(s)), default=-1)
+    if select < 0:
+        return False
+    ignore = max((len(i) for i in tuple(options["ignore"]) + tuple(options["extend_ignore"])
+                  if code.startswith(i)), default=-1)
+    return select > ignore
+
+
+def _noqa_lines(lines: list[str]) -> dict[int, str]:
+    """
+    Line number → the text `# noqa` is searched in. As in flake8, that is the
+    whole logical line, so a comment closing a multi-line statement or
+    string covers every line of it.
+    """
+    mapping: dict[int, str] = {}
+    start = 1
+    try:
+        for token in tokenize.generate_tokens(iter(lines).__next__):
+            if token.type in (tokenize.NEWLINE, tokenize.NL, tokenize.ENDMARKER):
+                end = token.end[0]
+                joined = "".join(lines[start - 1:end])
+                for line in range(start, end + 1):
+                    mapping[line] = joined
+                start = end + 1
+    except (tokenize.TokenError, SyntaxError):
+        pass
+    for line in range(start, len(lines) + 1):
+        mapping[line] = lines[line - 1]
+    return mapping
+
+
+def _noqa(text: str, code: str) -> bool:
+    m = _NOQA_RE.search(text)
+    if not m:
+        return False
+    codes = m.group("codes")
+    return not codes or code.startswith(tuple(_codes(codes.upper())))
+
+
+def _file_ignores(rel: str, per_file: list) -> tuple[str, ...]:
+    codes: list[str] = []
+    for pattern, pattern_codes in per_file:
+        if _path_matches(rel, pattern):
+            codes.extend(pattern_codes)
+    return tuple(codes)
+
+
+# ---------------------------------------------------------------------------
+# Internal helpers — scheduling and cache
+# ---------------------------------------------------------------------------
+
+def _check_all(pending: list[tuple[str, bytes, str]], options: dict, timeout: int) -> list:
+    """Issues per pending file, in order; None for files the timeout cut off."""
+    items = [(rel, source) for rel, source, _ in pending]
+    if len(items) < PARALLEL_MIN_FILES or (os.cpu_count() or 1) < 2:
+        return _check_batch(items, options)
+
+    pool = get_pool()
+    batches = split_batches(items, POOL_WORKERS)
+    try:
+        futures = [pool.submit(_check_batch, batch, options) for batch in batches]
+        done, _ = wait(futures, timeout=clamp_timeout(timeout))
+    except BrokenProcessPool:
+        print("[AI-AGENT] WARNING: Lint worker pool failed — checking in-process")
+        shutdown_pool()
+        return _check_batch(items, options)
+
+    results: list = []
+    for future, batch in zip(futures, batches):
+        if future in done and future.exception() is None:
+            results.extend(future.result())
+        else:
+            future.cancel()
+            results.extend([None] * len(batch))
+    return results
+
+
+def _remember(fingerprint: str, rel: str, digest: str, issues: list) -> None:
+    with _CACHE_LOCK:
+        _CACHE[(fingerprint, rel, digest)] = issues
+        while len(_CACHE) > _CACHE_MAX_ENTRIES:
+            _CACHE.popitem(last=False)
+
+
+# ---------------------------------------------------------------------------
+# Internal helpers — options
+# ---------------------------------------------------------------------------
+
+def _cli_options(tokens: list[str]) -> dict[str, str]:
+    options: dict[str, str] = {}
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token.startswith("--"):
+            name, eq, value = token.partition("=")
+            if not eq and name in _VALUE_OPTIONS and i + 1 < len(tokens):
+                value = tokens[i + 1]
+                i += 1
+            options[name[2:].replace("-", "_")] = value
+        i += 1
+    return options
+
+
+def _cli_targets(tokens: list[str]) -> list[str]:
+    """Paths after the flake8 token (`flake8 src tests` → [src, tests])."""
+    start = next((i for i, t in enumerate(tokens) if os.path.basename(t) == "flake8"), None)
+    if start is None:
+        return []
+    targets, i = [], start + 1
+    while i < len(tokens):
+        token = tokens[i]
+        if token.startswith("-"):
+            if "=" not in token and token in _VALUE_OPTIONS:
+                i += 1
+        else:
+            targets.append(token)
+        i += 1
+    return targets
+
+
+def _read_section(path: str) -> dict[str, str] | None:
+    if not os.path.isfile(path):
+        return None
+    parser = configparser.RawConfigParser()
+    try:
+        parser.read(path, encoding="utf-8")
+    except (configparser.Error, UnicodeDecodeError):
+        return None
+    if not parser.has_section("flake8"):
+        return None
+    return {key.replace("-", "_"): value for key, value in parser.items("flake8")}
+
+
+def _codes(value: str) -> tuple[str, ...]:
+    return tuple(c for c in re.split(r"[,\s]+", value.strip()) if c)
+
+
+def _list(value: str) -> tuple[str, ...]:
+    return tuple(v.strip().rstrip("/") for v in re.split(r"[,\n]+", value) if v.strip())
+
+
+def _per_file_ignores(value: str) -> list[tuple[str, tuple[str, ...]]]:
+    """`a.py:E1,E2 pkg/*:F401` (any whitespace/comma layout) → [(pattern, codes)]."""
+    entries: list[tuple[str, list[str]]] = []
+    for token in re.split(r"[\s,]+", value.strip()):
+        if not token:
+            continue
+        if ":" in token:
+            pattern, _, codes = token.partition(":")
+            entries.append((pattern, [codes] if codes else []))
+        elif entries:
+            entries[-1][1].append(token)
+    return [(pattern, tuple(codes)) for pattern, codes in entries]
+
+
+def _under_targets(rel: str, targets: list[str]) -> bool:
+    for target in targets:
+        target = target.replace("\\", "/").rstrip("/")
+        while target.startswith("./"):
+            target = target[2:]
+        if target in (".", "") or rel == target or rel.startswith(target + "/"):
+            return True
+    return False
+
+
+def _excluded(rel: str, patterns: tuple[str, ...]) -> bool:
+    parts = rel.split("/")
+    return any(
+        _path_matches(rel, pattern) or any(fnmatch.fnmatch(part, pattern) for part in parts)
+        for pattern in patterns
+    )
+
+
+def _path_matches(rel: str, pattern: str) -> bool:
+    pattern = pattern.replace("\\", "/")
+    while pattern.startswith("./"):
+        pattern = pattern[2:]
+    return fnmatch.fnmatch(rel, pattern) or fnmatch.fnmatch(os.path.basename(rel), pattern) \
+        or rel.startswith(pattern.rstrip("/") + "/")
@@ -0,0 +1,137 @@
+import hashlib
+import os
+import re
+from typing import Iterable
+from agent.state import AgentState, AssertMismatch, ParsedOutput
+from agent.nodes.reports import TracebackScanner, output_lines
+
+
+# flake8 default:  path.py:12:5: E302 message
+_FLAKE8_RE = re.compile(r"([\w./\\-]+\.py):(\d+):\d+:\s*([A-Z]\d+)\s+(.+)")
+# mypy:  path.py:12: error: message
+_MYPY_RE = re.compile(r"([\w/\\.\-]+\.py):(\d+):\s*error:\s*(.+)")
+# pytest short test summary:  FAILED tests/test_x.py::test_y[param] - AssertionError
+_FAILED_ID_RE = re.compile(r"^(?:FAILED|ERROR)\s+(\S+::\S+?)(?:\s+-\s.*)?$")
+
+# Test assert lines like: "    assert divide(10, 2) == 5"
+_ASSERT_CALL_RE = re.compile(r"^\s+assert\s+(\w+)\(([^)]*)\)\s*==\s*(.+)")
+# The E line below it with the actual value: "E   assert 20 == 5"
+_E_ASSERT_RE = re.compile(r"^E\s+assert\s+(\S+)\s+==")
+
+# Lines after an assert within which its `E ` line must appear
+_ASSERT_WINDOW = 4
+
+
+def parsed_output(state: AgentState) -> ParsedOutput:
+    """
+    The structured view of the last test_runner output — parsed once, on
+    first use, and reused by every later reader until the output changes.
+    """
+    source = _source_key(state)
+    if state.parsed_output is None or state.parsed_output.source != source:
+        state.parsed_output = parse_output(output_lines(state), source)
+    return state.parsed_output
+
+
+def parse_output(lines: Iterable[str], source: str = "") -> ParsedOutput:
+    """
+    Walks lint + test output once, handing each line only to the parsers
+    its shape can match: flake8 and mypy lines, pytest traceback frames
+    (from the FAILURES section on), `assert f(...) == x` mismatches and
+    the short test summary's failing node IDs.
+    """
+    lint: list = []
+    mypy: list = []
+    failed_tests: list[str] = []
+    tracebacks = TracebackScanner()
+    asserts = _AssertScanner()
+    in_failures = False
+    saw_failed = False
+
+    for line in lines:
+        if "FAILED" in line:
+            saw_failed = True
+            if not in_failures and line.lstrip().startswith("FAILED "):
+                in_failures = True
+        if not in_failures and "=== FAILURES ===" in line:
+            in_failures = True
+
+        stripped = line.lstrip()
+        if stripped.startswith(("FAILED", "ERROR")):
+            m = _FAILED_ID_RE.match(stripped.rstrip())
+            if m and m.group(1) not in failed_tests:
+                failed_tests.append(m.group(1))
+
+        if in_failures:
+            tracebacks.feed(line)
+        asserts.feed(line)
+
+        if ".py:" not in line:
+            continue
+        m = _FLAKE8_RE.search(line)
+        if m:
+            file, lineno, code, msg = m.groups()
+            lint.append((_clean(file), int(lineno), code, f"{code} {msg.strip()}"))
+        elif ": error:" in line:
+            m = _MYPY_RE.search(line)
+            if m:
+                file, lineno, msg = m.groups()
+                mypy.append((_clean(file), int(lineno), "TYPE_ERROR", f"TYPE_ERROR {msg.strip()}"))
+
+    return ParsedOutput(
+        source=source,
+        lint_issues=lint,
+        traceback_issues=tracebacks.results,
+        mypy_issues=mypy,
+        assert_mismatches=asserts.mismatches() if saw_failed else [],
+        failed_tests=failed_tests,
+    )
+
+
+# ---------------------------------------------------------------------------
+# Internal helpers
+# ---------------------------------------------------------------------------
+
+class _AssertScanner:
+    """`assert func(args) == expected` lines and the actual value from the E line below."""
+
+    def __init__(self):
+        self._found: list[list] = []     # [func, args, expected, actual]
+        self._pending: list[list] = []   # [entry, lines left in window]
+
+    def feed(self, line: str) -> None:
+        e_match = _E_ASSERT_RE.match(line) if self._pending else None
+        if e_match:
+            for entry, _ in self._pending:
+                entry[3] = e_match.group(1)
+            self._pending = []
+        elif self._pending:
+            for p in self._pending:
+                p[1] -= 1
+            self._pending = [p for p in self._pending if p[1] > 0]
+
+        m = _ASSERT_CALL_RE.match(line) if "assert" in line else None
+        if m:
+            entry = [m.group(1), m.group(2), m.group(3).strip(), None]
+            self._found.append(entry)
+            self._pending.append([entry, _ASSERT_WINDOW])
+
+    def mismatches(self) -> list[AssertMismatch]:
+        return [
+            AssertMismatch(function=func, args=args, expected=expected, actual=actual)
+            for func, args, expected, actual in self._found
+            if actual is not None and actual != expected
+        ]
+
+
+def _source_key(state: AgentState) -> str:
+    """Identifies the output a parse came from: the spilled log's path/size/mtime, or the in-state text."""
+    path = state.raw_test_output_path
+    if path and os.path.exists(path):
+        st = os.stat(path)
+        return f"{path}:{st.st_size}:{st.st_mtime_ns}"
+    return "text:" + hashlib.sha256((state.raw_test_output or "").encode()).hexdigest()
+
+
+def _clean(file: str) -> str:
+    return file.replace("\\", "/").lstrip("./").lstrip("/").strip()
@@ -1,6 +1,7 @@
 import os
 import subprocess
 from agent.state import AgentState, Fix
+from agent.nodes.deadline import clamp_timeout
 
 
 def patch_applier(state: AgentState) -> AgentState:
@@ -42,7 +43,7 @@ def _has_any_changes(repo_path: str, file_path: str) -> bool:
         # Check unstaged changes
         result = subprocess.run(
             ["git", "diff", "--", file_path],
-            cwd=repo_path, capture_output=True, text=True, timeout=10
+            cwd=repo_path, capture_output=True, text=True, timeout=clamp_timeout(10)
         )
         if result.stdout.strip():
             return True
@@ -50,7 +51,7 @@ def _has_any_changes(repo_path: str, file_path: str) -> bool:
         # Check staged changes (already added but not committed)
         result2 = subprocess.run(
             ["git", "diff", "--cached", "--", file_path],
-            cwd=repo_path, capture_output=True, text=True, timeout=10
+            cwd=repo_path, capture_output=True, text=True, timeout=clamp_timeout(10)
         )
         return bool(result2.stdout.strip())
     except Exception:
@@ -61,7 +62,7 @@ def _get_git_diff(repo_path: str, file_path: str) -> str:
     try:
         result = subprocess.run(
             ["git", "diff", "--", file_path],
-            cwd=repo_path, capture_output=True, text=True, timeout=10
+            cwd=repo_path, capture_output=True, text=True, timeout=clamp_timeout(10)
         )
         return result.stdout.strip() or "(diff not available)"
     except Exception:
@@ -0,0 +1,233 @@
+"""
+Warm pytest worker — runs under the target repo's interpreter, not the agent's.
+Standalone on purpose: imports nothing from the agent package.
+
+  pytest_worker.py serve <socket> <repo_path> [module ...]
+      Imports pytest, its plugins and the given third-party modules once,
+      prints READY, then forks a fresh child per request. The repo's own
+      modules are never imported here, so edits between runs need no reload.
+      Exits when its stdin closes (the agent went away).
+
+  pytest_worker.py run <socket> [pytest args ...]
+      Thin client used in place of `python -m pytest`. Hands its stdout and
+      stderr to the worker, which runs pytest in a forked child writing
+      straight to them, and exits with pytest's exit code. SIGINT/SIGTERM
+      are forwarded to the child; if the client dies the child is killed.
+"""
+import importlib
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+
+_HEADER = struct.Struct("!I")
+_INTERRUPT = b"I"
+
+
+# ---------------------------------------------------------------------------
+# Client
+# ---------------------------------------------------------------------------
+
+def client(sock_path: str, args: list[str]) -> int:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(sock_path)
+    except OSError as e:
+        print(f"pytest worker unavailable: {e}", file=sys.stderr)
+        return 3
+
+    request = json.dumps({"args": args, "cwd": os.getcwd(), "env": dict(os.environ)}).encode()
+    socket.send_fds(sock, [_HEADER.pack(len(request))], [1, 2])
+    sock.sendall(request)
+
+    def forward(signum, frame):
+        try:
+            sock.sendall(_INTERRUPT)
+        except OSError:
+            pass
+
+    signal.signal(signal.SIGINT, forward)
+    signal.signal(signal.SIGTERM, forward)
+
+    reply = _recv_exact(sock, _HEADER.size)
+    if reply is None:
+        print("pytest worker exited before the run finished", file=sys.stderr)
+        return 3
+    return _HEADER.unpack(reply)[0]
+
+
+# ---------------------------------------------------------------------------
+# Worker
+# ---------------------------------------------------------------------------
+
+def serve(sock_path: str, repo_path: str, modules: list[str]) -> None:
+    import selectors
+    sys.path.pop(0)   # This script's directory — the agent's modules must not shadow anything
+    importlib.import_module("pytest")   # Loaded before forking, so every child starts with it
+
+    _preload(repo_path, modules)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(sock_path)
+    server.listen(16)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)   # Interrupts arrive per run, over the socket
+
+    sel = selectors.DefaultSelector()
+    sel.register(server, selectors.EVENT_READ)
+    sel.register(sys.stdin, selectors.EVENT_READ)
+    children: dict[int, socket.socket] = {}   # child pid → client connection
+    print("READY", flush=True)
+
+    while True:
+        for key, _ in sel.select(timeout=0.2):
+            if key.fileobj is server:
+                conn, _ = server.accept()
+                pid = _start_run(conn, [server, *children.values()])
+                if pid:
+                    children[pid] = conn
+                    sel.register(conn, selectors.EVENT_READ, pid)
+                else:
+                    conn.close()
+                continue
+            if key.fileobj is sys.stdin:
+                if not os.read(sys.stdin.fileno(), 64):
+                    for pid in children:
+                        _kill_group(pid, signal.SIGKILL)
+                    return
+                continue
+            conn, pid = key.fileobj, key.data
+            try:
+                data = conn.recv(64)
+            except OSError:
+                data = b""
+            # Client interrupted → let pytest report; client gone → kill
+            _kill_group(pid, signal.SIGINT if data else signal.SIGKILL)
+            if not data:
+                sel.unregister(conn)
+
+        # Reap finished runs and report their exit codes
+        for pid, conn in list(children.items()):
+            try:
+                done, status = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                done, status = pid, 1 << 8
+            if not done:
+                continue
+            del children[pid]
+            try:
+                sel.unregister(conn)
+            except (KeyError, ValueError):
+                pass
+            try:
+                code = os.waitstatus_to_exitcode(status)
+                conn.sendall(_HEADER.pack(code if code >= 0 else 128 - code))   # Shell convention
+            except OSError:
+                pass
+            conn.close()
+
+
+def _preload(repo_path: str, modules: list[str]) -> None:
+    from importlib import import_module
+    from importlib.metadata import entry_points
+
+    for ep in entry_points(group="pytest11"):
+        try:
+            ep.load()
+        except Exception:
+            pass
+    for name in modules:
+        try:
+            import_module(name)
+        except BaseException:
+            pass
+
+    # A third-party import that dragged in repo code would go stale after a fix
+    root = os.path.realpath(repo_path) + os.sep
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, "__file__", None) or ""
+        if path and os.path.realpath(path).startswith(root):
+            del sys.modules[name]
+
+
+def _start_run(conn: socket.socket, inherited: list[socket.socket]) -> int | None:
+    try:
+        header, fds, _, _ = socket.recv_fds(conn, _HEADER.size, 2)
+        request = json.loads(_recv_exact(conn, _HEADER.unpack(header)[0]))
+    except (OSError, ValueError, TypeError, struct.error):
+        return None
+
+    pid = os.fork()
+    if pid:
+        for fd in fds:
+            os.close(fd)
+        return pid
+
+    # Child: own process group so the worker can stop the whole run. Worker
+    # sockets are dropped so a dying worker still closes every client's line.
+    try:
+        for sock in inherited + [conn]:
+            sock.close()
+        os.setpgid(0, 0)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(fds[0], 1)
+        os.dup2(fds[1], 2)
+        sys.stdout.reconfigure(line_buffering=True)
+        sys.stderr.reconfigure(line_buffering=True)
+
+        os.chdir(request["cwd"])
+        os.environ.clear()
+        os.environ.update(request["env"])
+        sys.path.insert(0, request["cwd"])   # As `python -m pytest` would
+        # Preloaded plugins can no longer be assert-rewritten — expected, not news
+        args = ["-W", "ignore::pytest.PytestAssertRewriteWarning"] + request["args"]
+        sys.argv = ["pytest"] + args
+
+        import pytest
+        code = int(pytest.main(args))
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else 1
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+        code = 3
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(code)
+
+
+def _kill_group(pid: int, sig: int) -> None:
+    try:
+        os.killpg(pid, sig)
+    except OSError:
+        pass
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes | None:
+    data = b""
+    while len(data) < size:
+        try:
+            chunk = sock.recv(size - len(data))
+        except InterruptedError:
+            continue
+        except OSError:
+            return None
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+if __name__ == "__main__":
+    mode = sys.argv[1] if len(sys.argv) > 2 else ""
+    if mode == "serve":
+        serve(sys.argv[2], sys.argv[3], sys.argv[4:])
+    elif mode == "run":
+        sys.exit(client(sys.argv[2], sys.argv[3:]))
+    else:
+        print(__doc__, file=sys.stderr)
+        sys.exit(2)
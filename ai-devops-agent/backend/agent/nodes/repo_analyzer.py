@@ -4,22 +4,20 @@ import atexit
 import shutil
 import stat
 import time
-from git import Repo, GitCommandError, InvalidGitRepositoryError
+from git import Git, GitCommandError, InvalidGitRepositoryError
 from agent.state import AgentState
-
-# Directories to exclude from structure analysis
-EXCLUDED_DIRS = {
-    ".git", "__pycache__", "node_modules", ".venv", "venv",
-    "env", "dist", "build", ".tox", ".mypy_cache",
-    ".pytest_cache", "target",
-}
+from agent.config import CLONE_TIMEOUT
+from agent.nodes.deadline import clamp_timeout
+from agent.nodes.sandbox import acquire_sandbox, bind_sandbox
+from agent.nodes.utils import list_repo_files
 
 
 def repo_analyzer(state: AgentState) -> AgentState:
     """
     Repo Analyzer Node (first node in pipeline):
     - Records start time for timing/scoring
-    - Clones the repository into a temp directory
+    - Clones the repository into a temp directory (inside the run's
+      sandbox session when sandboxing is on)
     - Registers cleanup on process exit
     - Analyzes repo structure for downstream nodes
     - Does NOT do language detection (delegated to language_detector)
@@ -28,13 +26,18 @@ def repo_analyzer(state: AgentState) -> AgentState:
     # Record start time — must be first node
     state.record_start()
 
-    # Clone repository
-    repo_dir = _clone_repo(state.repo_url, state.github_token)
+    # Clone repository — into the sandbox's shared root so commands see it
+    sandbox = acquire_sandbox()
+    repo_dir = _clone_repo(state.repo_url, state.github_token, parent=sandbox.root if sandbox else None)
     if repo_dir is None:
+        if sandbox is not None:
+            sandbox.close()
         state.final_status = "FAILED"
         return state
 
     state.repo_path = repo_dir
+    if sandbox is not None:
+        bind_sandbox(repo_dir, sandbox)
 
     # Register cleanup so temp dir is removed on process exit
     atexit.register(_cleanup_repo, repo_dir)
@@ -49,13 +52,13 @@ def repo_analyzer(state: AgentState) -> AgentState:
 # Clone
 # ---------------------------------------------------------------------------
 
-def _clone_repo(repo_url: str, github_token: str = None) -> str | None:
+def _clone_repo(repo_url: str, github_token: str = None, parent: str = None) -> str | None:
     """
-    Clones the repo into a temp directory.
+    Clones the repo into a temp directory (under parent, if given).
     Supports token auth for private repos.
     Returns the temp dir path or None on failure.
     """
-    repo_dir = tempfile.mkdtemp(prefix="cicd_agent_")
+    repo_dir = tempfile.mkdtemp(prefix="cicd_agent_", dir=parent)
 
     # Inject token into URL if provided
     # https://github.com/org/repo → https://TOKEN@github.com/org/repo
@@ -69,7 +72,8 @@ def _clone_repo(repo_url: str, github_token: str = None) -> str | None:
 
     try:
         print(f"[AI-AGENT] Cloning {repo_url} ...")
-        Repo.clone_from(auth_url, repo_dir, depth=1)  # Shallow clone for speed
+        # Shallow clone for speed; killed if it overruns its share of the run budget
+        Git().clone("--depth=1", auth_url, repo_dir, kill_after_timeout=clamp_timeout(CLONE_TIMEOUT))
         print(f"[AI-AGENT] Clone successful → {repo_dir}")
         return repo_dir
 
@@ -89,7 +93,7 @@ def _clone_repo(repo_url: str, github_token: str = None) -> str | None:
 
 def _analyze_structure(repo_dir: str) -> dict:
     """
-    Walks the repo and returns a structure summary.
+    Enumerates the repo's files and returns a structure summary.
     Used by test_runner and language_detector downstream.
     """
     test_files = []
@@ -102,32 +106,26 @@ def _analyze_structure(repo_dir: str) -> dict:
         "mypy.ini", "tox.ini", "Makefile", "pom.xml",
     }
 
-    for root, dirs, files in os.walk(repo_dir):
-        # Prune excluded dirs in-place
-        dirs[:] = [d for d in dirs if d not in EXCLUDED_DIRS]
-
-        rel_root = os.path.relpath(root, repo_dir)
-
-        for filename in files:
-            rel_path = os.path.join(rel_root, filename)
-            rel_path = rel_path.lstrip("./\\")
-
-            if filename in config_names:
-                config_files.append(rel_path)
-
-            # Test file detection — dynamic, no hardcoded paths
-            if (
-                filename.startswith("test_") or
-                filename.endswith("_test.py") or
-                filename.endswith(".test.js") or
-                filename.endswith(".test.ts") or
-                filename.endswith(".spec.js") or
-                filename.endswith(".spec.ts") or
-                "test" in filename.lower()
-            ) and not filename.startswith("."):
-                test_files.append(rel_path)
-            else:
-                source_files.append(rel_path)
+    # Enumerate via git's index — honours the repo's own .gitignore
+    for rel_path in list_repo_files(repo_dir):
+        filename = rel_path.rsplit("/", 1)[-1]
+
+        if filename in config_names:
+            config_files.append(rel_path)
+
+        # Test file detection — dynamic, no hardcoded paths
+        if (
+            filename.startswith("test_") or
+            filename.endswith("_test.py") or
+            filename.endswith(".test.js") or
+            filename.endswith(".test.ts") or
+            filename.endswith(".spec.js") or
+            filename.endswith(".spec.ts") or
+            "test" in filename.lower()
+        ) and not filename.startswith("."):
+            test_files.append(rel_path)
+        else:
+            source_files.append(rel_path)
 
     return {
         "test_files": test_files,
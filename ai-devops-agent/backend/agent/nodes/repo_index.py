@@ -0,0 +1,268 @@
+import ast
+import os
+from collections import deque
+from concurrent.futures.process import BrokenProcessPool
+from threading import Lock
+from agent.nodes.utils import list_repo_files
+from agent.nodes.worker_pool import POOL_WORKERS, get_pool, shutdown_pool, split_batches
+
+
+# Below this many files a process pool costs more than the parse it spreads
+PARALLEL_MIN_FILES = 200
+
+# One index per workspace, built lazily on first use and kept for the run
+_INDEXES: dict[str, "RepoIndex"] = {}
+_INDEXES_LOCK = Lock()
+
+
+def get_repo_index(repo_path: str) -> "RepoIndex":
+    """Returns the workspace's index, building it with a single AST pass if needed."""
+    with _INDEXES_LOCK:
+        index = _INDEXES.get(repo_path)
+        if index is None:
+            index = RepoIndex(repo_path)
+            index.build()
+            _INDEXES[repo_path] = index
+        return index
+
+
+def update_repo_index(repo_path: str, rel_paths: list[str]) -> None:
+    """Re-parses files after an edit. No-op if the index was never built."""
+    with _INDEXES_LOCK:
+        index = _INDEXES.get(repo_path)
+    if index is not None:
+        for rel in rel_paths:
+            index.update_file(rel)
+
+
+def drop_repo_index(repo_path: str) -> None:
+    """Forgets the workspace's index at the end of its run."""
+    with _INDEXES_LOCK:
+        _INDEXES.pop(repo_path, None)
+
+
+def is_test_file(rel_path: str) -> bool:
+    name = rel_path.rsplit("/", 1)[-1]
+    return name.endswith(".py") and (name.startswith("test_") or name.endswith("_test.py"))
+
+
+class RepoIndex:
+    """
+    Import graph and symbol table over the repo's Python sources.
+
+    Each file is parsed once with `ast`; imports are resolved to repo files so
+    the graph can be walked backwards from a changed module to every test
+    file that imports it, directly or transitively. Every def and class —
+    methods and nested defs included — is recorded under its qualified name
+    (pkg.sub.calc.Calc.add) with its line range.
+    """
+
+    def __init__(self, repo_path: str):
+        self.repo_path = repo_path
+        self.files: set[str] = set()
+        self.modules: dict[str, set[str]] = {}       # dotted name → rel paths
+        self.imports: dict[str, set[str]] = {}       # rel path → dotted names it imports
+        # qualified name → (rel, first line, last line, "def"/"class")
+        self.symbols: dict[str, tuple[str, int, int, str]] = {}
+        self._names: dict[str, set[str]] = {}        # bare name → qualified names
+        self._file_symbols: dict[str, list[str]] = {}
+        self._importers: dict[str, set[str]] | None = None
+
+    # ------------------------------------------------------------------
+    # Build / update
+    # ------------------------------------------------------------------
+
+    def build(self) -> None:
+        rels = [rel for rel in list_repo_files(self.repo_path) if rel.endswith(".py")]
+        for rel, (imports, symbols) in zip(rels, _scan_all(self.repo_path, rels)):
+            self._add_file(rel, imports, symbols)
+        print(f"[AI-AGENT] Repo index: {len(self.files)} Python files, "
+              f"{sum(len(v) for v in self.imports.values())} imports, {len(self.symbols)} symbols")
+
+    def update_file(self, rel: str) -> None:
+        rel = rel.replace("\\", "/")
+        if not rel.endswith(".py"):
+            return
+        self._remove_file(rel)
+        if os.path.exists(os.path.join(self.repo_path, rel)):
+            self._add_file(rel, *_scan_file(self.repo_path, rel))
+        self._importers = None
+
+    def _add_file(self, rel: str, imports: set[str], symbols: list[tuple[str, int, int, str]]) -> None:
+        self.files.add(rel)
+        for name in module_names(rel):
+            self.modules.setdefault(name, set()).add(rel)
+        self.imports[rel] = imports
+
+        module = module_names(rel)[0] if module_names(rel) else ""
+        qualified = []
+        for local, first, last, kind in symbols:
+            qual = f"{module}.{local}" if module else local
+            self.symbols[qual] = (rel, first, last, kind)
+            self._names.setdefault(local.rsplit(".", 1)[-1], set()).add(qual)
+            qualified.append(qual)
+        self._file_symbols[rel] = qualified
+
+    def _remove_file(self, rel: str) -> None:
+        if rel not in self.files:
+            return
+        self.files.discard(rel)
+        self.imports.pop(rel, None)
+        for name in module_names(rel):
+            paths = self.modules.get(name)
+            if paths:
+                paths.discard(rel)
+                if not paths:
+                    del self.modules[name]
+        for qual in self._file_symbols.pop(rel, []):
+            if self.symbols.get(qual, ("",))[0] == rel:
+                del self.symbols[qual]
+            names = self._names.get(qual.rsplit(".", 1)[-1])
+            if names:
+                names.discard(qual)
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def resolve(self, dotted: str) -> set[str]:
+        """Repo files a dotted import may load (the module and its packages)."""
+        found: set[str] = set()
+        parts = dotted.split(".")
+        for i in range(len(parts), 0, -1):
+            found |= self.modules.get(".".join(parts[:i]), set())
+        return found
+
+    def find_function(self, name: str) -> tuple[str, int] | None:
+        """
+        (rel path, def line) of the function or method called `name` — the
+        one the code under test most likely calls: module-level functions
+        before methods, src/ and shallow packages first. Test files are skipped.
+        """
+        best = None
+        for qual in self._names.get(name, ()):
+            rel, first, _, kind = self.symbols[qual]
+            if kind != "def" or is_test_file(rel) or rel.startswith("tests/") or "/tests/" in rel:
+                continue
+            module = module_names(rel)[0] if module_names(rel) else ""
+            rank = (qual != f"{module}.{name}", not rel.startswith("src/"), rel.count("/"), rel, first)
+            if best is None or rank < best[0]:
+                best = (rank, rel, first)
+        return (best[1], best[2]) if best else None
+
+    def affected_tests(self, changed_files: list[str]) -> list[str]:
+        """
+        Test files that transitively import any of changed_files.
+        A changed conftest.py affects every test beneath its directory.
+        """
+        importers = self._importer_graph()
+        seen: set[str] = set()
+        queue = deque(f.replace("\\", "/") for f in changed_files if f.endswith(".py"))
+        tests: set[str] = set()
+
+        while queue:
+            rel = queue.popleft()
+            if rel in seen:
+                continue
+            seen.add(rel)
+            if is_test_file(rel):
+                tests.add(rel)
+            if rel.rsplit("/", 1)[-1] == "conftest.py":
+                prefix = rel[: -len("conftest.py")]
+                tests |= {f for f in self.files if f.startswith(prefix) and is_test_file(f)}
+            queue.extend(importers.get(rel, ()))
+
+        return sorted(tests)
+
+    def _importer_graph(self) -> dict[str, set[str]]:
+        if self._importers is None:
+            graph: dict[str, set[str]] = {}
+            for rel, names in self.imports.items():
+                for name in names:
+                    for target in self.resolve(name):
+                        if target != rel:
+                            graph.setdefault(target, set()).add(rel)
+            self._importers = graph
+        return self._importers
+
+
+# ---------------------------------------------------------------------------
+# Internal helpers
+# ---------------------------------------------------------------------------
+
+def module_names(rel: str) -> list[str]:
+    """
+    Every dotted name a file can be imported as. Registering each suffix
+    covers src/ layouts and tests that put a subdirectory on sys.path:
+    pkg/sub/calc.py → pkg.sub.calc, sub.calc, calc
+    """
+    parts = rel[:-3].split("/")
+    if parts[-1] == "__init__":
+        parts = parts[:-1]
+    return [".".join(parts[i:]) for i in range(len(parts)) if parts[i:]]
+
+
+def _scan_all(repo_path: str, rels: list[str]) -> list[tuple[set[str], list]]:
+    """(imports, symbols) per file, parsed across the worker pool for large repos."""
+    if len(rels) < PARALLEL_MIN_FILES or (os.cpu_count() or 1) < 2:
+        return _scan_batch(repo_path, rels)
+    pool = get_pool()
+    batches = split_batches(rels, POOL_WORKERS)
+    try:
+        futures = [pool.submit(_scan_batch, repo_path, batch) for batch in batches]
+        return [result for future in futures for result in future.result()]
+    except BrokenProcessPool:
+        print("[AI-AGENT] WARNING: Index worker pool failed — parsing in-process")
+        shutdown_pool()
+        return _scan_batch(repo_path, rels)
+
+
+def _scan_batch(repo_path: str, rels: list[str]) -> list[tuple[set[str], list]]:
+    return [_scan_file(repo_path, rel) for rel in rels]
+
+
+def _scan_file(repo_path: str, rel: str) -> tuple[set[str], list[tuple[str, int, int, str]]]:
+    """Parses one file: the dotted names it imports and its defs/classes."""
+    try:
+        with open(os.path.join(repo_path, rel), "rb") as f:
+            tree = ast.parse(f.read(), filename=rel)
+    except (OSError, SyntaxError, ValueError):
+        return set(), []
+    return _collect(tree, rel)
+
+
+def _collect(tree: ast.AST, rel: str) -> tuple[set[str], list[tuple[str, int, int, str]]]:
+    """
+    One walk over the statements (imports and defs never sit inside
+    expressions): the dotted names the file imports, and the
+    (Outer.inner name, first line, last line, kind) of every def and class.
+    """
+    package = rel[:-3].split("/")[:-1]
+    names: set[str] = set()
+    symbols = []
+    stack: list[tuple[ast.AST, str]] = [(tree, "")]
+    while stack:
+        node, scope = stack.pop()
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, ast.Import):
+                names.update(alias.name for alias in child.names)
+            elif isinstance(child, ast.ImportFrom):
+                if child.level:
+                    base = package[: len(package) - child.level + 1] if child.level > 1 else package
+                    prefix = ".".join(base + ([child.module] if child.module else []))
+                else:
+                    prefix = child.module or ""
+                if not prefix:
+                    continue
+                names.add(prefix)
+                # `from pkg import mod` may import a submodule, not a name
+                names.update(f"{prefix}.{alias.name}" for alias in child.names if alias.name != "*")
+            elif isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                name = f"{scope}.{child.name}" if scope else child.name
+                kind = "class" if isinstance(child, ast.ClassDef) else "def"
+                symbols.append((name, child.lineno, child.end_lineno or child.lineno, kind))
+                stack.append((child, name))
+            elif isinstance(child, (ast.stmt, ast.excepthandler, ast.match_case)):
+                # Defs and imports nest inside if/try/with blocks too
+                stack.append((child, scope))
+    return names, symbols
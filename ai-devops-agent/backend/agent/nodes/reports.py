@@ -0,0 +1,293 @@
+import atexit
+import json
+import os
+import re
+import shlex
+import shutil
+import tempfile
+import xml.etree.ElementTree as ET
+from typing import Iterable, Iterator
+from agent.state import AgentState
+from agent.nodes.sandbox import sandbox_for
+
+
+# Report files written by the tools themselves, one set per run.
+# Sharded pytest runs write pytest-shard-<n>.xml alongside pytest.xml.
+FLAKE8_REPORT = "flake8.txt"
+ESLINT_REPORT = "eslint.json"
+PYTEST_REPORT = "pytest.xml"
+PYTEST_REPORT_PREFIX = "pytest"
+
+# Command output spilled to disk: <name>.stdout / <name>.stderr per command,
+# concatenated into OUTPUT_LOG (lint first, then tests) for the parsers
+LINT_LOG = "lint"
+TEST_LOG = "test"
+OUTPUT_LOG = "output.log"
+_SPILL_SUFFIXES = (".stdout", ".stderr")
+
+# Characters of the combined output kept in AgentState.raw_test_output
+RAW_OUTPUT_TAIL_CHARS = 8000
+
+# flake8 default format, written to --output-file:  path.py:12:5: E302 message
+_FLAKE8_LINE_RE = re.compile(r"^(.+?\.py):(\d+):\d+:\s*([A-Z]+\d+)\s+(.+)$")
+
+# --tb=short traceback frame:  pkg/calc.py:12: in add
+_TB_FRAME_RE = re.compile(r"^\s*([\w./\\-]+\.py):(\d+):\s+in\s+(\w+)")
+_TB_ERROR_RE = re.compile(r"^E\s+(.+)")
+
+
+# ---------------------------------------------------------------------------
+# Report locations / command flags
+# ---------------------------------------------------------------------------
+
+def artifacts_dir(state: AgentState) -> str:
+    """
+    Per-run directory for tool reports — outside the clone so reports are
+    never committed, but inside the sandbox root so sandboxed tools can
+    write them. Created on first use, removed on process exit.
+    """
+    if not state.artifacts_dir or not os.path.isdir(state.artifacts_dir):
+        sandbox = sandbox_for(state.repo_path)
+        state.artifacts_dir = tempfile.mkdtemp(prefix="cicd_artifacts_", dir=sandbox.root if sandbox else None)
+        atexit.register(shutil.rmtree, state.artifacts_dir, True)
+    return state.artifacts_dir
+
+
+def clear_reports(report_dir: str) -> None:
+    """Drops the previous iteration's reports so stale results are never re-read."""
+    for name in os.listdir(report_dir):
+        if name in (FLAKE8_REPORT, ESLINT_REPORT, OUTPUT_LOG) or _is_pytest_report(name) \
+                or name.endswith(_SPILL_SUFFIXES):
+            try:
+                os.remove(os.path.join(report_dir, name))
+            except OSError:
+                pass
+
+
+def with_lint_report(lint_cmd: str, report_dir: str) -> str:
+    """
+    Adds report flags to a lint command.
+    flake8 keeps its console output (--tee); ESLint switches to JSON.
+    """
+    tokens = shlex.split(lint_cmd)
+    if any(os.path.basename(t) == "flake8" for t in tokens):
+        return shlex.join(tokens + [f"--output-file={os.path.join(report_dir, FLAKE8_REPORT)}", "--tee"])
+    if any(os.path.basename(t) == "eslint" for t in tokens):
+        tokens = [t for t in tokens if not t.startswith("--format")]
+        return shlex.join(tokens + ["--format=json", f"--output-file={os.path.join(report_dir, ESLINT_REPORT)}"])
+    return lint_cmd
+
+
+def with_test_report(test_cmd: str, report_dir: str) -> str:
+    """Adds a JUnit XML report to pytest commands; other runners are unchanged."""
+    if "pytest" not in test_cmd:
+        return test_cmd
+    report = shlex.quote(os.path.join(report_dir, PYTEST_REPORT))
+    return f"{test_cmd} -o junit_family=xunit1 --junitxml={report}"
+
+
+# ---------------------------------------------------------------------------
+# Spilled command output
+# ---------------------------------------------------------------------------
+
+def spill_files(prefix: str) -> list[str]:
+    """The files run(..., spill=prefix) writes, in merge order."""
+    return [prefix + suffix for suffix in _SPILL_SUFFIXES]
+
+
+def combine_logs(dst: str, sources: list[str]) -> None:
+    """Concatenates the non-empty source logs into dst, streaming."""
+    with open(dst, "w", errors="replace") as out:
+        for src in sources:
+            if not os.path.exists(src) or os.path.getsize(src) == 0:
+                continue
+            with open(src, "r", errors="replace") as f:
+                last = ""
+                for chunk in iter(lambda: f.read(1 << 16), ""):
+                    out.write(chunk)
+                    last = chunk
+            if not last.endswith("\n"):
+                out.write("\n")
+
+
+def read_tail(path: str, max_chars: int = RAW_OUTPUT_TAIL_CHARS) -> str:
+    """Last max_chars of a log without reading the whole file."""
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(0, size - max_chars * 4))   # Up to 4 bytes per char
+            return f.read().decode("utf-8", errors="replace")[-max_chars:].strip()
+    except OSError:
+        return ""
+
+
+def output_lines(state: AgentState) -> Iterator[str]:
+    """
+    Lines of the last test_runner output, streamed from the spilled log.
+    Falls back to the in-state text when nothing was spilled.
+    """
+    path = state.raw_test_output_path
+    if path and os.path.exists(path):
+        yield from log_lines([path])
+    else:
+        yield from (state.raw_test_output or "").splitlines()
+
+
+def log_lines(paths: list[str]) -> Iterator[str]:
+    """Streams the lines of each existing log in order."""
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", errors="replace") as f:
+            for line in f:
+                yield line.rstrip("\n")
+
+
+# ---------------------------------------------------------------------------
+# Parsers — each returns list of (file, lineno, code, description), or None
+# when the report does not exist (caller falls back to scraping console text)
+# ---------------------------------------------------------------------------
+
+def read_lint_report(report_dir: str | None, repo_path: str) -> list | None:
+    if not report_dir:
+        return None
+    flake8 = os.path.join(report_dir, FLAKE8_REPORT)
+    eslint = os.path.join(report_dir, ESLINT_REPORT)
+    if os.path.exists(flake8):
+        return _read_flake8(flake8, repo_path)
+    if os.path.exists(eslint):
+        return _read_eslint(eslint, repo_path)
+    return None
+
+
+def read_pytest_reports(report_dir: str | None) -> list | None:
+    """
+    Source-file frames from every failing testcase in the run's JUnit
+    reports. Parsed incrementally — each testcase is discarded once read.
+    """
+    if not report_dir:
+        return None
+    paths = sorted(
+        os.path.join(report_dir, name) for name in os.listdir(report_dir) if _is_pytest_report(name)
+    )
+    if not paths:
+        return None
+
+    results = []
+    for path in paths:
+        try:
+            for _, elem in ET.iterparse(path, events=("end",)):
+                if elem.tag != "testcase":
+                    continue
+                for child in elem:
+                    if child.tag in ("failure", "error"):
+                        results.extend(traceback_issues((child.text or "").splitlines()))
+                elem.clear()
+        except (ET.ParseError, OSError) as e:
+            print(f"[AI-AGENT] WARNING: Could not read pytest report {os.path.basename(path)}: {e}")
+    return results
+
+
+def traceback_issues(lines: Iterable[str]) -> list:
+    """Source-file frames in --tb=short traceback lines — see TracebackScanner."""
+    scanner = TracebackScanner()
+    for line in lines:
+        scanner.feed(line)
+    return scanner.results
+
+
+class TracebackScanner:
+    """
+    Source-file frames in --tb=short traceback lines, each paired with the
+    first `E ` message within the 7 lines that follow it. Test files are
+    skipped. Fed one line at a time, so it can share a pass over the output.
+    """
+
+    def __init__(self):
+        self.results: list = []
+        self._pending: list[list] = []   # [result index, lines left in window]
+
+    def feed(self, line: str) -> None:
+        em = _TB_ERROR_RE.match(line) if self._pending else None
+        if em:
+            for index, _ in self._pending:
+                file, lineno, code, _ = self.results[index]
+                self.results[index] = (file, lineno, code, f"LOGIC {em.group(1).strip()}")
+            self._pending = []
+        elif self._pending:
+            for p in self._pending:
+                p[1] -= 1
+            self._pending = [p for p in self._pending if p[1] > 0]
+
+        m = _TB_FRAME_RE.match(line) if ".py:" in line else None
+        if not m:
+            return
+
+        file, lineno, func = m.groups()
+        file = _normalize(file, "")
+
+        # Only source files — skip test files
+        if "test_" in file or file.startswith("tests/"):
+            return
+
+        self.results.append((file, int(lineno), "LOGIC", f"LOGIC assert error in {func}"))
+        self._pending.append([len(self.results) - 1, 7])
+
+
+def lint_report_text(report_dir: str, repo_path: str) -> str:
+    """
+    Console-style lines for a JSON-only lint report (ESLint writes nothing
+    to stdout with --output-file), so logs and the lint cache still see it.
+    """
+    eslint = os.path.join(report_dir, ESLINT_REPORT)
+    if not os.path.exists(eslint):
+        return ""
+    return "\n".join(f"{f}:{line}: {desc}" for f, line, _, desc in _read_eslint(eslint, repo_path))
+
+
+# ---------------------------------------------------------------------------
+# Internal helpers
+# ---------------------------------------------------------------------------
+
+def _read_flake8(path: str, repo_path: str) -> list:
+    results = []
+    with open(path, "r", errors="replace") as f:
+        for line in f:
+            m = _FLAKE8_LINE_RE.match(line.rstrip("\n"))
+            if m:
+                file, lineno, code, msg = m.groups()
+                results.append((_normalize(file, repo_path), int(lineno), code, f"{code} {msg.strip()}"))
+    return results
+
+
+def _read_eslint(path: str, repo_path: str) -> list:
+    try:
+        with open(path, "r") as f:
+            report = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"[AI-AGENT] WARNING: Could not read ESLint report: {e}")
+        return []
+
+    results = []
+    for entry in report if isinstance(report, list) else []:
+        file = _normalize(entry.get("filePath", ""), repo_path)
+        for msg in entry.get("messages", []):
+            # Parse errors carry no ruleId
+            code = msg.get("ruleId") or ("SYNTAX" if msg.get("fatal") else "LINTING")
+            text = (msg.get("message") or "").strip()
+            results.append((file, int(msg.get("line") or 1), code, f"{code} {text}"))
+    return results
+
+
+def _is_pytest_report(name: str) -> bool:
+    return name.startswith(PYTEST_REPORT_PREFIX) and name.endswith(".xml")
+
+
+def _normalize(path: str, repo_path: str) -> str:
+    path = path.strip().replace("\\", "/")
+    if repo_path and os.path.isabs(path):
+        path = os.path.relpath(path, repo_path).replace("\\", "/")
+    while path.startswith("./"):
+        path = path[2:]
+    return path.lstrip("/")
@@ -0,0 +1,242 @@
+import atexit
+import os
+import shlex
+import shutil
+import subprocess
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from threading import Lock, Thread
+from agent.config import (
+    SANDBOX_BACKEND, SANDBOX_POOL_SIZE, DOCKER_IMAGE, DOCKER_MEMORY_LIMIT, DOCKER_CPU_LIMIT,
+    DOCKER_NETWORK, DOCKER_INSTALL_NETWORK, CMD_CPU_LIMIT, CMD_MEMORY_LIMIT_MB, CMD_MAX_OPEN_FILES,
+    LOCAL_SANDBOX_MEMORY_MB,
+)
+from agent.nodes.utils import run, with_rlimits
+
+
+# `docker info` costs about a second — its answer is reused for this long
+_DOCKER_CHECK_TTL = 300
+
+# Warm sessions waiting for a run, and the session each workspace is bound to
+_POOL: deque["SandboxSession"] = deque()
+_ACTIVE: dict[str, "SandboxSession"] = {}
+_LOCK = Lock()
+_refilling = False
+
+_docker_check: tuple[float, bool] | None = None
+
+
+class SandboxSession(ABC):
+    """
+    One long-lived execution environment for a whole run. Everything under
+    root — the clone, the artifacts dir — is visible to commands at the same
+    path, so command lines need no path rewriting. utils.run() sends
+    repo-derived commands through command() while the session is active.
+    """
+
+    # Commands cannot see host interpreters/virtualenvs — deps go inside
+    isolated = False
+
+    def __init__(self):
+        self.root = tempfile.mkdtemp(prefix="cicd_sandbox_")
+        # Outlives stop(): results.json and the reports are read after the run
+        atexit.register(shutil.rmtree, self.root, True)
+
+    @abstractmethod
+    def command(
+        self, cmd: str, cwd: str | None, env: dict | None, timeout: int, grace: int,
+    ) -> tuple[str, dict | None, int]:
+        """The host command running cmd in the sandbox: (command, env, host-side timeout)."""
+
+    def lock_network(self) -> None:
+        """Cuts the network access dependency installs needed, where the backend can."""
+
+    def stop(self) -> None:
+        """Ends command execution; the files under root stay until exit."""
+
+    def close(self) -> None:
+        self.stop()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+class LocalSandbox(SandboxSession):
+    """
+    Host processes under rlimits — the same interface without Docker.
+    The CMD_* limits apply as usual, plus LOCAL_SANDBOX_MEMORY_MB as a
+    heap limit when set.
+    """
+
+    def command(self, cmd, cwd, env, timeout, grace):
+        limited = with_rlimits(cmd, CMD_CPU_LIMIT, CMD_MEMORY_LIMIT_MB, CMD_MAX_OPEN_FILES,
+                               data_mb=LOCAL_SANDBOX_MEMORY_MB)
+        return limited, env, timeout
+
+
+class DockerSandbox(SandboxSession):
+    """
+    A container started once (`sleep infinity`) with root bind-mounted at
+    the same path; each command is a `docker exec`. Installed dependencies
+    persist for the rest of the run. Timeouts are enforced inside the
+    container, where killing the exec client would not reach.
+    """
+
+    isolated = True
+
+    def __init__(self):
+        super().__init__()
+        self.container: str | None = None
+        # Installs need a network even when the run's commands get none
+        self.network = DOCKER_INSTALL_NETWORK if DOCKER_NETWORK == "none" else DOCKER_NETWORK
+
+    def start(self) -> bool:
+        code, stdout, stderr = run(shlex.join([
+            "docker", "run", "-d", "--rm",
+            f"--network={self.network}",
+            f"--memory={DOCKER_MEMORY_LIMIT}",
+            f"--cpus={DOCKER_CPU_LIMIT}",
+            "-v", f"{self.root}:{self.root}",
+            "-w", self.root,
+            DOCKER_IMAGE, "sleep", "infinity",
+        ]), safe=False, timeout=120)
+        if code != 0:
+            print(f"[AI-AGENT] WARNING: Could not start sandbox container: {stderr.strip()[:200]}")
+            return False
+        self.container = stdout.strip()
+        return True
+
+    def command(self, cmd, cwd, env, timeout, grace):
+        kill_after = max(grace, 1)
+        args = ["docker", "exec", "-w", cwd or self.root]
+        for key, value in {"PYTHONUNBUFFERED": "1", **(env or {})}.items():
+            args += ["-e", f"{key}={value}"]
+        args += [self.container, "timeout", "-s", "INT", "-k", str(kill_after), str(timeout), "sh", "-c", cmd]
+        return shlex.join(args), None, timeout + kill_after + 5
+
+    def lock_network(self) -> None:
+        """Disconnects the install network once dependencies are in, when DOCKER_NETWORK=none."""
+        if not self.container or DOCKER_NETWORK != "none" or self.network == "none":
+            return
+        code, _, stderr = run(shlex.join(["docker", "network", "disconnect", self.network, self.container]),
+                              safe=False, timeout=60)
+        if code != 0:
+            print(f"[AI-AGENT] WARNING: Could not disconnect sandbox from {self.network}: {stderr.strip()[:200]}")
+            return
+        self.network = "none"
+
+    def stop(self) -> None:
+        if self.container:
+            if hasattr(os, "getuid"):
+                # Files the container created are root-owned — hand them back first
+                subprocess.run(
+                    ["docker", "exec", self.container, "chown", "-R", f"{os.getuid()}:{os.getgid()}", self.root],
+                    capture_output=True, timeout=60,
+                )
+            subprocess.run(["docker", "rm", "-f", self.container], capture_output=True, timeout=60)
+            self.container = None
+
+
+# ---------------------------------------------------------------------------
+# Session lifecycle
+# ---------------------------------------------------------------------------
+
+def acquire_sandbox() -> SandboxSession | None:
+    """
+    A ready session for a new run — taken from the warm pool when one is
+    waiting — or None when SANDBOX_BACKEND=none. The pool is topped up in
+    the background for the next run.
+    """
+    if SANDBOX_BACKEND not in ("docker", "local"):
+        return None
+    with _LOCK:
+        session = _POOL.popleft() if _POOL else None
+    if session is None:
+        session = _new_session()
+    _refill_pool()
+    return session
+
+
+def bind_sandbox(repo_path: str, session: SandboxSession) -> None:
+    with _LOCK:
+        _ACTIVE[repo_path] = session
+
+
+def sandbox_for(repo_path: str | None) -> SandboxSession | None:
+    with _LOCK:
+        return _ACTIVE.get(repo_path)
+
+
+def release_sandbox(repo_path: str | None) -> None:
+    """Stops the run's session. Its files are kept for the caller until exit."""
+    with _LOCK:
+        session = _ACTIVE.pop(repo_path, None)
+    if session is not None:
+        session.stop()
+
+
+def docker_available() -> bool:
+    """`docker info` succeeded — cached for _DOCKER_CHECK_TTL seconds."""
+    global _docker_check
+    if _docker_check is None or time.monotonic() - _docker_check[0] > _DOCKER_CHECK_TTL:
+        code, _, _ = run("docker info", safe=False, timeout=10)
+        _docker_check = (time.monotonic(), code == 0)
+    return _docker_check[1]
+
+
+# ---------------------------------------------------------------------------
+# Internal helpers
+# ---------------------------------------------------------------------------
+
+def _new_session() -> SandboxSession:
+    if SANDBOX_BACKEND == "docker":
+        if not docker_available():
+            print("[AI-AGENT] WARNING: Docker unavailable — falling back to the local sandbox (rlimits only)")
+            return LocalSandbox()
+        session = DockerSandbox()
+        if session.start():
+            return session
+        session.close()
+        print("[AI-AGENT] WARNING: Sandbox container failed to start — "
+              "falling back to the local sandbox (rlimits only)")
+    return LocalSandbox()
+
+
+def _refill_pool() -> None:
+    """Pre-warms containers up to SANDBOX_POOL_SIZE. Local sessions cost nothing to create."""
+    global _refilling
+    if SANDBOX_BACKEND != "docker" or SANDBOX_POOL_SIZE <= 0:
+        return
+    with _LOCK:
+        if _refilling or len(_POOL) >= SANDBOX_POOL_SIZE:
+            return
+        _refilling = True
+
+    def refill():
+        global _refilling
+        try:
+            while docker_available():
+                with _LOCK:
+                    if len(_POOL) >= SANDBOX_POOL_SIZE:
+                        break
+                session = DockerSandbox()
+                if not session.start():
+                    session.close()
+                    break
+                with _LOCK:
+                    _POOL.append(session)
+        finally:
+            with _LOCK:
+                _refilling = False
+
+    Thread(target=refill, name="sandbox-pool", daemon=True).start()
+
+
+@atexit.register
+def _close_all() -> None:
+    with _LOCK:
+        sessions = list(_POOL) + list(_ACTIVE.values())
+        _POOL.clear()
+        _ACTIVE.clear()
+    for session in sessions:
+        session.close()
@@ -0,0 +1,152 @@
+import os
+import re
+
+
+# Whitespace-only fixes cannot turn a file that parses into one that does not
+WHITESPACE_CODES = {"W291", "W293", "W292", "W391"}
+
+JS_EXTENSIONS = (".js", ".jsx", ".mjs", ".cjs", ".ts", ".tsx")
+
+_CODE_RE = re.compile(r"^([A-Z]+\d+)\b")
+
+_CLOSERS = {")": "(", "]": "[", "}": "{"}
+
+# After these a `/` starts a regex literal rather than dividing
+_REGEX_PRECEDERS = set("(,=:[!&|?{};+-*%<>~^")
+_REGEX_KEYWORDS = {"return", "typeof", "instanceof", "in", "of", "new", "delete", "void", "throw", "case", "do", "else"}
+
+
+def needs_check(description: str) -> bool:
+    """False for fixes that only touch whitespace (W291, W293, W292, W391)."""
+    m = _CODE_RE.match(description.strip())
+    return not (m and m.group(1) in WHITESPACE_CODES)
+
+
+def syntax_error(rel: str, lines: list[str]) -> str | None:
+    """
+    Why the file's content would not load, or None if it does (or its type
+    is not checked). Python is compiled in-process, so errors the parser
+    alone misses — `return` outside a function, a misplaced `break` — are
+    caught too. JS/TS gets a bracket, string and comment balance scan.
+    """
+    ext = os.path.splitext(rel)[1]
+    source = "".join(lines)
+    if ext == ".py":
+        try:
+            compile(source, rel, "exec", dont_inherit=True)
+        except SyntaxError as e:
+            return f"{e.msg} (line {e.lineno})"
+        except ValueError as e:   # e.g. null bytes
+            return str(e)
+        return None
+    if ext in JS_EXTENSIONS:
+        return _js_error(source)
+    return None
+
+
+# ---------------------------------------------------------------------------
+# Internal helpers
+# ---------------------------------------------------------------------------
+
+def _js_error(source: str) -> str | None:
+    """
+    Unbalanced (), [] or {}, or an unterminated string, template or block
+    comment. Regex literals are told from division by the preceding token —
+    a heuristic, so callers only trust it on files that passed it before.
+    """
+    stack: list[tuple[str, int]] = []     # (opener, line); "`" marks a template's ${ } nesting
+    line = 1
+    i, n = 0, len(source)
+    prev = ""                             # Last significant token, for the regex heuristic
+    while i < n:
+        c = source[i]
+        if c == "\n":
+            line += 1
+            i += 1
+            continue
+        if c in " \t\r":
+            i += 1
+            continue
+        if source.startswith("//", i):
+            end = source.find("\n", i)
+            i = n if end < 0 else end
+            continue
+        if source.startswith("/*", i):
+            end = source.find("*/", i + 2)
+            if end < 0:
+                return f"unterminated comment (line {line})"
+            line += source.count("\n", i, end)
+            i = end + 2
+            continue
+        if c in "'\"":
+            start_line = line
+            i += 1
+            while i < n and source[i] != c:
+                if source[i] == "\\":
+                    i += 1
+                elif source[i] == "\n":
+                    return f"unterminated string (line {start_line})"
+                i += 1
+            if i >= n:
+                return f"unterminated string (line {start_line})"
+            i += 1
+            prev = "str"
+            continue
+        if c == "`" or (c == "}" and stack and stack[-1][0] == "`"):
+            if c == "}":
+                stack.pop()
+            start_line = line
+            i += 1
+            while i < n and source[i] != "`":
+                if source[i] == "\\":
+                    i += 1
+                elif source.startswith("${", i):
+                    break
+                elif source[i] == "\n":
+                    line += 1
+                i += 1
+            if i >= n:
+                return f"unterminated template literal (line {start_line})"
+            if source[i] == "`":
+                i += 1
+                prev = "str"
+            else:
+                stack.append(("`", line))
+                i += 2
+                prev = "{"
+            continue
+        if c == "/" and (not prev or prev in _REGEX_PRECEDERS or prev in _REGEX_KEYWORDS):
+            start_line = line
+            i += 1
+            in_class = False
+            while i < n and (source[i] != "/" or in_class):
+                if source[i] == "\\":
+                    i += 1
+                elif source[i] == "[":
+                    in_class = True
+                elif source[i] == "]":
+                    in_class = False
+                elif source[i] == "\n":
+                    return f"unterminated regex (line {start_line})"
+                i += 1
+            i += 1
+            prev = "regex"
+            continue
+        if c in "([{":
+            stack.append((c, line))
+        elif c in _CLOSERS:
+            if not stack or stack[-1][0] != _CLOSERS[c]:
+                return f"unexpected '{c}' (line {line})"
+            stack.pop()
+        if c.isalnum() or c in "_$":
+            start = i
+            while i < n and (source[i].isalnum() or source[i] in "_$"):
+                i += 1
+            prev = source[start:i]
+            continue
+        prev = c
+        i += 1
+    if stack:
+        opener, opened_at = stack[-1]
+        return f"unclosed '{'${' if opener == '`' else opener}' (line {opened_at})"
+    return None
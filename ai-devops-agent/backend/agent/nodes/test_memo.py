@@ -0,0 +1,85 @@
+import os
+import shutil
+import subprocess
+import tempfile
+from agent.state import AgentState, TestMemo
+from agent.nodes.deadline import clamp_timeout
+from agent.nodes.utils import EXCLUDED_DIRS
+
+
+# Build output and tool caches written by the test run itself — never part
+# of the tested content, even in repos that do not ignore them
+_EXCLUDE_PATHSPECS = [f":(exclude,glob)**/{d}/**" for d in sorted(EXCLUDED_DIRS)] + [
+    ":(exclude,glob)**/*.pyc",
+]
+
+
+def workspace_hash(repo_path: str | None) -> str | None:
+    """
+    Content hash of the working tree — the git tree id of everything tracked
+    or untracked-but-not-ignored, staged into a scratch copy of the index so
+    the real index is untouched. Independent of commits: the same content
+    always hashes the same. None if the tree cannot be hashed.
+    """
+    if not repo_path:
+        return None
+    try:
+        index = _git(repo_path, "rev-parse", "--git-path", "index").strip()
+        with tempfile.TemporaryDirectory(prefix="cicd_index_") as tmp:
+            scratch = os.path.join(tmp, "index")
+            index = os.path.join(repo_path, index)
+            if os.path.exists(index):
+                shutil.copyfile(index, scratch)   # Keeps stat info → unchanged files are not re-read
+            env = {"GIT_INDEX_FILE": scratch}
+            _git(repo_path, "add", "-A", "--", ".", *_EXCLUDE_PATHSPECS, env=env)
+            return _git(repo_path, "write-tree", env=env).strip() or None
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"[AI-AGENT] WARNING: Cannot hash workspace — {e}")
+        return None
+
+
+def recall(state: AgentState, tree: str | None, need_output: bool = False) -> TestMemo | None:
+    """
+    The last test result if it was produced on this exact tree.
+
+    A failure is a valid verdict whatever the scope; a pass only if the whole
+    suite ran. need_output additionally requires the complete (collect-all)
+    output to still be on disk, for test_runner to hand to the classifier.
+    """
+    memo = state.test_memo
+    if tree is None or memo is None or memo.tree != tree:
+        return None
+    if need_output:
+        return memo if memo.output_path and os.path.exists(memo.output_path) else None
+    return memo if not memo.passed or memo.full_suite else None
+
+
+def remember(
+    state: AgentState,
+    tree: str | None,
+    passed: bool,
+    full_suite: bool,
+    output_path: str | None = None,
+) -> None:
+    if tree is None:
+        state.test_memo = None
+        return
+    state.test_memo = TestMemo(tree=tree, passed=passed, full_suite=full_suite, output_path=output_path)
+
+
+# ---------------------------------------------------------------------------
+# Internal helpers
+# ---------------------------------------------------------------------------
+
+def _git(repo_path: str, *args: str, env: dict = None) -> str:
+    result = subprocess.run(
+        ["git", *args],
+        cwd=repo_path,
+        capture_output=True,
+        text=True,
+        timeout=clamp_timeout(30),
+        env={**os.environ, **(env or {})},
+    )
+    if result.returncode != 0:
+        raise subprocess.SubprocessError(result.stderr.strip() or f"git {args[0]} failed")
+    return result.stdout
@@ -1,12 +1,29 @@
 import os
 import subprocess
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from agent.state import AgentState
-from agent.nodes.utils import run
+from agent.config import (
+    TEST_INTERRUPT_GRACE, TEST_TIMEOUT, LINT_TIMEOUT, INSTALL_TIMEOUT, STEP_DEADLINE,
+)
+from agent.nodes.deadline import clamp_timeout
+from agent.nodes.utils import (
+    CommandScope, run, emit_lines, reset_command_scope, set_command_scope, with_run_context,
+)
+from agent.nodes import lint_engine
+from agent.nodes.test_shards import run_sharded, sharding_plan
+from agent.nodes.lint_cache import seed_lint_cache
+from agent.nodes.test_memo import recall, remember, workspace_hash
+from agent.nodes.warm_runner import warm_test_cmd
+from agent.nodes.reports import (
+    FLAKE8_REPORT, LINT_LOG, OUTPUT_LOG, TEST_LOG, artifacts_dir, clear_reports, combine_logs, lint_report_text,
+    log_lines, read_tail, spill_files, with_lint_report, with_test_report,
+)
+from agent.nodes.dep_cache import prepare_python_env, prepare_node_modules, python_env_vars
+from agent.nodes.sandbox import sandbox_for
 
 
-# Max time per test/lint run — keep under 2 min to stay within speed bonus window
-DEFAULT_TEST_TIMEOUT = 120
-DEFAULT_LINT_TIMEOUT = 60
+# Seconds an abandoned step gets to unwind once its commands are killed
+_ABANDON_WAIT = 15
 
 
 def test_runner(state: AgentState) -> AgentState:
@@ -15,62 +32,188 @@ def test_runner(state: AgentState) -> AgentState:
     - Installs dependencies if needed
     - Runs linter (flake8/eslint) to surface LINTING/IMPORT errors
     - Runs test suite (pytest/npm test) to surface LOGIC/SYNTAX/TYPE errors
-    - Stores stdout/stderr separately in raw_test_output for classifier
+    - Spills lint+test output to the artifacts dir (raw_test_output_path);
+      raw_test_output keeps only the tail
+    - Tools also write structured reports (flake8/ESLint/JUnit) to the run's
+      artifacts dir, which failure_classifier prefers over console text
+    - Reuses ci_monitor's complete run when the tree has not changed since
     - Does NOT increment iteration (that's ci_monitor's job)
     """
 
     # Install dependencies before running tests
     _install_dependencies(state)
 
-    combined_output = []
+    env = python_env_vars(state.python_env)
+    run_lint = bool(state.lint_cmd) and not state.lint_checked_once
 
-    # 1. Run linter first — surfaces LINTING, IMPORT, INDENTATION errors
-    if state.lint_cmd and not state.lint_checked_once:
-        lint_out = _run_command(
-            cmd=state.lint_cmd,
+    tree = workspace_hash(state.repo_path) if state.test_cmd else None
+    memo = None if run_lint else recall(state, tree, need_output=True)
+    if memo:
+        print("[AI-AGENT] Tree unchanged since the last test run — reusing its output")
+        state.test_passed = memo.passed
+        state.raw_test_output_path = memo.output_path
+        state.raw_test_output = read_tail(memo.output_path) or None
+        return state
+
+    # Lint and tests are independent read-only processes — run them side by
+    # side so the step costs max(lint, test) instead of the sum. Each keeps its
+    # own timeout, clamped to the combined step deadline and the run budget.
+    step_deadline = clamp_timeout(STEP_DEADLINE)
+    lint_timeout = min(LINT_TIMEOUT, step_deadline)
+    test_timeout = min(TEST_TIMEOUT, step_deadline)
+
+    # Full-suite runs are sharded across cores
+    shards, shard_files = sharding_plan(state) if state.test_cmd else (1, [])
+
+    report_dir = artifacts_dir(state)
+    clear_reports(report_dir)
+    lint_log = os.path.join(report_dir, LINT_LOG)
+    test_log = os.path.join(report_dir, TEST_LOG)
+    test_cmd = warm_test_cmd(state, state.test_cmd)
+    if test_cmd and shards <= 1:
+        test_cmd = with_test_report(test_cmd, report_dir)   # Sharded runs write their own reports
+
+    # Every command either step starts, so one that overruns can be killed
+    scope = CommandScope()
+    scope_token = set_command_scope(scope)
+    pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="test_runner")
+    try:
+        # 1. Linter — surfaces LINTING, IMPORT, INDENTATION errors
+        lint_future = pool.submit(
+            with_run_context(_run_lint),
+            state=state,
+            report_dir=report_dir,
+            timeout=lint_timeout,
+            env=env,
+            spill=lint_log,
+        ) if run_lint else None
+
+        # 2. Test suite — surfaces SYNTAX, LOGIC, TYPE_ERROR
+        test_future = pool.submit(
+            with_run_context(_run_tests),
+            cmd=test_cmd,
             cwd=state.repo_path,
-            timeout=DEFAULT_LINT_TIMEOUT,
-            label="LINT",
-        )
-        if lint_out:
-            combined_output.append(lint_out)
+            timeout=test_timeout,
+            env=env,
+            shards=shards,
+            test_files=shard_files,
+            history_key=state.repo_url,
+            report_dir=report_dir,
+            spill=test_log,
+        ) if state.test_cmd else None
+
+        # One wait for both. A step still running past the deadline has its
+        # commands killed, and gets a moment to return before its logs are read
+        futures = [f for f in (lint_future, test_future) if f is not None]
+        _, overran = wait(futures, timeout=step_deadline)
+        if overran:
+            print(f"[AI-AGENT] WARNING: Lint/test step exceeded combined deadline ({step_deadline}s) — "
+                  "killing its commands")
+            scope.stop()
+            wait(overran, timeout=_ABANDON_WAIT)
+    finally:
+        reset_command_scope(scope_token)
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    _result_or(lint_future, "", "LINT")
+    _, test_passed = _result_or(test_future, ("", False), "TEST")
+
+    if run_lint:
+        # JSON-only lint reports (ESLint) print nothing — render them back to lines
+        report_text = lint_report_text(report_dir, state.repo_path)
+        if report_text:
+            with open(spill_files(lint_log)[0], "a") as f:
+                f.write(report_text + "\n")
         state.lint_checked_once = True
+        # Baseline for ci_monitor's incremental re-lint
+        seed_lint_cache(state, log_lines(spill_files(lint_log)))
 
-    # 2. Run test suite — surfaces SYNTAX, LOGIC, TYPE_ERROR
     if not state.test_cmd:
         state.test_passed = False
         state.raw_test_output = "No supported test runner detected"
+        state.raw_test_output_path = None
         return state
 
-    test_out, test_passed = _run_tests(
-        cmd=state.test_cmd,
-        cwd=state.repo_path,
-        timeout=DEFAULT_TEST_TIMEOUT,
-    )
-
-    if test_out:
-        combined_output.append(test_out)
+    # Merge in a fixed order (lint first, then tests) regardless of which
+    # process finished first — failure_classifier relies on a stable layout.
+    # The merged log stays on disk; state carries its path and a short tail.
+    output_log = os.path.join(report_dir, OUTPUT_LOG)
+    combine_logs(output_log, (spill_files(lint_log) if run_lint else []) + spill_files(test_log))
 
     # Update state
-    state.test_passed = test_passed and not combined_output[0:1]  # passed only if lint+tests clean
     state.test_passed = test_passed  # test_passed is primary signal; lint failures caught by classifier
-    state.raw_test_output = "\n".join(combined_output).strip() or None
+    state.raw_test_output_path = output_log
+    state.raw_test_output = read_tail(output_log) or None
+    remember(state, tree, test_passed, full_suite=True, output_path=output_log)
 
     return state
 
 
+def run_test_suite(
+    state: AgentState,
+    test_cmd: str,
+    env: dict = None,
+    shards: int = 1,
+    shard_files: list[str] = None,
+) -> bool:
+    """
+    A test run outside the lint step that leaves the same artifacts as
+    test_runner — JUnit reports and the spilled log at raw_test_output_path —
+    so a failing run can go straight to failure_classifier. Used by
+    ci_monitor. Returns passed.
+    """
+    report_dir = artifacts_dir(state)
+    clear_reports(report_dir)
+    test_log = os.path.join(report_dir, TEST_LOG)
+    if shards <= 1:
+        test_cmd = with_test_report(test_cmd, report_dir)
+
+    _, passed = _run_tests(
+        test_cmd, state.repo_path, timeout=TEST_TIMEOUT, env=env,
+        shards=shards, test_files=shard_files, history_key=state.repo_url,
+        report_dir=report_dir, spill=test_log,
+    )
+
+    output_log = os.path.join(report_dir, OUTPUT_LOG)
+    combine_logs(output_log, spill_files(test_log))
+    state.raw_test_output_path = output_log
+    state.raw_test_output = read_tail(output_log) or None
+    return passed
+
+
 # ---------------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------------
 
-def _run_tests(cmd: str, cwd: str, timeout: int) -> tuple[str, bool]:
+def _run_tests(
+    cmd: str,
+    cwd: str,
+    timeout: int,
+    env: dict = None,
+    shards: int = 1,
+    test_files: list[str] = None,
+    history_key: str = "",
+    report_dir: str | None = None,
+    spill: str | None = None,
+) -> tuple[str, bool]:
     """
     Runs the test command, returns (output, passed).
+    With shards > 1 the test files are split across parallel pytest processes.
     Validates that tests were actually collected — 
     exit 0 with no tests collected is NOT a pass.
+    A run that overruns its timeout is interrupted, not killed, so the
+    failures collected so far still reach the classifier.
     """
-    code, stdout, stderr = run(cmd, cwd=cwd, timeout=timeout)
-    output = _merge_output(stdout, stderr)
+    if shards > 1 and test_files:
+        code, output = run_sharded(cmd, cwd, test_files, shards, history_key, timeout, env,
+                                   grace=TEST_INTERRUPT_GRACE, report_dir=report_dir)
+        if spill:
+            with open(spill_files(spill)[0], "w") as f:
+                f.write(output + "\n")
+    else:
+        code, stdout, stderr = run(cmd, cwd=cwd, timeout=timeout, env=env,
+                                   grace=TEST_INTERRUPT_GRACE, spill=spill)
+        output = _merge_output(stdout, stderr)
 
     # pytest-specific: "no tests ran" should not count as passed
     if code == 0 and "no tests ran" in output.lower():
@@ -82,13 +225,54 @@ def _run_tests(cmd: str, cwd: str, timeout: int) -> tuple[str, bool]:
     return output, passed
 
 
-def _run_command(cmd: str, cwd: str, timeout: int, label: str) -> str:
+def _result_or(future: Future | None, default, label: str):
+    """
+    A concurrent step's result once the combined deadline has been waited
+    out. Subprocess timeouts normally fire first; this is the backstop.
+    """
+    if future is None:
+        return default
+    if not future.done():
+        print(f"[AI-AGENT] WARNING: {label} did not stop after its commands were killed — using no result")
+        return default
+    try:
+        return future.result()
+    except Exception as e:
+        print(f"[AI-AGENT] WARNING: {label} step failed: {e}")
+    return default
+
+
+def _run_lint(state: AgentState, report_dir: str, timeout: int, env: dict = None, spill: str = None) -> str:
+    """
+    flake8 runs in-process (lint_engine) when it can, leaving the same
+    report and console log the subprocess would; anything else is spawned.
+    """
+    if lint_engine.handles(state.language, state.lint_cmd):
+        try:
+            lines = lint_engine.format_issues(lint_engine.lint_repo(state.repo_path, state.lint_cmd, timeout=timeout))
+        except Exception as e:
+            print(f"[AI-AGENT] WARNING: In-process lint failed ({e}) — running flake8")
+        else:
+            text = "".join(line + "\n" for line in lines)
+            for path in (os.path.join(report_dir, FLAKE8_REPORT), spill_files(spill)[0]):
+                with open(path, "w") as f:
+                    f.write(text)
+            emit_lines(lines)
+            return text.strip()
+
+    return _run_command(
+        cmd=with_lint_report(state.lint_cmd, report_dir),
+        cwd=state.repo_path, timeout=timeout, label="LINT", env=env, spill=spill,
+    )
+
+
+def _run_command(cmd: str, cwd: str, timeout: int, label: str, env: dict = None, spill: str = None) -> str:
     """
     Runs a generic command (linter etc.) and returns combined output.
     Non-zero exit is expected for linters — don't treat as crash.
     """
     try:
-        code, stdout, stderr = run(cmd, cwd=cwd, timeout=timeout)
+        code, stdout, stderr = run(cmd, cwd=cwd, timeout=timeout, env=env, spill=spill)
         output = _merge_output(stdout, stderr)
         if output:
             print(f"[AI-AGENT] {label} output ({len(output.splitlines())} lines)")
@@ -109,22 +293,40 @@ def _install_dependencies(state: AgentState) -> None:
     requirements_txt = os.path.join(repo_path, "requirements.txt")
     pyproject = os.path.join(repo_path, "pyproject.toml")
     package_json = os.path.join(repo_path, "package.json")
+    # Host-side envs are invisible inside a container — install into it
+    # instead; the session keeps what was installed for the rest of the run
+    sandbox = sandbox_for(repo_path)
+    isolated = sandbox is not None and sandbox.isolated
 
-    if os.path.exists(requirements_txt):
-        print("[AI-AGENT] Installing Python dependencies from requirements.txt...")
-        run("pip install -r requirements.txt -q", cwd=repo_path, timeout=120)
-    elif os.path.exists(pyproject):
-        print("[AI-AGENT] Installing Python dependencies from pyproject.toml...")
-        run("pip install -e . -q", cwd=repo_path, timeout=120)
+    if state.language == "python" and not isolated:
+        # Isolated per-run env from the content-addressed cache —
+        # installs deps + flake8/pytest once per dependency-file hash
+        state.python_env = prepare_python_env(repo_path)
+
+    if state.python_env is None:
+        # Fallback: install into the server's interpreter (legacy behaviour)
+        if os.path.exists(requirements_txt):
+            print("[AI-AGENT] Installing Python dependencies from requirements.txt...")
+            run("pip install -r requirements.txt -q", cwd=repo_path, timeout=INSTALL_TIMEOUT)
+        elif os.path.exists(pyproject):
+            print("[AI-AGENT] Installing Python dependencies from pyproject.toml...")
+            run("pip install -e . -q", cwd=repo_path, timeout=INSTALL_TIMEOUT)
 
     if os.path.exists(package_json):
         print("[AI-AGENT] Installing Node dependencies from package.json...")
-        package_lock = os.path.join(repo_path, "package-lock.json")
-        npm_cmd = "npm ci --silent --no-audit --no-fund" if os.path.exists(package_lock) else "npm install --silent --no-audit --no-fund"
-        run(npm_cmd, cwd=repo_path, timeout=180)
+        if isolated:
+            # The lockfile pins the tree — only fall back to resolving without one
+            npm = "ci" if os.path.exists(os.path.join(repo_path, "package-lock.json")) else "install"
+            run(f"npm {npm} --silent", cwd=repo_path, timeout=INSTALL_TIMEOUT)
+        else:
+            prepare_node_modules(repo_path)
+
+    if state.language == "python" and state.python_env is None:
+        run("pip install flake8 pytest -q", cwd=repo_path, timeout=INSTALL_TIMEOUT)
 
-    if state.language == "python":
-        run("pip install flake8 pytest -q", cwd=repo_path, timeout=60)
+    if isolated:
+        # Everything that needed the network is installed — the repo's own code runs without it
+        sandbox.lock_network()
 
     state.deps_installed = True  # Mark as done — never install again
 
@@ -0,0 +1,249 @@
+import configparser
+import hashlib
+import json
+import os
+import shlex
+import shutil
+import tempfile
+import tomllib
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from agent.config import DEP_CACHE_DIR, TEST_SHARDS
+from agent.state import AgentState
+from agent.nodes.utils import run, with_run_context
+from agent.nodes.repo_index import get_repo_index, is_test_file
+
+
+# pytest exit code when a shard's files contained no tests
+_NO_TESTS_COLLECTED = 5
+
+# JUnit report name per shard — matches reports.py's pytest*.xml pattern
+_SHARD_REPORT_PREFIX = "pytest-shard-"
+
+# Assumed duration for test files with no history yet
+_DEFAULT_FILE_SECONDS = 1.0
+
+# pytest ini files and the section each keeps its settings in
+_PYTEST_INI_SECTIONS = (("pytest.ini", "pytest"), ("tox.ini", "pytest"), ("setup.cfg", "tool:pytest"))
+
+# Settings that change which files pytest collects. Shards are given an
+# explicit file list, which would bypass them.
+_COLLECTION_KEYS = ("testpaths", "norecursedirs", "python_files")
+_COLLECTION_ADDOPTS = ("--ignore", "--deselect")
+
+
+def resolve_shard_count(requested: int | None) -> int:
+    """Per-run value wins over TEST_SHARDS; 0 means one shard per core (max 4)."""
+    count = requested if requested is not None else TEST_SHARDS
+    if count <= 0:
+        count = min(os.cpu_count() or 1, 4)
+    return count
+
+
+def sharding_plan(state: AgentState) -> tuple[int, list[str]]:
+    """
+    Returns (shard_count, test_files) for a full pytest run, or (1, []) when
+    sharding does not apply (non-pytest runner, one core, < 2 test files,
+    or a repo that configures which files pytest collects).
+    """
+    if state.language != "python" or "pytest" not in (state.test_cmd or ""):
+        return 1, []
+    shards = resolve_shard_count(state.test_shards)
+    if shards <= 1:
+        return 1, []
+    index = get_repo_index(state.repo_path)
+    test_files = sorted(f for f in index.files if is_test_file(f))
+    if len(test_files) < 2:
+        return 1, []
+    reason = _custom_collection(state.repo_path, index.files)
+    if reason:
+        print(f"[AI-AGENT] Not sharding tests: repo configures collection ({reason})")
+        return 1, []
+    return shards, test_files
+
+
+def run_sharded(
+    test_cmd: str,
+    repo_path: str,
+    test_files: list[str],
+    shards: int,
+    history_key: str,
+    timeout: int,
+    env: dict = None,
+    grace: int = 0,
+    report_dir: str | None = None,
+) -> tuple[int, str]:
+    """
+    Runs pytest over test_files split into `shards` concurrent processes,
+    balanced by each file's historical duration. No pytest-xdist needed in
+    the target repo — every shard is a plain pytest invocation on a file list.
+
+    Returns (exit_code, merged_output). Output is merged in shard order so
+    failure_classifier always sees the same layout. With report_dir set, the
+    shards' JUnit reports are kept there for failure_classifier.
+    """
+    durations = _load_durations(history_key)
+    plan = plan_shards(test_files, shards, durations)
+    keep_reports = report_dir is not None
+    report_dir = report_dir or tempfile.mkdtemp(prefix="cicd_shards_")
+
+    @with_run_context
+    def _run_shard(i: int, files: list[str]) -> tuple[int, str]:
+        report = os.path.join(report_dir, f"{_SHARD_REPORT_PREFIX}{i}.xml")
+        cmd = (
+            f"{test_cmd} -p no:cacheprovider -o junit_family=xunit1 "
+            f"--junitxml={shlex.quote(report)} "
+            + " ".join(shlex.quote(f) for f in files)
+        )
+        code, stdout, stderr = run(cmd, cwd=repo_path, timeout=timeout, env=env, grace=grace)
+        output = "\n".join(p.strip() for p in (stdout, stderr) if p and p.strip())
+        return code, output
+
+    print(f"[AI-AGENT] Sharding {len(test_files)} test files across {len(plan)} workers")
+    try:
+        with ThreadPoolExecutor(max_workers=len(plan), thread_name_prefix="test_shard") as pool:
+            results = list(pool.map(lambda args: _run_shard(*args), enumerate(plan)))
+        _save_durations(history_key, durations, _read_durations(report_dir))
+    finally:
+        if not keep_reports:
+            shutil.rmtree(report_dir, ignore_errors=True)
+
+    return _merge_results(results)
+
+
+def plan_shards(test_files: list[str], shards: int, durations: dict[str, float]) -> list[list[str]]:
+    """
+    Longest-processing-time-first partition: each file goes to the currently
+    lightest shard. Files without history get the median known duration.
+    """
+    known = sorted(durations.values())
+    default = known[len(known) // 2] if known else _DEFAULT_FILE_SECONDS
+    weighted = sorted(test_files, key=lambda f: (-durations.get(f, default), f))
+
+    shards = max(1, min(shards, len(test_files)))
+    loads = [0.0] * shards
+    plan: list[list[str]] = [[] for _ in range(shards)]
+    for f in weighted:
+        i = loads.index(min(loads))
+        plan[i].append(f)
+        loads[i] += durations.get(f, default)
+    return [sorted(files) for files in plan if files]
+
+
+# ---------------------------------------------------------------------------
+# Internal helpers
+# ---------------------------------------------------------------------------
+
+def _custom_collection(repo_path: str, files) -> str | None:
+    """
+    The first pytest setting found that narrows collection — testpaths,
+    norecursedirs, python_files, --ignore in addopts, or a conftest's
+    collect_ignore — or None if pytest would collect every test_*.py.
+    """
+    for name, section in _PYTEST_INI_SECTIONS:
+        path = os.path.join(repo_path, name)
+        if not os.path.exists(path):
+            continue
+        parser = configparser.ConfigParser(interpolation=None)
+        try:
+            parser.read(path)
+        except configparser.Error:
+            return f"unreadable {name}"
+        if parser.has_section(section):
+            reason = _collection_setting(dict(parser.items(section)))
+            if reason:
+                return f"{reason} in {name}"
+
+    pyproject = os.path.join(repo_path, "pyproject.toml")
+    if os.path.exists(pyproject):
+        try:
+            with open(pyproject, "rb") as f:
+                options = tomllib.load(f).get("tool", {}).get("pytest", {}).get("ini_options", {})
+        except (OSError, tomllib.TOMLDecodeError):
+            return "unreadable pyproject.toml"
+        reason = _collection_setting(options)
+        if reason:
+            return f"{reason} in pyproject.toml"
+
+    for rel in files:
+        if rel.rsplit("/", 1)[-1] != "conftest.py":
+            continue
+        try:
+            with open(os.path.join(repo_path, rel), "r", errors="replace") as f:
+                if "collect_ignore" in f.read():
+                    return f"collect_ignore in {rel}"
+        except OSError:
+            continue
+    return None
+
+
+def _collection_setting(options: dict) -> str | None:
+    for key in _COLLECTION_KEYS:
+        if options.get(key):
+            return key
+    addopts = options.get("addopts") or ""
+    if isinstance(addopts, list):
+        addopts = " ".join(addopts)
+    if any(opt in addopts for opt in _COLLECTION_ADDOPTS):
+        return "addopts"
+    return None
+
+
+def _merge_results(results: list[tuple[int, str]]) -> tuple[int, str]:
+    ran = [(code, out) for code, out in results if code != _NO_TESTS_COLLECTED]
+    if not ran:
+        return _NO_TESTS_COLLECTED, "\n".join(out for _, out in results)
+
+    failed = [code for code, _ in ran if code != 0]
+    code = max(failed) if failed else 0
+    output = "\n".join(out for _, out in ran if out)
+    return code, output
+
+
+def _read_durations(report_dir: str) -> dict[str, float]:
+    """Sums testcase times per file from the shards' JUnit XML reports."""
+    per_file: dict[str, float] = {}
+    for name in os.listdir(report_dir):
+        if not name.startswith(_SHARD_REPORT_PREFIX):
+            continue
+        try:
+            root = ET.parse(os.path.join(report_dir, name)).getroot()
+        except (ET.ParseError, OSError):
+            continue
+        for case in root.iter("testcase"):
+            f = (case.get("file") or "").replace("\\", "/")
+            if f:
+                per_file[f] = per_file.get(f, 0.0) + float(case.get("time") or 0.0)
+    return per_file
+
+
+def _history_path(history_key: str) -> str:
+    digest = hashlib.sha256(history_key.encode()).hexdigest()[:16]
+    return os.path.join(DEP_CACHE_DIR, "test_durations", f"{digest}.json")
+
+
+def _load_durations(history_key: str) -> dict[str, float]:
+    try:
+        with open(_history_path(history_key)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_durations(history_key: str, previous: dict[str, float], measured: dict[str, float]) -> None:
+    if not measured:
+        return
+    merged = dict(previous)
+    for f, seconds in measured.items():
+        # Smooth so one slow run doesn't reshuffle every shard
+        merged[f] = round(0.5 * merged[f] + 0.5 * seconds, 3) if f in merged else round(seconds, 3)
+
+    path = _history_path(history_key)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(merged, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"[AI-AGENT] WARNING: Could not save test durations: {e}")
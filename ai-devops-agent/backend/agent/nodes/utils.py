@@ -2,7 +2,28 @@ import subprocess
 import shlex
 import datetime
 import os
+import signal
+import threading
+import time
+import atexit
+import contextvars
+from collections import deque
+from contextvars import ContextVar, Token
 from datetime import timezone
+from typing import Callable, Iterable
+from agent.config import OUTPUT_TAIL_BYTES, CMD_CPU_LIMIT, CMD_MEMORY_LIMIT_MB, CMD_MAX_OPEN_FILES
+from agent.nodes.deadline import current_deadline
+
+
+# ---------------------------------------------------------------------------
+# Directories never treated as repo source — used only when git's own index
+# is unavailable (not a git checkout, git missing, etc.)
+# ---------------------------------------------------------------------------
+EXCLUDED_DIRS = {
+    ".git", "__pycache__", "node_modules", ".venv", "venv",
+    "env", ".env", "dist", "build", ".tox", ".mypy_cache",
+    ".pytest_cache", "target",  # Java/Maven build dir
+}
 
 
 # ---------------------------------------------------------------------------
@@ -21,6 +42,9 @@ def run(
     cwd: str = None,
     timeout: int = 120,
     safe: bool = True,
+    env: dict = None,
+    grace: int = 0,
+    spill: str = None,
 ) -> tuple[int, str, str]:
     """
     Runs a shell command safely.
@@ -28,74 +52,323 @@ def run(
     Args:
         cmd: Command string to run
         cwd: Working directory
-        timeout: Max seconds before kill
+        timeout: Max seconds before kill — clamped to the run's remaining budget
         safe: If True, validates command against allowlist
+        env: Extra environment variables layered over os.environ
+        grace: On timeout, seconds to let the command wind down after SIGINT
+               before it is killed — pytest uses this to print the failures
+               it has collected so far. 0 = kill immediately.
+        spill: Path prefix — the complete streams are also written to
+               <spill>.stdout / <spill>.stderr while the command runs
     
     Returns:
-        (returncode, stdout, stderr)
+        (returncode, stdout, stderr) — on timeout, whatever output the
+        command produced before it was stopped, with returncode 1
+
+    The command runs in its own session/process group under the CMD_*
+    resource limits. Whatever it leaves behind in that group is killed when
+    it exits, and its exit status and resource usage go to the command sink.
+    Repo-derived (safe) commands run inside the active sandbox session, if any.
     """
     # Validate command against allowlist
     if safe and not _is_allowed(cmd):
         print(f"[AI-AGENT] BLOCKED: Command not in allowlist: {cmd!r}")
         return 1, "", f"Command blocked by security policy: {cmd}"
 
+    deadline = current_deadline()
+    if deadline.expired():
+        print(f"[AI-AGENT] SKIPPED (run deadline reached): {cmd!r}")
+        return 1, "", "Skipped: run deadline reached"
+    timeout = deadline.clamp(timeout)
+
+    scope = _COMMAND_SCOPE.get()
+    if scope is not None and scope.stopped:
+        print(f"[AI-AGENT] SKIPPED (step abandoned): {cmd!r}")
+        return 1, "", "Skipped: step abandoned"
+
     print(f"[AI-AGENT] RUN: {cmd!r} (cwd={cwd})")
 
+    sandbox = _SANDBOX.get() if safe else None
+    if sandbox is not None:
+        launch, env, wait_timeout = sandbox.command(cmd, cwd, env, timeout, grace)
+    else:
+        launch, wait_timeout = with_rlimits(cmd), timeout
+
+    started = time.monotonic()
     try:
-        result = subprocess.run(
-            cmd,
+        proc = subprocess.Popen(
+            launch,
             shell=True,
             cwd=cwd,
-            capture_output=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
             text=True,
-            timeout=timeout,
-            env={**os.environ},   # Inherit env but don't pollute
+            errors="replace",
+            bufsize=1,                               # Line-buffered → lines arrive as printed
+            # Inherit env but don't pollute; unbuffered so Python tools stream live
+            env={"PYTHONUNBUFFERED": "1", **os.environ, **(env or {})},
+            start_new_session=(os.name == "posix"),   # Own process group → stoppable as a whole
         )
-
-        if result.returncode != 0:
-            print(f"[AI-AGENT] EXIT {result.returncode}: {cmd!r}")
-
-        return result.returncode, result.stdout, result.stderr
-
-    except subprocess.TimeoutExpired:
-        print(f"[AI-AGENT] TIMEOUT ({timeout}s): {cmd!r}")
-        return 1, "", f"Command timed out after {timeout}s"
     except Exception as e:
         print(f"[AI-AGENT] ERROR: {cmd!r} → {e}")
         return 1, "", str(e)
+    _LIVE_PROCESSES.add(proc)
+    if scope is not None and not scope.add(proc):
+        _signal_group(proc, signal.SIGKILL if os.name == "posix" else signal.SIGTERM)   # Stopped meanwhile
+
+    # Each stream is drained line by line as the process runs: lines go to
+    # the run's line sink (live logs) and only a bounded tail stays in memory
+    sink = _LINE_SINK.get()
+    tails = {
+        name: OutputTail(spill_file=_open_spill(f"{spill}.{name}") if spill else None)
+        for name in ("stdout", "stderr")
+    }
+    readers = [
+        threading.Thread(
+            target=_drain, args=(pipe, tails[name], name, sink),
+            name=f"run-{name}", daemon=True,
+        )
+        for name, pipe in (("stdout", proc.stdout), ("stderr", proc.stderr))
+    ]
+    for reader in readers:
+        reader.start()
+
+    exited = _watch_exit(proc)
+    timed_out = False
+    usage = None
+    try:
+        if not exited.wait(wait_timeout):
+            print(f"[AI-AGENT] TIMEOUT ({timeout}s): {cmd!r}")
+            timed_out = True
+            _stop_process(proc, exited, grace)
+    except BaseException:
+        _stop_process(proc, exited, 0)
+        raise
+    finally:
+        # The leader is a zombie until reaped, so its group id cannot be
+        # reused yet — anything still in the group is an orphan
+        _signal_group(proc, signal.SIGKILL if os.name == "posix" else signal.SIGTERM)
+        usage = _reap(proc, exited)
+        _LIVE_PROCESSES.discard(proc)
+        if scope is not None:
+            scope.discard(proc)
+        for reader in readers:
+            reader.join(timeout=5)
+
+    _record_command(cmd, proc.returncode, timed_out, time.monotonic() - started, usage)
+    stdout, stderr = tails["stdout"].text(), tails["stderr"].text()
+    if timed_out:
+        return 1, stdout, (stderr + f"\nCommand timed out after {timeout}s").lstrip()
 
+    if proc.returncode != 0:
+        print(f"[AI-AGENT] EXIT {proc.returncode}: {cmd!r}")
+
+    return proc.returncode, stdout, stderr
+
+
+# ---------------------------------------------------------------------------
+# Live output — a per-run sink receives every line any command prints
+# ---------------------------------------------------------------------------
+
+_LINE_SINK: ContextVar[Callable[[str, str], None] | None] = ContextVar("line_sink", default=None)
+
+
+def set_line_sink(sink: Callable[[str, str], None] | None) -> Token:
+    """Routes (stream, line) from every run() in this context to sink. Returns a reset token."""
+    return _LINE_SINK.set(sink)
+
+
+def reset_line_sink(token: Token) -> None:
+    _LINE_SINK.reset(token)
+
+
+def emit_lines(lines: Iterable[str], stream: str = "stdout") -> None:
+    """Sends output produced without a subprocess (in-process tools) to the line sink."""
+    sink = _LINE_SINK.get()
+    if sink is not None:
+        for line in lines:
+            sink(stream, line)
+
+
+# ---------------------------------------------------------------------------
+# Command accounting — a per-run sink receives one record per finished command
+# ---------------------------------------------------------------------------
+
+_COMMAND_SINK: ContextVar[Callable[[dict], None] | None] = ContextVar("command_sink", default=None)
+
+
+def set_command_sink(sink: Callable[[dict], None] | None) -> Token:
+    """
+    Routes a record per finished run() in this context to sink:
+    command, exit_code, timed_out, wall_seconds, cpu_seconds, max_rss_mb
+    (cpu/rss are None where the platform cannot report them).
+    """
+    return _COMMAND_SINK.set(sink)
+
+
+def reset_command_sink(token: Token) -> None:
+    _COMMAND_SINK.reset(token)
+
+
+def kill_running_commands() -> None:
+    """Kills the process group of every command still running (shutdown / cancel)."""
+    for proc in list(_LIVE_PROCESSES):
+        _signal_group(proc, signal.SIGKILL if os.name == "posix" else signal.SIGTERM)
+
+
+# Commands currently running, so nothing outlives the agent process
+_LIVE_PROCESSES: set[subprocess.Popen] = set()
+atexit.register(kill_running_commands)
+
+
+# ---------------------------------------------------------------------------
+# Command scope — the commands a step started, so it can stop them all
+# ---------------------------------------------------------------------------
+
+class CommandScope:
+    """
+    Commands run() starts while the scope is set, on any thread that was
+    handed the context. stop() kills them, and run() then refuses new ones.
+    """
+
+    def __init__(self):
+        self.stopped = False
+        self._procs: set[subprocess.Popen] = set()
+        self._lock = threading.Lock()
+
+    def add(self, proc: subprocess.Popen) -> bool:
+        """Tracks proc; False if the scope was stopped and proc must not run."""
+        with self._lock:
+            if self.stopped:
+                return False
+            self._procs.add(proc)
+            return True
+
+    def discard(self, proc: subprocess.Popen) -> None:
+        with self._lock:
+            self._procs.discard(proc)
+
+    def stop(self) -> None:
+        with self._lock:
+            self.stopped = True
+            procs = list(self._procs)
+        for proc in procs:
+            _signal_group(proc, signal.SIGKILL if os.name == "posix" else signal.SIGTERM)
+
+
+_COMMAND_SCOPE: ContextVar[CommandScope | None] = ContextVar("command_scope", default=None)
+
+
+def set_command_scope(scope: CommandScope | None) -> Token:
+    return _COMMAND_SCOPE.set(scope)
+
+
+def reset_command_scope(token: Token) -> None:
+    _COMMAND_SCOPE.reset(token)
+
+
+# ---------------------------------------------------------------------------
+# Sandbox — the run's SandboxSession (agent/nodes/sandbox.py), set per node
+# ---------------------------------------------------------------------------
 
-def run_sandboxed(
+_SANDBOX: ContextVar = ContextVar("sandbox", default=None)
+
+
+def set_sandbox(session) -> Token:
+    return _SANDBOX.set(session)
+
+
+def reset_sandbox(token: Token) -> None:
+    _SANDBOX.reset(token)
+
+
+def with_run_context(fn: Callable) -> Callable:
+    """
+    Binds the caller's run context (line sink, command sink, command scope,
+    sandbox, deadline) to fn, for work handed to another thread — worker
+    threads start with an empty context.
+    """
+    context = contextvars.copy_context()
+
+    def bound(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+
+    return bound
+
+
+class OutputTail:
+    """
+    Keeps the last max_bytes of a stream. Older lines are dropped and
+    counted, so a huge log costs bounded memory. With spill_file set, every
+    line is also written there — the full stream lives on disk, not in RAM.
+    """
+
+    def __init__(self, max_bytes: int = OUTPUT_TAIL_BYTES, spill_file=None):
+        self.max_bytes = max_bytes
+        self.spill_file = spill_file
+        self.lines: deque[str] = deque()
+        self.size = 0
+        self.dropped = 0
+
+    def append(self, line: str) -> None:
+        if self.spill_file is not None:
+            self.spill_file.write(line)
+        self.lines.append(line)
+        self.size += len(line)
+        while self.size > self.max_bytes and len(self.lines) > 1:
+            self.size -= len(self.lines.popleft())
+            self.dropped += 1
+
+    def text(self) -> str:
+        body = "".join(self.lines)
+        if self.dropped:
+            return f"[... {self.dropped} earlier lines omitted ...]\n{body}"
+        return body
+
+
+def with_rlimits(
     cmd: str,
-    repo_path: str,
-    timeout: int = 120,
-    image: str = "python:3.11-slim",
-) -> tuple[int, str, str]:
+    cpu_seconds: int = CMD_CPU_LIMIT,
+    memory_mb: int = CMD_MEMORY_LIMIT_MB,
+    open_files: int = CMD_MAX_OPEN_FILES,
+    data_mb: int = 0,
+) -> str:
+    """
+    Prefixes the shell command with `ulimit` for each limit > 0 (CMD_* by
+    default). memory_mb caps address space, data_mb the data segment
+    (heap). Set in the shell rather than a preexec_fn, which is unsafe
+    while other threads (shards, lint alongside tests) are running.
     """
-    Runs a command inside a Docker container for sandboxed execution.
-    Mounts repo_path as /workspace inside the container.
-    Required by PS for untrusted code execution.
+    if os.name != "posix":
+        return cmd
+    limits = []
+    if cpu_seconds > 0:
+        limits.append(f"ulimit -t {cpu_seconds}")
+    if memory_mb > 0:
+        limits.append(f"ulimit -v {memory_mb * 1024}")
+    if data_mb > 0:
+        limits.append(f"ulimit -d {data_mb * 1024}")
+    if open_files > 0:
+        limits.append(f"ulimit -n {open_files}")
+    # One option per ulimit call — dash accepts no more
+    return "; ".join(limits + [cmd])
 
-    Falls back to run() if Docker is unavailable.
+
+def list_repo_files(repo_dir: str, include_untracked: bool = True) -> list[str]:
     """
-    docker_cmd = (
-        f"docker run --rm "
-        f"--network=none "           # No network access inside sandbox
-        f"--memory=512m "            # Memory limit
-        f"--cpus=1 "                 # CPU limit
-        f"-v {repo_path}:/workspace "
-        f"-w /workspace "
-        f"{image} "
-        f"{cmd}"
-    )
+    Lists the repo's source files as repo-relative POSIX paths.
 
-    # Check Docker is available
-    check_code, _, _ = run("docker info", safe=False, timeout=10)
-    if check_code != 0:
-        print("[AI-AGENT] WARNING: Docker unavailable — running unsandboxed")
-        return run(cmd, cwd=repo_path, timeout=timeout, safe=True)
+    Driven by git's own index (`git ls-files -z`), so anything the repo
+    ignores via .gitignore — coverage/, .next/, out/, vendored SDKs — is
+    skipped without a hardcoded list. Untracked-but-not-ignored files are
+    included when include_untracked is True.
 
-    return run(docker_cmd, cwd=repo_path, timeout=timeout, safe=False)
+    Falls back to os.walk with EXCLUDED_DIRS if git cannot list the tree.
+    """
+    files = _git_ls_files(repo_dir, include_untracked)
+    if files is not None:
+        return files
+    return _walk_repo_files(repo_dir)
 
 
 def now() -> str:
@@ -136,3 +409,156 @@ def _is_allowed(cmd: str) -> bool:
         return base in ALLOWED_COMMANDS
     except Exception:
         return False
+
+
+def _drain(pipe, tail: OutputTail, stream: str, sink) -> None:
+    try:
+        for line in iter(pipe.readline, ""):
+            tail.append(line)
+            if sink is not None:
+                try:
+                    sink(stream, line.rstrip("\n"))
+                except Exception:
+                    pass
+    except (OSError, ValueError):
+        pass
+    finally:
+        pipe.close()
+        if tail.spill_file is not None:
+            tail.spill_file.close()
+
+
+def _open_spill(path: str):
+    try:
+        return open(path, "w", errors="replace")
+    except OSError as e:
+        print(f"[AI-AGENT] WARNING: Cannot write output to {path}: {e}")
+        return None
+
+
+def _watch_exit(proc: subprocess.Popen) -> threading.Event:
+    """
+    Event set once proc exits. On POSIX the process is left unreaped
+    (WNOWAIT) so its group can still be signalled safely and wait4() can
+    collect its resource usage afterwards.
+    """
+    exited = threading.Event()
+
+    def watch():
+        try:
+            if os.name == "posix":
+                os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOWAIT)
+            else:
+                proc.wait()
+        except (OSError, ValueError):
+            pass
+        exited.set()
+
+    threading.Thread(target=watch, name="run-wait", daemon=True).start()
+    return exited
+
+
+def _reap(proc: subprocess.Popen, exited: threading.Event):
+    """
+    Reaps the process; returns its rusage (None where unavailable).
+    Never blocks on a process that survived SIGKILL (uninterruptible I/O).
+    """
+    if os.name != "posix":
+        if exited.is_set():
+            proc.wait()
+        return None
+    try:
+        pid, status, usage = os.wait4(proc.pid, 0 if exited.is_set() else os.WNOHANG)
+    except ChildProcessError:
+        proc.poll()
+        return None
+    if pid == 0:
+        proc.returncode = -signal.SIGKILL
+        return None
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return usage
+
+
+def _record_command(cmd: str, exit_code: int, timed_out: bool, wall: float, usage) -> None:
+    sink = _COMMAND_SINK.get()
+    if sink is None:
+        return
+    try:
+        sink({
+            "command": cmd,
+            "exit_code": exit_code,
+            "timed_out": timed_out,
+            "wall_seconds": round(wall, 2),
+            "cpu_seconds": round(usage.ru_utime + usage.ru_stime, 2) if usage else None,
+            "max_rss_mb": round(usage.ru_maxrss / 1024, 1) if usage else None,   # ru_maxrss is KiB on Linux
+        })
+    except Exception:
+        pass
+
+
+def _stop_process(proc: subprocess.Popen, exited: threading.Event, grace: int) -> None:
+    """
+    Stops a timed-out command and its children. With grace > 0 the process
+    group is interrupted first so the tool can flush a partial report.
+    """
+    if grace > 0:
+        _signal_group(proc, signal.SIGINT)
+        if exited.wait(grace):
+            return
+    _signal_group(proc, signal.SIGKILL if os.name == "posix" else signal.SIGTERM)
+    exited.wait(5)
+
+
+def _signal_group(proc: subprocess.Popen, sig: int) -> None:
+    try:
+        if os.name == "posix":
+            os.killpg(proc.pid, sig)
+        else:
+            proc.send_signal(sig)
+    except (OSError, ValueError):
+        pass
+
+
+def _git_ls_files(repo_dir: str, include_untracked: bool) -> list[str] | None:
+    """
+    Runs `git ls-files -z` and parses the NUL-separated output in one pass.
+    Returns None if the directory is not a usable git checkout.
+    """
+    cmd = ["git", "ls-files", "-z", "--cached"]
+    if include_untracked:
+        cmd += ["--others", "--exclude-standard"]
+
+    try:
+        result = subprocess.run(cmd, cwd=repo_dir, capture_output=True, timeout=30)
+    except Exception as e:
+        print(f"[AI-AGENT] WARNING: git ls-files failed — {e}")
+        return None
+
+    if result.returncode != 0:
+        return None
+
+    # --cached can repeat paths with merge conflicts; keep first occurrence
+    seen: set[str] = set()
+    files: list[str] = []
+    for raw in result.stdout.split(b"\0"):
+        if not raw:
+            continue
+        path = raw.decode("utf-8", errors="surrogateescape")
+        if path not in seen:
+            seen.add(path)
+            files.append(path)
+    return files
+
+
+def _walk_repo_files(repo_dir: str) -> list[str]:
+    """Fallback enumeration — walks the tree, pruning EXCLUDED_DIRS."""
+    files: list[str] = []
+    for root, dirs, filenames in os.walk(repo_dir):
+        # Prune excluded dirs in-place (prevents os.walk from descending)
+        dirs[:] = [d for d in dirs if d not in EXCLUDED_DIRS]
+
+        rel_root = os.path.relpath(root, repo_dir)
+        for filename in filenames:
+            rel_path = filename if rel_root == "." else os.path.join(rel_root, filename)
+            files.append(rel_path.replace("\\", "/"))
+    return files
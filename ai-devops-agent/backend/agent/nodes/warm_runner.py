@@ -0,0 +1,164 @@
+import atexit
+import os
+import select
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+from threading import Lock
+from agent.config import WARM_RUNNER, WARM_RUNNER_START_TIMEOUT
+from agent.state import AgentState
+from agent.nodes.deadline import clamp_timeout
+from agent.nodes.dep_cache import env_python, python_env_vars
+from agent.nodes.repo_index import get_repo_index
+from agent.nodes.sandbox import sandbox_for
+
+
+# Runs under the repo's interpreter — see the script for the protocol
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pytest_worker.py")
+
+# Never preloaded even when they look third-party
+_NO_PRELOAD = {"__future__", "conftest"}
+
+# One worker per workspace, started on first use and stopped by finalize
+_WORKERS: dict[str, "_Worker"] = {}
+_UNAVAILABLE: set[str] = set()   # Workspaces whose worker failed to start — not retried
+_WORKERS_LOCK = Lock()
+
+
+def warm_test_cmd(state: AgentState, test_cmd: str | None) -> str | None:
+    """
+    With WARM_RUNNER on, rewrites `python -m pytest ...` / `pytest ...` to run
+    through the workspace's warm worker: interpreter, pytest, its plugins and
+    the repo's third-party imports are loaded once, and each run is a fork.
+    Returns test_cmd unchanged whenever the worker cannot be used.
+    """
+    if not WARM_RUNNER or os.name != "posix" or state.language != "python" or not test_cmd:
+        return test_cmd
+    args = _pytest_args(shlex.split(test_cmd))
+    if args is None:
+        return test_cmd
+    sandbox = sandbox_for(state.repo_path)
+    if sandbox is not None and sandbox.isolated:
+        return test_cmd   # The worker lives on the host; the tests run in the container
+    worker = _ensure_worker(state)
+    if worker is None:
+        return test_cmd
+    return shlex.join(["python", WORKER_SCRIPT, "run", worker.socket_path] + args)
+
+
+def preload_modules(repo_path: str) -> tuple[str, ...]:
+    """
+    Top-level third-party modules the repo imports — the set a worker
+    preloads (the stdlib is cheap and left out). Repo modules are never
+    preloaded, so fixes to them need no restart; only a change to this set does.
+    """
+    index = get_repo_index(repo_path)
+    names = {name.split(".", 1)[0] for imported in index.imports.values() for name in imported}
+    return tuple(sorted(
+        name for name in names
+        if name and name not in _NO_PRELOAD and name not in sys.stdlib_module_names
+        and not index.resolve(name)
+    ))
+
+
+def stop_warm_runner(repo_path: str | None) -> None:
+    with _WORKERS_LOCK:
+        worker = _WORKERS.pop(repo_path, None)
+        _UNAVAILABLE.discard(repo_path)
+    if worker is not None:
+        worker.stop()
+
+
+# ---------------------------------------------------------------------------
+# Internal helpers
+# ---------------------------------------------------------------------------
+
+class _Worker:
+    def __init__(self, proc: subprocess.Popen, socket_dir: str, python: str, modules: tuple[str, ...]):
+        self.proc = proc
+        self.socket_dir = socket_dir
+        self.socket_path = os.path.join(socket_dir, "worker.sock")
+        self.python = python
+        self.modules = modules
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def stop(self) -> None:
+        # Closing stdin tells the worker to kill its runs and exit
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.proc.kill()
+        shutil.rmtree(self.socket_dir, ignore_errors=True)
+
+
+def _ensure_worker(state: AgentState) -> _Worker | None:
+    repo_path = state.repo_path
+    python = env_python(state.python_env) if state.python_env else sys.executable
+    modules = preload_modules(repo_path)
+
+    with _WORKERS_LOCK:
+        if repo_path in _UNAVAILABLE:
+            return None
+        worker = _WORKERS.get(repo_path)
+        if worker is not None and worker.alive() and worker.python == python and worker.modules == modules:
+            return worker
+        if worker is not None:
+            print("[AI-AGENT] Warm test worker out of date — restarting")
+            worker.stop()
+            del _WORKERS[repo_path]
+
+        worker = _start_worker(repo_path, python, modules, python_env_vars(state.python_env))
+        if worker is None:
+            _UNAVAILABLE.add(repo_path)
+        else:
+            _WORKERS[repo_path] = worker
+        return worker
+
+
+def _start_worker(repo_path: str, python: str, modules: tuple[str, ...], env: dict | None) -> _Worker | None:
+    socket_dir = tempfile.mkdtemp(prefix="cicd_warm_")
+    print(f"[AI-AGENT] Starting warm test worker ({len(modules)} modules to preload)")
+    try:
+        proc = subprocess.Popen(
+            [python, WORKER_SCRIPT, "serve", os.path.join(socket_dir, "worker.sock"), repo_path, *modules],
+            cwd=repo_path,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            env={**os.environ, **(env or {})},
+            start_new_session=True,
+        )
+    except OSError as e:
+        print(f"[AI-AGENT] WARNING: Warm test worker unavailable — {e}")
+        shutil.rmtree(socket_dir, ignore_errors=True)
+        return None
+
+    worker = _Worker(proc, socket_dir, python, modules)
+    ready, _, _ = select.select([proc.stdout], [], [], clamp_timeout(WARM_RUNNER_START_TIMEOUT))
+    if not ready or proc.stdout.readline().strip() != "READY":
+        print("[AI-AGENT] WARNING: Warm test worker did not start — using plain pytest")
+        worker.stop()
+        return None
+    return worker
+
+
+def _pytest_args(tokens: list[str]) -> list[str] | None:
+    """Arguments after `python -m pytest` / `pytest`, or None for other commands."""
+    if len(tokens) >= 3 and os.path.basename(tokens[0]) in ("python", "python3") \
+            and tokens[1:3] == ["-m", "pytest"]:
+        return tokens[3:]
+    if tokens and os.path.basename(tokens[0]) == "pytest":
+        return tokens[1:]
+    return None
+
+
+@atexit.register
+def _stop_all() -> None:
+    for repo_path in list(_WORKERS):
+        stop_warm_runner(repo_path)
@@ -0,0 +1,377 @@
+import hashlib
+import json
+import os
+import re
+import shlex
+import sys
+import tempfile
+import time
+import tomllib
+from urllib.parse import unquote, urlparse
+from agent.config import DEP_CACHE_DIR, INSTALL_TIMEOUT, WHEELHOUSE_MAX_MB, WHEELHOUSE_RESOLUTION_TTL
+from agent.nodes.utils import run
+
+
+WHEELHOUSE_DIR = os.path.join(DEP_CACHE_DIR, "wheelhouse")
+_STATS_FILE = "stats.json"
+
+# name[extras] == version — a requirement only one release can satisfy
+_PINNED_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*(\[[^\]]*\])?\s*===?\s*[^\s,*]+$")
+
+# Requirement-file lines that name the project or a local tree, not a dependency
+_LOCAL_PREFIXES = (".", "/", "~", "file:")
+
+# Set when WHEELHOUSE_DIR cannot be created — installs then go straight to pip
+_disabled = False
+
+
+# ---------------------------------------------------------------------------
+# Install through the shared wheelhouse
+# ---------------------------------------------------------------------------
+
+def pip_install(python: str, args: str, cwd: str, timeout: int = INSTALL_TIMEOUT) -> bool:
+    """
+    Installs `args` (e.g. "-r requirements.txt", "-e .", "flake8 pytest")
+    with `python -m pip`, resolving from the local wheelhouse first.
+
+    1. Offline attempt: --no-index --find-links WHEELHOUSE_DIR — only when
+       every requirement is pinned, or the same set was resolved online in
+       the last WHEELHOUSE_RESOLUTION_TTL seconds; otherwise a stale wheel
+       would satisfy a range that the index has newer releases for
+    2. Otherwise: `pip wheel` the dependencies into the wheelhouse against
+       the index (downloads and sdist builds happen once, here), then retry
+       offline
+    3. Last resort: normal online install with the wheelhouse as extra links
+
+    Returns True if the install succeeded by any route.
+    """
+    global _disabled
+    pip = f"{shlex.quote(python)} -m pip"
+    if not _disabled:
+        try:
+            os.makedirs(WHEELHOUSE_DIR, exist_ok=True)
+        except OSError as e:
+            print(f"[AI-AGENT] WARNING: Cannot create wheelhouse {WHEELHOUSE_DIR}: {e} — installing without it")
+            _disabled = True
+    if _disabled:
+        code, _, _ = run(f"{pip} install -q {args}", cwd=cwd, timeout=timeout, safe=False)
+        return code == 0
+
+    links = f"--find-links {shlex.quote(WHEELHOUSE_DIR)}"
+    with tempfile.TemporaryDirectory(prefix="cicd_wheel_") as scratch:
+        # pip's report lists the wheels each install used — the LRU clock for pruning
+        report = os.path.join(scratch, "report.json")
+        install = f"{pip} install -q --report {shlex.quote(report)}"
+        wheel_args = _wheel_targets(args, cwd, scratch)
+        requirements = _requirement_lines(wheel_args)
+        resolution = _resolution_key(requirements)
+
+        if _offline_ok(requirements, resolution):
+            code, _, _ = run(f"{install} --no-index {links} {args}", cwd=cwd, timeout=timeout, safe=False)
+            if code == 0:
+                print(f"[AI-AGENT] Wheelhouse HIT — installed offline: {args}")
+                _record(hit=True, used=_reported_wheels(report))
+                return True
+            print(f"[AI-AGENT] Wheelhouse MISS — populating for: {args}")
+        else:
+            print(f"[AI-AGENT] Wheelhouse: unpinned requirements — resolving against the index: {args}")
+
+        before = _wheel_names()
+        if wheel_args:
+            run(f"{pip} wheel -q {links} -w {shlex.quote(WHEELHOUSE_DIR)} {wheel_args}",
+                cwd=cwd, timeout=timeout, safe=False)
+        added = _wheel_names() - before
+
+        code, _, _ = run(f"{install} --no-index {links} {args}", cwd=cwd, timeout=timeout, safe=False)
+        if code != 0:
+            code, _, _ = run(f"{install} {links} {args}", cwd=cwd, timeout=timeout, safe=False)
+        _record(hit=False, used=_reported_wheels(report) | added, added=len(added),
+                resolved=resolution if code == 0 else None)
+
+    prune_wheelhouse(WHEELHOUSE_MAX_MB * 1024 * 1024)
+    return code == 0
+
+
+def _wheel_targets(args: str, cwd: str, scratch: str) -> str:
+    """
+    Translates install args into `pip wheel` args for the dependencies
+    only. The project itself (`.`, `-e`, local paths) is never wheeled: its
+    wheel in the shared wheelhouse could satisfy another repo's requirement
+    of the same name. A local pyproject contributes its declared
+    dependencies and build requirements instead; requirement files are
+    rewritten into scratch without their local entries.
+    """
+    tokens = shlex.split(args)
+    targets: list[str] = []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token in ("-e", "--editable") and i + 1 < len(tokens):
+            if _is_local(tokens[i + 1], cwd):
+                targets += _project_requirements(os.path.join(cwd, tokens[i + 1]))
+            i += 2
+            continue
+        if token in ("-r", "--requirement") and i + 1 < len(tokens):
+            targets += ["-r", _dependency_file(os.path.join(cwd, tokens[i + 1]), scratch)]
+            i += 2
+            continue
+        if _is_local(token, cwd):
+            targets += _project_requirements(os.path.join(cwd, token))
+        else:
+            targets.append(token)
+        i += 1
+    return " ".join(shlex.quote(t) for t in targets)
+
+
+def _project_requirements(target: str) -> list[str]:
+    """
+    Build requirements and dependencies (plus those of any `[extras]`
+    named) of a local pyproject — [] without one.
+    """
+    project_dir, _, extras = target.partition("[")
+    pyproject = os.path.join(project_dir, "pyproject.toml")
+    if not os.path.exists(pyproject):
+        return []
+    try:
+        with open(pyproject, "rb") as f:
+            data = tomllib.load(f)
+    except (OSError, tomllib.TOMLDecodeError) as e:
+        print(f"[AI-AGENT] WARNING: Could not read dependencies from pyproject.toml: {e}")
+        return []
+    project = data.get("project", {})
+    requires = data.get("build-system", {}).get("requires", []) + project.get("dependencies", [])
+    for extra in extras.rstrip("]").split(","):
+        requires += project.get("optional-dependencies", {}).get(extra.strip(), [])
+    return [str(r) for r in requires]
+
+
+def _dependency_file(path: str, scratch: str) -> str:
+    """
+    Copy of a requirements file without editable and local-path entries;
+    nested -r/-c files are rewritten the same way. Returns the copy's path.
+    """
+    base = os.path.dirname(path)
+    try:
+        with open(path, "r") as f:
+            text = f.read().replace("\\\n", "")
+    except OSError:
+        return path   # pip reports the missing file itself
+
+    kept = []
+    for line in text.splitlines():
+        stripped = line.split(" #", 1)[0].strip()
+        if not stripped or stripped.startswith("#"):
+            continue
+        option, _, value = stripped.partition(" ")
+        if option in ("-r", "--requirement", "-c", "--constraint"):
+            kept.append(f"{option} {_dependency_file(os.path.join(base, value.strip()), scratch)}")
+        elif option in ("-e", "--editable") or option.startswith("--editable="):
+            continue
+        elif _is_local(stripped, base) or " @ file:" in stripped:
+            continue
+        else:
+            kept.append(stripped)
+
+    fd, filtered = tempfile.mkstemp(dir=scratch, suffix=".txt")
+    with os.fdopen(fd, "w") as f:
+        f.write("\n".join(kept) + "\n")
+    return filtered
+
+
+def _requirement_lines(wheel_args: str) -> list[str] | None:
+    """
+    Every requirement in _wheel_targets' output, -r files expanded, sorted.
+    None if a requirements file cannot be read.
+    """
+    lines: list[str] = []
+    tokens = shlex.split(wheel_args)
+    i = 0
+    while i < len(tokens):
+        if tokens[i] in ("-r", "--requirement") and i + 1 < len(tokens):
+            if not _read_requirements(tokens[i + 1], lines):
+                return None
+            i += 2
+            continue
+        if not tokens[i].startswith("-"):
+            lines.append(tokens[i])
+        i += 1
+    return sorted(lines)
+
+
+def _read_requirements(path: str, lines: list[str]) -> bool:
+    try:
+        with open(path, "r") as f:
+            text = f.read()
+    except OSError:
+        return False
+    for line in text.splitlines():
+        line = line.split(" --", 1)[0].strip()   # Per-requirement options (--hash)
+        option, _, value = line.partition(" ")
+        if option in ("-r", "--requirement"):
+            if not _read_requirements(value.strip(), lines):
+                return False
+        elif line and not line.startswith("-"):
+            lines.append(line)
+    return True
+
+
+def _resolution_key(requirements: list[str] | None) -> str | None:
+    """Identity of a requirement set for this interpreter — what an online resolution is recorded under."""
+    if requirements is None:
+        return None
+    return hashlib.sha256("\n".join([sys.version, *requirements]).encode()).hexdigest()[:24]
+
+
+def _offline_ok(requirements: list[str] | None, resolution: str | None) -> bool:
+    """Whether the wheelhouse alone may satisfy the requirements (see pip_install)."""
+    if requirements is None:
+        return False
+    if all(_is_pinned(r) for r in requirements):
+        return True
+    resolved_at = _load_stats().get("resolutions", {}).get(resolution)
+    return resolved_at is not None and time.time() - resolved_at < WHEELHOUSE_RESOLUTION_TTL
+
+
+def _is_pinned(requirement: str) -> bool:
+    requirement = requirement.split(";", 1)[0].strip()   # Environment markers
+    if " @ " in requirement:
+        return True   # Direct URL
+    return bool(_PINNED_RE.match(requirement))
+
+
+def _reported_wheels(report: str) -> set[str]:
+    """Wheelhouse files a `pip install --report` run installed from."""
+    try:
+        with open(report) as f:
+            items = json.load(f).get("install", [])
+    except (OSError, ValueError):
+        return set()
+    wheelhouse = os.path.realpath(WHEELHOUSE_DIR)
+    used = set()
+    for item in items:
+        url = (item.get("download_info") or {}).get("url", "")
+        if url.startswith("file:"):
+            path = unquote(urlparse(url).path)
+            if os.path.dirname(os.path.realpath(path)) == wheelhouse:
+                used.add(os.path.basename(path))
+    return used
+
+
+def _is_local(requirement: str, base: str) -> bool:
+    """A path to a project or archive rather than a requirement on an index."""
+    if requirement.startswith(_LOCAL_PREFIXES):
+        return True
+    return "/" in requirement and "://" not in requirement and os.path.exists(os.path.join(base, requirement))
+
+
+# ---------------------------------------------------------------------------
+# Stats / pruning
+# ---------------------------------------------------------------------------
+
+def wheelhouse_stats() -> dict:
+    """Hit rate and size of the shared wheelhouse."""
+    stats = _load_stats()
+    wheels = _wheel_paths()
+    installs = stats.get("installs", 0)
+    return {
+        "installs": installs,
+        "offline_hits": stats.get("offline_hits", 0),
+        "hit_rate": round(stats.get("offline_hits", 0) / installs, 3) if installs else 0.0,
+        "wheels_added": stats.get("wheels_added", 0),
+        "wheel_count": len(wheels),
+        "size_bytes": sum(_safe_size(p) for p in wheels),
+    }
+
+
+def prune_wheelhouse(max_bytes: int) -> int:
+    """
+    Removes least-recently-used wheels until the wheelhouse fits in
+    max_bytes. Last use is what installs recorded in stats.json (atime is
+    unreliable on noatime/relatime mounts); a wheel with none falls back to
+    its mtime. Returns the number of wheels removed.
+    """
+    stats = _load_stats()
+    last_used = stats.get("last_used", {})
+    entries = []
+    for path in _wheel_paths():
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((last_used.get(os.path.basename(path), st.st_mtime), st.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            removed += 1
+            last_used.pop(os.path.basename(path), None)
+        except OSError:
+            pass
+
+    if removed:
+        print(f"[AI-AGENT] Pruned {removed} wheels from wheelhouse")
+        _save_stats(stats)
+    return removed
+
+
+def _record(hit: bool, used: set[str], added: int = 0, resolved: str | None = None) -> None:
+    """Counts an install, stamps the wheels it used and, if it resolved online, its requirement set."""
+    now = time.time()
+    stats = _load_stats()
+    stats["installs"] = stats.get("installs", 0) + 1
+    stats["offline_hits"] = stats.get("offline_hits", 0) + (1 if hit else 0)
+    stats["wheels_added"] = stats.get("wheels_added", 0) + added
+    stats.setdefault("last_used", {}).update(dict.fromkeys(used, now))
+    resolutions = {
+        key: at for key, at in stats.get("resolutions", {}).items() if now - at < WHEELHOUSE_RESOLUTION_TTL
+    }
+    if resolved:
+        resolutions[resolved] = now
+    stats["resolutions"] = resolutions
+    _save_stats(stats)
+
+
+def _save_stats(stats: dict) -> None:
+    # Atomic replace — concurrent runs may lose an update, never corrupt the file
+    try:
+        fd, tmp = tempfile.mkstemp(dir=WHEELHOUSE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(stats, f)
+        os.replace(tmp, os.path.join(WHEELHOUSE_DIR, _STATS_FILE))
+    except OSError as e:
+        print(f"[AI-AGENT] WARNING: Could not update wheelhouse stats: {e}")
+
+
+def _load_stats() -> dict:
+    try:
+        with open(os.path.join(WHEELHOUSE_DIR, _STATS_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _wheel_paths() -> list[str]:
+    try:
+        return [
+            os.path.join(WHEELHOUSE_DIR, name)
+            for name in os.listdir(WHEELHOUSE_DIR)
+            if name.endswith(".whl")
+        ]
+    except OSError:
+        return []
+
+
+def _wheel_names() -> set[str]:
+    return {os.path.basename(p) for p in _wheel_paths()}
+
+
+def _safe_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
@@ -0,0 +1,40 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+
+
+# One process pool for CPU-bound in-process work (lint checks, AST scans),
+# started on first use and shared by every run in the server
+_POOL: ProcessPoolExecutor | None = None
+_POOL_LOCK = Lock()
+
+# Processes in the pool
+POOL_WORKERS = min(os.cpu_count() or 1, 4)
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            # Never fork: callers run on threads alongside test runs
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _POOL = ProcessPoolExecutor(
+                max_workers=POOL_WORKERS,
+                mp_context=multiprocessing.get_context(method),
+            )
+        return _POOL
+
+
+def shutdown_pool() -> None:
+    global _POOL
+    with _POOL_LOCK:
+        pool, _POOL = _POOL, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def split_batches(items: list, workers: int) -> list[list]:
+    """Splits items into about four batches per worker."""
+    chunk = max(1, len(items) // (workers * 4))
+    return [items[i:i + chunk] for i in range(0, len(items), chunk)]
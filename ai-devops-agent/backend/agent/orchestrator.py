@@ -1,5 +1,5 @@
 from langgraph.graph import StateGraph, END
-from agent.state import AgentState
+from agent.state import AgentState, CommandRun
 from agent.nodes.repo_analyzer import repo_analyzer
 from agent.nodes.language_detector import language_detector
 from agent.nodes.test_runner import test_runner
@@ -10,6 +10,11 @@ from agent.nodes.git_commit import git_commit
 from agent.nodes.create_pull_request import create_pull_request
 from agent.nodes.ci_monitor import ci_monitor
 from agent.nodes.finalize import finalize
+from agent.nodes.utils import (
+    set_line_sink, reset_line_sink, set_command_sink, reset_command_sink, set_sandbox, reset_sandbox,
+)
+from agent.nodes.sandbox import sandbox_for
+from agent.nodes.deadline import Deadline, set_deadline, reset_deadline
 from typing import Callable, Any
 
 
@@ -37,6 +42,12 @@ def route_after_initial_test(state: AgentState) -> str:
     return "classify"
 
 
+def route_after_classify(state: AgentState) -> str:
+    if state.final_status == "FAILED":   # Converged without passing — see convergence.py
+        return "final"
+    return "fix"
+
+
 # ---------------------------------------------------------------------------
 # Graph builder
 # ---------------------------------------------------------------------------
@@ -62,7 +73,27 @@ def _wrap_node(node_name: str, node_fn, observer: Callable[[dict[str, Any]], Non
             },
         )
 
-        next_state = node_fn(state)
+        # Every line a subprocess prints during this node is forwarded live
+        def forward_line(stream: str, line: str) -> None:
+            _emit(observer, {"event": "output_line", "node": node_name, "stream": stream, "line": line})
+        token = set_line_sink(forward_line if observer is not None else None)
+
+        # Exit status and resource usage of every command, kept on the state
+        def record_command(record: dict) -> None:
+            state.commands_run.append(CommandRun(**record))
+            _emit(observer, {"event": "command_end", "node": node_name, **record})
+        command_token = set_command_sink(record_command)
+        # Every subprocess/HTTP timeout in this node is clamped to the run budget
+        deadline_token = set_deadline(Deadline(state.deadline_at))
+        # Repo commands execute in the run's sandbox session (none before the clone)
+        sandbox_token = set_sandbox(sandbox_for(state.repo_path))
+        try:
+            next_state = node_fn(state)
+        finally:
+            reset_sandbox(sandbox_token)
+            reset_deadline(deadline_token)
+            reset_command_sink(command_token)
+            reset_line_sink(token)
 
         _emit(
             observer,
@@ -81,6 +112,7 @@ def _wrap_node(node_name: str, node_fn, observer: Callable[[dict[str, Any]], Non
                 "latest_fix": next_state.fixes[-1].model_dump() if next_state.fixes else None,
                 "latest_commit": next_state.commits[-1] if next_state.commits else None,
                 "pr_url": next_state.pr_url,
+                "stop_reason": next_state.stop_reason,
                 "raw_test_output_tail": (next_state.raw_test_output or "")[-1200:],
             },
         )
@@ -125,7 +157,12 @@ def build_graph(observer: Callable[[dict[str, Any]], None] | None = None) -> Sta
     )
 
     # Fix pipeline: classify → fix → patch → commit → create_pr → ci
-    g.add_edge("classify",  "fix")
+    # (classify → final when the loop stopped making progress)
+    g.add_conditional_edges(
+        "classify",
+        route_after_classify,
+        {"final": "final", "fix": "fix"},
+    )
     g.add_edge("fix",       "patch")
     g.add_edge("patch",     "commit")
     g.add_edge("commit",    "create_pr")   # ← commit goes to PR first
@@ -156,6 +193,8 @@ def run_agent(
     max_iterations: int = 5,
     read_only: bool = False,
     observer: Callable[[dict[str, Any]], None] | None = None,
+    test_shards: int | None = None,
+    fail_fast: bool | None = None,
 ) -> AgentState:
 
     initial_state = AgentState(
@@ -165,6 +204,8 @@ def run_agent(
         github_token=github_token,
         read_only=read_only,
         max_iterations=max_iterations,
+        test_shards=test_shards,
+        fail_fast=fail_fast,
     )
 
     graph = build_graph(observer=observer)
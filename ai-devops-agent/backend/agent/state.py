@@ -1,8 +1,9 @@
-from typing import List, Optional, Literal, Any
+from typing import Dict, List, Optional, Literal, Any, Tuple
 from pydantic import BaseModel, Field, model_validator
 from datetime import datetime, timezone
-from agent.config import DEFAULT_MAX_ITERATIONS, BRANCH_SUFFIX
+from agent.config import DEFAULT_MAX_ITERATIONS, BRANCH_SUFFIX, RUN_TIMEOUT
 import re
+import time
 
 
 # ---------------------------------------------------------------------------
@@ -14,6 +15,7 @@ class Failure(BaseModel):
     line: int
     bug_type: Literal["LINTING", "SYNTAX", "LOGIC", "TYPE_ERROR", "IMPORT", "INDENTATION"]
     description: str
+    fingerprint: Optional[str] = None   # Stable across iterations (convergence.py)
 
     # In state.py — Failure model
     def to_agent_output(self) -> str:
@@ -51,6 +53,48 @@ class CIRun(BaseModel):
     timestamp: str
 
 
+class TestMemo(BaseModel):
+    tree: str                           # Workspace content hash the tests ran against
+    passed: bool
+    full_suite: bool                    # Whole suite ran — only then does a pass cover every test
+    output_path: Optional[str] = None   # Complete (collect-all) output; None = verdict only
+
+
+class CommandRun(BaseModel):
+    command: str
+    exit_code: Optional[int] = None
+    timed_out: bool = False
+    wall_seconds: float = 0.0
+    cpu_seconds: Optional[float] = None     # User + system time of the command and its children
+    max_rss_mb: Optional[float] = None      # Peak resident memory of the largest process
+
+
+class IterationProgress(BaseModel):
+    iteration: int
+    state_key: str              # Workspace tree + failure set — equal keys mean a repeated state
+    fingerprints: List[str]
+    failures: int
+    new: int                    # Not present in the previous iteration
+    resolved: int               # Present in the previous iteration, gone now
+
+
+class AssertMismatch(BaseModel):
+    function: str           # Called in the failing assert: assert function(args) == expected
+    args: str
+    expected: str
+    actual: str             # Value pytest reported on the E line
+
+
+class ParsedOutput(BaseModel):
+    """Everything the parsers extract from one lint + test output (output_parser.py)."""
+    source: str                                           # Output it was parsed from
+    lint_issues: List[Tuple[str, int, str, str]] = Field(default_factory=list)        # (file, line, code, description)
+    traceback_issues: List[Tuple[str, int, str, str]] = Field(default_factory=list)
+    mypy_issues: List[Tuple[str, int, str, str]] = Field(default_factory=list)
+    assert_mismatches: List[AssertMismatch] = Field(default_factory=list)
+    failed_tests: List[str] = Field(default_factory=list)                               # pytest node IDs
+
+
 class ScoreBreakdown(BaseModel):
     base_score: int = 100
     speed_bonus: int = 0         # +10 if total_time < 5 minutes (PS rule)
@@ -89,6 +133,8 @@ class AgentState(BaseModel):
     language: Optional[str] = None
     test_cmd: Optional[str] = None
     lint_cmd: Optional[str] = None
+    test_shards: Optional[int] = None   # Parallel pytest shards; None → TEST_SHARDS config
+    fail_fast: Optional[bool] = None    # Stop tests at first failure; None → TEST_FAIL_FAST config
 
     # --- Branch (auto-generated via validator) ---
     branch_name: Optional[str] = None
@@ -99,21 +145,33 @@ class AgentState(BaseModel):
 
     # --- Test state ---
     test_passed: bool = False
-    raw_test_output: Optional[str] = None
+    raw_test_output: Optional[str] = None       # Tail only — full output lives at raw_test_output_path
+    raw_test_output_path: Optional[str] = None  # Spilled lint+test log (reports.output_lines reads it)
+    parsed_output: Optional[ParsedOutput] = None  # That log, parsed once (output_parser.parsed_output)
     push_attempted: bool = False
     deps_installed: bool = False        # ← ADDED: prevents reinstalling on every iteration
+    python_env: Optional[str] = None    # Per-run virtualenv (dep_cache); None → server interpreter
     lint_checked_once: bool = False
+    lint_results: Optional[Dict[str, List[str]]] = None   # Per-file lint lines (lint_cache)
+    lint_config_hash: Optional[str] = None
+    artifacts_dir: Optional[str] = None  # Per-run tool reports (flake8/pytest/eslint) — see reports.py
+    test_memo: Optional[TestMemo] = None  # Last test result, reused while the tree is unchanged (test_memo.py)
 
     # --- Core agent outputs ---
     failures: List[Failure] = Field(default_factory=list)
+    progress: List[IterationProgress] = Field(default_factory=list)   # One entry per classified iteration
+    stop_reason: Optional[str] = None   # Why the fix loop ended early (convergence.py)
     fixes: List[Fix] = Field(default_factory=list)
+    fix_knowledge: Dict[str, int] = Field(default_factory=dict)   # Fingerprint → stored fix awaiting a verdict
     commits: List[str] = Field(default_factory=list)
     ci_runs: List[CIRun] = Field(default_factory=list)
     pr_url: str = ""
+    commands_run: List[CommandRun] = Field(default_factory=list)   # Exit status + resource usage per command
 
     # --- Timing ---
     start_time: Optional[str] = None
     end_time: Optional[str] = None
+    deadline_at: Optional[float] = None   # Epoch seconds the run must finish by (RUN_TIMEOUT)
     total_time_seconds: Optional[float] = None
 
     # --- Scoring ---
@@ -149,6 +207,8 @@ class AgentState(BaseModel):
     def record_start(self) -> None:
         """Call at the very start of the pipeline (repo_analyzer node)."""
         self.start_time = _utcnow_iso()
+        if self.deadline_at is None:
+            self.deadline_at = time.time() + RUN_TIMEOUT
 
     def record_end(self) -> None:
         """Call at finalize node. Computes total_time_seconds."""
@@ -1,5 +1,6 @@
 from datetime import datetime, timezone
 from threading import Lock, Thread
+import time
 from uuid import uuid4
 import re
 import subprocess
@@ -37,6 +38,8 @@ class RunAgentRequest(BaseModel):
     authorize_write: bool = False
     github_token: str | None = None
     max_iterations: int = DEFAULT_MAX_ITERATIONS
+    test_shards: int | None = None
+    fail_fast: bool | None = None
 
     @model_validator(mode="after")
     def normalize_payload(self):
@@ -106,6 +109,10 @@ NODE_STEP_MAP = {
     "final": "Done",
 }
 
+# Live subprocess output is copied into the run log at most this many lines
+# per second; the rest is counted and summarized
+LIVE_OUTPUT_LINES_PER_SEC = 20
+
 GITHUB_REPO_URL_RE = re.compile(r"^https://github\.com/[^/\s]+/[^/\s]+/?$")
 GITHUB_OWNER_REPO_RE = re.compile(r"^https://github\.com/([^/\s]+)/([^/\s]+?)(?:\.git)?/?$")
 
@@ -130,6 +137,35 @@ def _append_log(run_id: str, level: str, text: str) -> None:
         run["logs"].append({"ts": _now_iso(), "level": level, "text": text})
 
 
+class _LineRateLimiter:
+    """Fixed one-second window; observer callbacks arrive from several threads."""
+
+    def __init__(self, per_second: int):
+        self.per_second = per_second
+        self.window_start = 0.0
+        self.count = 0
+        self.suppressed = 0
+        self.lock = Lock()
+
+    def admit(self) -> tuple[bool, int]:
+        """Returns (allowed, lines suppressed since the last report)."""
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= 1.0:
+                self.window_start, self.count = now, 0
+            if self.count >= self.per_second:
+                self.suppressed += 1
+                return False, 0
+            self.count += 1
+            suppressed, self.suppressed = self.suppressed, 0
+            return True, suppressed
+
+    def flush(self) -> int:
+        with self.lock:
+            suppressed, self.suppressed = self.suppressed, 0
+            return suppressed
+
+
 def _append_log_chunk(run_id: str, level: str, lines: list[str], limit: int = 6) -> None:
     clean_lines = [line.strip() for line in lines if line and line.strip()]
     for line in clean_lines[:limit]:
@@ -364,6 +400,8 @@ def _validate_repo_url_or_raise(repo_url: str) -> None:
 
 def _run_agent_worker(run_id: str, request: RunAgentRequest) -> None:
     try:
+        line_limiter = _LineRateLimiter(LIVE_OUTPUT_LINES_PER_SEC)
+
         def on_node_event(payload: dict) -> None:
             event = payload.get("event")
             node = payload.get("node", "")
@@ -372,12 +410,35 @@ def _run_agent_worker(run_id: str, request: RunAgentRequest) -> None:
             if not step_name:
                 return
 
+            if event == "output_line":
+                line = str(payload.get("line") or "").rstrip()
+                if not line:
+                    return
+                allowed, suppressed = line_limiter.admit()
+                if suppressed:
+                    _append_log(run_id, "info", f"[{node}] ... {suppressed} output lines not shown")
+                if allowed:
+                    _append_log(run_id, "info", f"[{node}] {line[:280]}")
+                return
+
+            if event == "command_end":
+                if payload.get("timed_out") or payload.get("exit_code"):
+                    usage = f"{payload.get('wall_seconds')}s wall"
+                    if payload.get("cpu_seconds") is not None:
+                        usage += f", {payload['cpu_seconds']}s cpu, {payload.get('max_rss_mb')} MB peak"
+                    outcome = "timed out" if payload.get("timed_out") else f"exit {payload.get('exit_code')}"
+                    _append_log(run_id, "info", f"[{node}] command {outcome} ({usage})")
+                return
+
             if event == "node_start":
                 _set_step(step_name=step_name, run_id=run_id, status="running", detail=f"{node} started (iteration {iteration})")
                 _append_log(run_id, "info", f"[{node}] started (iteration {iteration})")
                 return
 
             if event == "node_end":
+                suppressed = line_limiter.flush()
+                if suppressed:
+                    _append_log(run_id, "info", f"[{node}] ... {suppressed} output lines not shown")
                 final_status = str(payload.get("final_status", "RUNNING")).upper()
                 read_only = bool(payload.get("read_only", False))
                 push_attempted = bool(payload.get("push_attempted", False))
@@ -391,7 +452,7 @@ def _run_agent_worker(run_id: str, request: RunAgentRequest) -> None:
                 status = "success"
                 if node == "test" and not payload.get("test_passed", False):
                     status = "failed"
-                elif node == "ci" and final_status == "FAILED":
+                elif node in ("classify", "ci") and final_status == "FAILED":
                     status = "failed"
                 elif node == "final" and final_status == "FAILED":
                     status = "failed"
@@ -428,6 +489,8 @@ def _run_agent_worker(run_id: str, request: RunAgentRequest) -> None:
                     detail_parts.append("read-only mode: skipped")
                 if node == "create_pr" and pr_url:
                     detail_parts.append("pr_created=true")
+                if node == "classify" and payload.get("stop_reason"):
+                    detail_parts.append(f"stopped early: {payload.get('stop_reason')}")
                 detail = " | ".join(detail_parts)
 
                 _set_step(step_name=step_name, run_id=run_id, status=status, detail=detail)
@@ -480,6 +543,8 @@ def _run_agent_worker(run_id: str, request: RunAgentRequest) -> None:
             max_iterations=request.max_iterations,
             read_only=_is_read_only_mode(request.mode),
             observer=on_node_event,
+            test_shards=request.test_shards,
+            fail_fast=request.fail_fast,
         )
 
         failures = state.total_failures
@@ -593,6 +658,8 @@ async def run_agent_sync_endpoint(request: RunAgentRequest):
             github_token=github_token or None,
             max_iterations=request.max_iterations,
             read_only=_is_read_only_mode(request.mode),
+            test_shards=request.test_shards,
+            fail_fast=request.fail_fast,
         )
 
         return {